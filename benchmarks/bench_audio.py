@@ -0,0 +1,103 @@
+"""Payload and latency benchmark for the Visionary audio stage.
+
+Builds synthetic voice queries (speech-like harmonic bursts padded with room
+noise, 48 kHz stereo, the way MediaRecorder hands them over) and runs them
+through prepare_audio. For each clip it reports the bytes and seconds of audio
+sent to Gemini before and after, the preprocessing time, and the upload time
+saved at the given uplink speed. Gemini bills audio at about 32 tokens per second.
+
+    python -m benchmarks.bench_audio --uplink-mbps 2
+    python -m benchmarks.bench_audio --clips path/to/recording.webm ...
+"""
+import argparse
+import base64
+import io
+import mimetypes
+import time
+import wave
+
+import numpy as np
+
+from visionary.audio import OUTPUT_FORMAT, prepare_audio
+
+SOURCE_RATE = 48000
+AUDIO_TOKENS_PER_SECOND = 32
+
+
+def noise(seconds, level_dbfs, rng):
+    return rng.normal(0, 10 ** (level_dbfs / 20), int(seconds * SOURCE_RATE))
+
+
+def speech_like(seconds, rng):
+    # Voiced harmonics with a ~4 Hz syllable envelope, roughly the spectrum and rhythm of speech
+    t = np.arange(int(seconds * SOURCE_RATE)) / SOURCE_RATE
+    pitch = 140 + 20 * np.sin(2 * np.pi * 0.7 * t)
+    phase = 2 * np.pi * np.cumsum(pitch) / SOURCE_RATE
+    voiced = sum(np.sin(k * phase) / k for k in range(1, 8))
+    envelope = np.clip(np.sin(2 * np.pi * 4 * t + rng.uniform(0, np.pi)), 0, None) ** 0.5
+    return 0.25 * voiced * envelope + noise(seconds, -65, rng)
+
+
+def to_wav(samples):
+    stereo = np.repeat(np.clip(samples, -1, 1)[:, None], 2, axis=1)
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav:
+        wav.setnchannels(2)
+        wav.setsampwidth(2)
+        wav.setframerate(SOURCE_RATE)
+        wav.writeframes((stereo * 32767).astype("<i2").tobytes())
+    return buffer.getvalue()
+
+
+def build_clips(seed=3):
+    rng = np.random.default_rng(seed)
+    return {
+        "short question": to_wav(np.concatenate([noise(1.5, -65, rng), speech_like(2.0, rng), noise(1.5, -65, rng)])),
+        "long question": to_wav(np.concatenate([noise(1.0, -65, rng), speech_like(6.0, rng), noise(2.0, -65, rng)])),
+        "empty (room noise)": to_wav(noise(3.0, -60, rng)),
+        "accidental tap": to_wav(np.concatenate([noise(0.1, -65, rng), speech_like(0.1, rng), noise(0.8, -65, rng)])),
+    }
+
+
+def duration_seconds(data, mime_type):
+    if "wav" not in mime_type:
+        return None
+    with wave.open(io.BytesIO(data)) as wav:
+        return wav.getnframes() / wav.getframerate()
+
+
+def main(args):
+    clips = {name: (data, "audio/wav") for name, data in build_clips().items()}
+    for path in args.clips:
+        with open(path, "rb") as f:
+            clips[path] = (f.read(), mimetypes.guess_type(path)[0] or "audio/webm")
+
+    bytes_per_ms = args.uplink_mbps * 1e6 / 8 / 1000
+    print(f"output format {OUTPUT_FORMAT}, uplink {args.uplink_mbps} Mbps")
+    print(
+        f"{'clip':<22} {'in KB':>8} {'out KB':>8} {'in s':>6} {'out s':>6} "
+        f"{'tokens saved':>12} {'prep ms':>8} {'upload ms saved':>16}"
+    )
+    for name, (data, mime_type) in clips.items():
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            out, out_type, speech_ms = prepare_audio(data, mime_type)
+        prep_ms = (time.perf_counter() - start) * 1000 / args.repeat
+
+        in_b64, out_b64 = len(base64.b64encode(data)), len(base64.b64encode(out))
+        in_s, out_s = duration_seconds(data, mime_type), duration_seconds(out, out_type) if out else 0.0
+        tokens_saved = (in_s - out_s) * AUDIO_TOKENS_PER_SECOND if in_s is not None and out_s is not None else float("nan")
+        label = "rejected" if speech_ms == 0 else f"{(in_b64 - out_b64) / bytes_per_ms:.0f}"
+        print(
+            f"{name:<22} {len(data) / 1024:>8.1f} {len(out) / 1024:>8.1f} "
+            f"{in_s if in_s is not None else float('nan'):>6.2f} {out_s if out_s is not None else float('nan'):>6.2f} "
+            f"{tokens_saved:>12.0f} {prep_ms:>8.1f} {label:>16}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clips", nargs="*", default=[], help="extra recordings to include")
+    parser.add_argument("--uplink-mbps", type=float, default=2.0)
+    parser.add_argument("--repeat", type=int, default=5)
+    main(parser.parse_args())
@@ -0,0 +1,119 @@
+"""Load benchmark for the async execution layer.
+
+Serves a small FastAPI app under uvicorn with a stubbed Gemini backend
+(time.sleep) and compares calling it directly on the event loop against
+run_blocking().
+While the load runs, a separate client keeps hitting a cheap route to show
+how much the slow backend stalls unrelated requests.
+
+    python -m benchmarks.bench_backends --clients 1 4 16 64 --latency 0.2
+"""
+import argparse
+import asyncio
+import os
+import threading
+import time
+
+import httpx
+import uvicorn
+from fastapi import FastAPI
+
+from common.backends import run_blocking
+
+
+def percentile(samples, pct):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    k = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[k]
+
+
+def build_app(latency):
+    app = FastAPI()
+
+    def stub_generate_content(prompt):
+        time.sleep(latency)
+        return f"stub answer for {prompt}"
+
+    @app.get("/direct")
+    async def direct():
+        return {"response": stub_generate_content("direct")}
+
+    @app.get("/offloaded")
+    async def offloaded():
+        return {"response": await run_blocking("gemini", stub_generate_content, "offloaded")}
+
+    @app.get("/ping")
+    async def ping():
+        return {"ok": True}
+
+    return app
+
+
+def start_server(app, port):
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+    return server
+
+
+async def run_load(base_url, path, clients, requests_per_client):
+    latencies = []
+    ping_latencies = []
+    done = asyncio.Event()
+
+    limits = httpx.Limits(max_connections=clients + 1)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=None) as client:
+        async def worker():
+            for _ in range(requests_per_client):
+                start = time.perf_counter()
+                response = await client.get(path)
+                response.raise_for_status()
+                latencies.append(time.perf_counter() - start)
+
+        async def pinger():
+            while not done.is_set():
+                start = time.perf_counter()
+                await client.get("/ping")
+                ping_latencies.append(time.perf_counter() - start)
+                await asyncio.sleep(0.01)
+
+        ping_task = asyncio.create_task(pinger())
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(clients)))
+        elapsed = time.perf_counter() - start
+        done.set()
+        await ping_task
+
+    return latencies, ping_latencies, elapsed
+
+
+async def main(args):
+    # Match the stub pool to the largest client count so only the event loop is the bottleneck
+    os.environ.setdefault("GEMINI_MAX_CONCURRENCY", str(max(args.clients)))
+    server = start_server(build_app(args.latency), args.port)
+    base_url = f"http://127.0.0.1:{args.port}"
+
+    print(f"stub latency {args.latency * 1000:.0f} ms, {args.requests} requests per client")
+    print(f"{'mode':<10} {'clients':>7} {'p50 ms':>9} {'p99 ms':>9} {'req/s':>8} {'ping p99 ms':>12}")
+    for mode in ("direct", "offloaded"):
+        for clients in args.clients:
+            latencies, pings, elapsed = await run_load(base_url, f"/{mode}", clients, args.requests)
+            print(
+                f"{mode:<10} {clients:>7} "
+                f"{percentile(latencies, 50) * 1000:>9.1f} {percentile(latencies, 99) * 1000:>9.1f} "
+                f"{len(latencies) / elapsed:>8.1f} {percentile(pings, 99) * 1000:>12.1f}"
+            )
+    server.should_exit = True
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, nargs="+", default=[1, 4, 16, 64])
+    parser.add_argument("--requests", type=int, default=5, help="requests per client")
+    parser.add_argument("--latency", type=float, default=0.1, help="stub backend latency in seconds")
+    parser.add_argument("--port", type=int, default=8765)
+    asyncio.run(main(parser.parse_args()))
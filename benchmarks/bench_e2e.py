@@ -0,0 +1,444 @@
+"""End-to-end load benchmark for the whole app, with local stand-ins for every external service.
+
+Starts main:app under uvicorn in a subprocess with benchmarks.stubs in place of
+Gemini, Cloud Text-to-Speech and the embedding model, and points the Places
+lookups at the stub server from benchmarks.bench_places. Every stub answers
+deterministically after a fixed latency, so runs are comparable across commits.
+Each scenario then drives concurrent traffic at one flow (or a mix of them)
+through the real routes, middleware, caches and backends, and reports
+throughput, latency percentiles, errors, the upstream calls it made (from
+/metrics and the Places stub) and the server's resident memory.
+
+A share of the requests (--repeat-ratio) reuse an earlier payload, as real users
+repeat questions; set it to 0 to measure cold paths only. Results can be saved
+as a baseline; a later run with --baseline exits with status 1 if any scenario's
+p95 latency or memory grew, or its throughput dropped, by more than --tolerance.
+
+    python -m benchmarks.bench_e2e
+    python -m benchmarks.bench_e2e --scenarios mate_chat visionary_process --requests 400 --concurrency 32
+    python -m benchmarks.bench_e2e --save-baseline storage/bench_e2e.json
+    python -m benchmarks.bench_e2e --baseline storage/bench_e2e.json --tolerance 0.15
+"""
+import argparse
+import asyncio
+import io
+import json
+import math
+import os
+import random
+import socket
+import statistics
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+import wave
+
+import httpx
+from PIL import Image, ImageDraw
+
+from benchmarks.bench_places import build_stub, start_server
+
+STAGES = ("gemini", "rag", "tts")
+KEYWORDS = ["walmart", "pharmacy", "bus stop", "coffee", "hospital", "atm", "park"]
+TOPICS = ["returns", "warranty", "shipping", "invoices", "safety", "training", "scheduling", "inventory"]
+
+
+def serve(args):
+    """Runs in the server subprocess: install the stubs, then serve main:app."""
+    from benchmarks import stubs
+
+    stubs.install(gemini=args.gemini_latency, llm=args.gemini_latency, tts=args.tts_latency,
+                  embed_call=args.embed_latency)
+    import uvicorn
+
+    import main as app_module
+
+    uvicorn.run(app_module.app, host="127.0.0.1", port=args.port, log_level="warning")
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def app_env(tmp, places_url):
+    """Environment for an app process using the stubs: fake keys, all state under tmp."""
+    credentials = os.path.join(tmp, "credentials.json")
+    with open(credentials, "w") as f:
+        f.write("{}")
+    return dict(
+        os.environ,
+        GOOGLE_API_KEY="stub",
+        GEMINI_API_KEY="stub",
+        GOOGLE_PLACES_API_KEY="stub",
+        GOOGLE_APPLICATION_CREDENTIALS=credentials,
+        GOOGLE_MAPS_API_BASE=places_url,
+        STATE_DB=os.path.join(tmp, "state.sqlite3"),
+        MATE_INDEX_DIR=os.path.join(tmp, "mate_index"),
+        MATE_BLOB_DIR=os.path.join(tmp, "blobs"),
+        MATE_EMBED_CACHE_DB=os.path.join(tmp, "embeddings.sqlite3"),
+        VISIONARY_TTS_CACHE_DIR=os.path.join(tmp, "tts"),
+        PROFILE_DIR=os.path.join(tmp, "profiles"),
+        # Warmup synthesizes the fixed phrases in the background, which would blur the first scenario
+        VISIONARY_TTS_WARMUP="0",
+    )
+
+
+def start_app(args, tmp, places_url):
+    port = free_port()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "benchmarks.bench_e2e", "--serve", "--port", str(port),
+         "--gemini-latency", str(args.gemini_latency), "--tts-latency", str(args.tts_latency),
+         "--embed-latency", str(args.embed_latency)],
+        env=app_env(tmp, places_url),
+        stdout=None if args.verbose else subprocess.DEVNULL,
+        stderr=None if args.verbose else subprocess.DEVNULL,
+    )
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.time() + 120
+    while time.time() < deadline:
+        try:
+            httpx.get(f"{url}/cache/stats", timeout=1)
+            return process, url
+        except httpx.TransportError:
+            if process.poll() is not None:
+                sys.exit("the app exited during startup")
+            time.sleep(0.2)
+    process.terminate()
+    sys.exit("the app did not start within 120 s")
+
+
+def memory_mb(pid):
+    """(current, peak) resident set size of pid in MB, from /proc; (None, None) elsewhere."""
+    values = {}
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                name, _, value = line.partition(":")
+                if name in ("VmRSS", "VmHWM"):
+                    values[name] = int(value.split()[0]) / 1024
+    except OSError:
+        pass
+    return values.get("VmRSS"), values.get("VmHWM")
+
+
+def read_metric(url, name):
+    """[(labels, value)] for one metric from the app's /metrics."""
+    series = []
+    for line in httpx.get(f"{url}/metrics", timeout=10).text.splitlines():
+        if line.startswith(name + "{"):
+            labels, _, value = line.rpartition(" ")
+            pairs = (pair.split("=", 1) for pair in labels[len(name) + 1:-1].split(","))
+            series.append(({key: value.strip('"') for key, value in pairs}, float(value)))
+    return series
+
+
+def stage_counts(url):
+    counts = dict.fromkeys(STAGES, 0)
+    for labels, value in read_metric(url, "stage_duration_seconds_count"):
+        if labels["stage"] in counts:
+            counts[labels["stage"]] = int(value)
+    return counts
+
+
+def wav_tone(seed):
+    """A short recording: silence, then a second of a warbling tone that passes the speech check."""
+    rate, rng = 16000, random.Random(seed)
+    base = rng.uniform(150, 300)
+    frames = bytearray()
+    for i in range(int(rate * 1.4)):
+        t = i / rate
+        level = 0 if t < 0.3 else 9000 * (0.6 + 0.4 * math.sin(2 * math.pi * 3 * t))
+        sample = level * math.sin(2 * math.pi * base * (1 + 0.1 * math.sin(2 * math.pi * 5 * t)) * t)
+        frames += struct.pack("<h", int(sample + rng.gauss(0, 80)))
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(rate)
+        f.writeframes(bytes(frames))
+    return buffer.getvalue()
+
+
+def camera_frame(seed):
+    rng = random.Random(seed)
+    image = Image.new("RGB", (1280, 960), tuple(rng.randrange(256) for _ in range(3)))
+    draw = ImageDraw.Draw(image)
+    for _ in range(12):
+        x, y = rng.randrange(1280), rng.randrange(960)
+        draw.rectangle((x, y, x + rng.randint(60, 400), y + rng.randint(60, 400)),
+                       fill=tuple(rng.randrange(256) for _ in range(3)))
+    buffer = io.BytesIO()
+    image.save(buffer, "JPEG", quality=85)
+    return buffer.getvalue()
+
+
+def document(seed):
+    rng = random.Random(seed)
+    lines = [f"Policy handbook {seed}"]
+    for topic in TOPICS:
+        for n in range(rng.randint(4, 8)):
+            lines.append(f"The {topic} team handles case {seed}-{n} within {rng.randint(1, 30)} days. "
+                         f"Contact the {topic} desk on extension {rng.randint(100, 999)} for {topic} questions.")
+    return "\n".join(lines).encode()
+
+
+class Payloads:
+    """Payload seeds: a repeat_ratio share reuse one already sent, the rest are new."""
+
+    def __init__(self, rng, repeat_ratio):
+        self.rng = rng
+        self.repeat_ratio = repeat_ratio
+        self.used = []
+
+    def next(self):
+        if self.used and self.rng.random() < self.repeat_ratio:
+            return self.rng.choice(self.used)
+        seed = self.rng.randrange(1 << 30)
+        self.used.append(seed)
+        return seed
+
+
+def check(response):
+    if response.status_code >= 400:
+        raise RuntimeError(f"{response.request.url.path}: HTTP {response.status_code}")
+    return response
+
+
+async def wait_for_job(client, url, session, job_id):
+    while True:
+        job = check(await client.get(f"{url}/mate/jobs/{job_id}", headers=session)).json()
+        if job["status"] == "done":
+            return
+        if job["status"] == "failed":
+            raise RuntimeError(f"ingestion failed: {job['error']}")
+        await asyncio.sleep(0.05)
+
+
+async def upload(client, url, session, seed):
+    files = {"file": (f"handbook-{seed}.txt", document(seed), "text/plain")}
+    job = check(await client.post(f"{url}/mate/upload", files=files, headers=session)).json()
+    await wait_for_job(client, url, session, job["job_id"])
+
+
+# One request of each flow; session is the virtual user's X-Mate-Session header, seed picks the payload
+
+async def mate_chat(client, url, session, seed):
+    check(await client.post(f"{url}/mate/chat", json={"message": f"Explain topic {seed} in one paragraph"},
+                            headers=session))
+
+
+async def mate_chat_stream(client, url, session, seed):
+    headers = {**session, "Accept": "text/event-stream"}
+    async with client.stream("POST", f"{url}/mate/chat", json={"message": f"Tell me about item {seed}"},
+                             headers=headers) as response:
+        check(response)
+        async for line in response.aiter_lines():
+            if '"done"' in line:
+                return
+    raise RuntimeError("stream ended without done")
+
+
+async def mate_upload(client, url, session, seed):
+    await upload(client, url, session, seed)
+
+
+async def mate_rag(client, url, session, seed):
+    topic = TOPICS[seed % len(TOPICS)]
+    check(await client.post(f"{url}/mate/chat", json={"message": f"Who handles {topic} questions?"},
+                            headers=session))
+
+
+async def visionary_process(client, url, session, seed):
+    files = {
+        "audio": ("recording.wav", wav_tone(seed), "audio/wav"),
+        "image": ("frame.jpg", camera_frame(seed), "image/jpeg"),
+    }
+    data = {"latitude": "12.9716", "longitude": "77.5946"}
+    check(await client.post(f"{url}/visionary/process_audio_and_image", files=files, data=data))
+
+
+async def visionary_tts(client, url, session, seed):
+    text = f"There is a crosswalk {seed % 50 + 2} meters ahead. The light is red, wait before crossing."
+    check(await client.post(f"{url}/visionary/synthesize_speech", json={"text": text, "language": "english"}))
+
+
+async def visionary_places(client, url, session, seed):
+    rng = random.Random(seed)
+    body = {"keyword": rng.choice(KEYWORDS), "latitude": 12.9 + rng.random() / 10, "longitude": 77.5 + rng.random() / 10}
+    check(await client.post(f"{url}/visionary/get_nearest_place", json=body))
+
+
+FLOWS = {
+    "mate_chat": mate_chat,
+    "mate_chat_stream": mate_chat_stream,
+    "mate_upload": mate_upload,
+    "mate_rag": mate_rag,
+    "visionary_process": visionary_process,
+    "visionary_tts": visionary_tts,
+    "visionary_places": visionary_places,
+}
+# What a mixed population of users does, by share of requests
+MIX = {"mate_chat": 3, "mate_chat_stream": 3, "mate_rag": 2, "visionary_process": 4, "visionary_tts": 1,
+       "visionary_places": 1}
+SCENARIOS = list(FLOWS) + ["mixed"]
+
+
+async def run_scenario(name, url, args, rng):
+    limits = httpx.Limits(max_connections=args.concurrency)
+    async with httpx.AsyncClient(limits=limits, timeout=120) as client:
+        sessions = [{"X-Mate-Session": f"{name}-{user}-{rng.randrange(1 << 32):08x}"} for user in range(args.concurrency)]
+        if name in ("mate_rag", "mixed"):
+            # Every user asks about a document of their own
+            await asyncio.gather(*(upload(client, url, session, user) for user, session in enumerate(sessions)))
+
+        payloads = {flow: Payloads(random.Random(rng.random()), args.repeat_ratio) for flow in FLOWS}
+        plan = []
+        for _ in range(args.requests):
+            flow = rng.choices(list(MIX), weights=list(MIX.values()))[0] if name == "mixed" else name
+            plan.append((flow, payloads[flow].next()))
+        plan.reverse()
+
+        latencies, errors = [], []
+
+        async def user_loop(session):
+            while plan:
+                flow, seed = plan.pop()
+                start = time.perf_counter()
+                try:
+                    await FLOWS[flow](client, url, session, seed)
+                except Exception as e:
+                    errors.append(f"{flow}: {e}")
+                else:
+                    latencies.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(user_loop(session) for session in sessions))
+        return time.perf_counter() - start, latencies, errors
+
+
+def measure(name, url, pid, args, rng):
+    before = stage_counts(url)
+    elapsed, latencies, errors = asyncio.run(run_scenario(name, url, args, rng))
+    after = stage_counts(url)
+    rss, peak = memory_mb(pid)
+    cuts = statistics.quantiles(latencies, n=100) if len(latencies) > 1 else [latencies[0] if latencies else 0.0] * 99
+    return {
+        "requests": len(latencies) + len(errors),
+        "errors": len(errors),
+        "error_samples": sorted(set(errors))[:3],
+        "throughput": len(latencies) / elapsed,
+        "p50_ms": cuts[49] * 1000,
+        "p90_ms": cuts[89] * 1000,
+        "p95_ms": cuts[94] * 1000,
+        "p99_ms": cuts[98] * 1000,
+        "upstream": {stage: after[stage] - before[stage] for stage in STAGES},
+        "rss_mb": rss,
+        "peak_rss_mb": peak,
+    }
+
+
+def compare(results, baseline, tolerance):
+    """Lines describing every regression against baseline beyond tolerance."""
+    regressions = []
+    for name, result in results["scenarios"].items():
+        base = baseline["scenarios"].get(name)
+        if not base:
+            continue
+        checks = [
+            ("p95 latency", result["p95_ms"], base["p95_ms"], 1),
+            ("throughput", result["throughput"], base["throughput"], -1),
+            ("memory", result["rss_mb"], base["rss_mb"], 1),
+        ]
+        for label, value, reference, direction in checks:
+            if value is None or not reference:
+                continue
+            change = (value - reference) / reference
+            if change * direction > tolerance:
+                regressions.append(f"{name}: {label} {reference:.1f} -> {value:.1f} ({change:+.0%})")
+        if result["errors"] > base["errors"]:
+            regressions.append(f"{name}: errors {base['errors']} -> {result['errors']}")
+    return regressions
+
+
+def main(args):
+    config = {key: getattr(args, key) for key in
+              ("requests", "concurrency", "repeat_ratio", "seed", "gemini_latency", "tts_latency", "places_latency",
+               "embed_latency")}
+    print(", ".join(f"{key} {value}" for key, value in config.items()) + f", {os.cpu_count()} cores")
+
+    places = build_stub(args.places_latency, 0)
+    places_port = free_port()
+    places_server = start_server(places, places_port)
+    rng = random.Random(args.seed)
+    results = {"config": config, "scenarios": {}}
+    with tempfile.TemporaryDirectory() as tmp:
+        process, url = start_app(args, tmp, f"http://127.0.0.1:{places_port}")
+        try:
+            results["startup_rss_mb"] = memory_mb(process.pid)[0]
+            print(f"{'scenario':<18} {'req':>5} {'err':>4} {'req/s':>7} {'p50 ms':>8} {'p90 ms':>8} {'p95 ms':>8} "
+                  f"{'p99 ms':>8} {'gemini':>6} {'rag':>5} {'tts':>5} {'places':>6} {'rss MB':>7} {'peak MB':>8}")
+            for name in args.scenarios:
+                places_calls = places.state.calls
+                result = measure(name, url, process.pid, args, rng)
+                result["upstream"]["places"] = places.state.calls - places_calls
+                results["scenarios"][name] = result
+                upstream = result["upstream"]
+                print(f"{name:<18} {result['requests']:>5} {result['errors']:>4} {result['throughput']:>7.1f} "
+                      f"{result['p50_ms']:>8.1f} {result['p90_ms']:>8.1f} {result['p95_ms']:>8.1f} {result['p99_ms']:>8.1f} "
+                      f"{upstream['gemini']:>6} {upstream['rag']:>5} {upstream['tts']:>5} {upstream['places']:>6} "
+                      f"{result['rss_mb'] or 0:>7.0f} {result['peak_rss_mb'] or 0:>8.0f}")
+                for sample in result["error_samples"]:
+                    print(f"{'':<18} error: {sample}")
+        finally:
+            process.terminate()
+            process.wait()
+            places_server.should_exit = True
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Saved baseline to {args.save_baseline}")
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        changed = [key for key, value in config.items() if baseline["config"].get(key) != value]
+        if changed:
+            print(f"Warning: baseline was recorded with different {', '.join(changed)}")
+        regressions = compare(results, baseline, args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions beyond {args.tolerance:.0%} against {args.baseline}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=SCENARIOS)
+    parser.add_argument("--requests", type=int, default=200, help="requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=16, help="virtual users sending requests back to back")
+    parser.add_argument("--repeat-ratio", type=float, default=0.3, help="share of requests that repeat an earlier payload")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--gemini-latency", type=float, default=0.4, help="seconds per Gemini or RAG LLM call")
+    parser.add_argument("--tts-latency", type=float, default=0.15, help="seconds per speech synthesis call")
+    parser.add_argument("--places-latency", type=float, default=0.05, help="seconds per Places API call")
+    parser.add_argument("--embed-latency", type=float, default=0.008, help="seconds per embedding batch")
+    parser.add_argument("--out", help="write the results as JSON")
+    parser.add_argument("--save-baseline", help="write the results as a baseline for later runs")
+    parser.add_argument("--baseline", help="compare with a saved baseline; exit 1 on regressions")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="allowed relative change against the baseline")
+    parser.add_argument("--verbose", action="store_true", help="show the app's own output")
+    parser.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--port", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.serve:
+        serve(args)
+    else:
+        main(args)
@@ -0,0 +1,94 @@
+"""Throughput and memory benchmark for the Mate embedding service.
+
+Embeds a synthetic corpus from concurrent threads, first calling the model
+directly (one call per text, as concurrent uploads and queries did before),
+then through BatchingEmbedding with a cold and a warm cache.
+
+    python -m benchmarks.bench_embeddings --threads 8 --texts 512
+    MATE_EMBED_BACKEND=onnx python -m benchmarks.bench_embeddings
+    python -m benchmarks.bench_embeddings --stub   # no model download needed
+"""
+import argparse
+import os
+import resource
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from multimodal_mate.embeddings import BatchingEmbedding, EmbeddingCache, build_hf_model
+
+WORDS = "battery voltage invoice part number warehouse shipment schedule customer report".split()
+
+
+def build_corpus(count):
+    return [
+        " ".join(WORDS[(i + j) % len(WORDS)] for j in range(40)) + f" row {i}"
+        for i in range(count)
+    ]
+
+
+def build_stub_model(per_call, per_text):
+    from llama_index.core.embeddings import MockEmbedding
+
+    # A CPU model saturates the cores, so concurrent calls effectively run one at a time
+    compute_lock = threading.Lock()
+
+    class StubEmbedding(MockEmbedding):
+        # Fixed per-call overhead plus per-text cost, roughly the shape of a CPU transformer
+        def _get_text_embeddings(self, texts):
+            with compute_lock:
+                time.sleep(per_call + per_text * len(texts))
+            return [[float(len(text))] * self.embed_dim for text in texts]
+
+        def _get_text_embedding(self, text):
+            return self._get_text_embeddings([text])[0]
+
+    return StubEmbedding(embed_dim=384, model_name="stub")
+
+
+def build_model(args):
+    if args.stub:
+        return build_stub_model(args.stub_call_ms / 1000, args.stub_text_ms / 1000)
+
+    return build_hf_model(args.model)
+
+
+def max_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run(label, embed_one, corpus, threads):
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        list(pool.map(embed_one, corpus))
+    elapsed = time.perf_counter() - start
+    print(f"{label:<28} {len(corpus) / elapsed:>10.1f} emb/s {elapsed:>8.2f} s {max_rss_mb():>8.0f} MB max RSS")
+
+
+def main(args):
+    corpus = build_corpus(args.texts)
+    model = build_model(args)
+    print(f"{len(corpus)} texts, {args.threads} threads, {max_rss_mb():.0f} MB max RSS after model load")
+
+    run("direct (one call per text)", model.get_text_embedding, corpus, args.threads)
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        cache = EmbeddingCache(model.model_name, max_entries=len(corpus), db_path=os.path.join(cache_dir, "cache.sqlite3"))
+        service = BatchingEmbedding(model, cache, max_batch=args.max_batch, window=args.window_ms / 1000)
+        run("batched, cold cache", service.get_text_embedding, corpus, args.threads)
+        run("batched, warm cache", service.get_text_embedding, corpus, args.threads)
+        print(f"cache hits {cache.hits}, misses {cache.misses}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default="sentence-transformers/all-MiniLM-L6-v2")
+    parser.add_argument("--texts", type=int, default=512)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--max-batch", type=int, default=64)
+    parser.add_argument("--window-ms", type=float, default=5)
+    parser.add_argument("--stub", action="store_true", help="use a sleep-based stub instead of the real model")
+    parser.add_argument("--stub-call-ms", type=float, default=8)
+    parser.add_argument("--stub-text-ms", type=float, default=0.5)
+    main(parser.parse_args())
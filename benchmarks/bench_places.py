@@ -0,0 +1,160 @@
+"""Benchmark for nearest-place lookups against a local stub of the Google Maps APIs.
+
+Starts a stub Places/Geocoding server under uvicorn (fixed latency, optional
+503s to exercise retries) and resolves a stream of lookups three ways: the old
+blocking requests.get per call in a thread pool, the pooled async client with
+the cache disabled, and the pooled client with the geo cache. The cache's shared
+entries go to a temporary state database, so every run starts cold and the app's
+own STATE_DB is left alone.
+
+    python -m benchmarks.bench_places --lookups 400 --concurrency 16 --latency 0.05
+    python -m benchmarks.bench_places --fail-every 5   # every 5th upstream call returns 503
+"""
+import argparse
+import asyncio
+import itertools
+import os
+import random
+import tempfile
+import threading
+import time
+
+import requests
+import uvicorn
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse
+
+KEYWORDS = ["walmart", "pharmacy", "bus stop", "coffee", "hospital", "atm", "park", "library"]
+
+
+def build_stub(latency, fail_every):
+    app = FastAPI()
+    counter = itertools.count(1)
+    app.state.calls = 0
+
+    async def respond(results):
+        app.state.calls += 1
+        await asyncio.sleep(latency)
+        if fail_every and next(counter) % fail_every == 0:
+            return JSONResponse({"status": "UNAVAILABLE"}, status_code=503)
+        return {"results": results}
+
+    @app.get("/maps/api/place/nearbysearch/json")
+    async def nearby(location: str, keyword: str, rankby: str = "", key: str = ""):
+        # Nothing nearby for "library", so those lookups fall through to geocoding
+        if keyword == "library":
+            return await respond([])
+        lat, lng = (float(v) for v in location.split(","))
+        return await respond([{"geometry": {"location": {"lat": lat + 0.001, "lng": lng + 0.001}}}])
+
+    @app.get("/maps/api/geocode/json")
+    async def geocode(address: str, key: str = ""):
+        return await respond([{"geometry": {"location": {"lat": 12.97, "lng": 77.59}}}])
+
+    return app
+
+
+def start_server(app, port):
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+    return server
+
+
+def build_lookups(count, seed=7):
+    # Users walking around a small area: positions jitter by a few metres around a few spots
+    rng = random.Random(seed)
+    spots = [(12.9716 + i * 0.01, 77.5946 + i * 0.01) for i in range(4)]
+    lookups = []
+    for _ in range(count):
+        lat, lng = rng.choice(spots)
+        lookups.append((rng.choice(KEYWORDS), lat + rng.uniform(-0.0002, 0.0002), lng + rng.uniform(-0.0002, 0.0002)))
+    return lookups
+
+
+def blocking_lookup(base, keyword, latitude, longitude):
+    # The previous implementation: a new connection per call, nearby search then geocoding
+    data = requests.get(
+        f"{base}/maps/api/place/nearbysearch/json",
+        params={"location": f"{latitude},{longitude}", "rankby": "distance", "keyword": keyword, "key": "stub"},
+        timeout=10,
+    ).json()
+    if data.get("results"):
+        return data["results"][0]["geometry"]["location"]
+    return requests.get(f"{base}/maps/api/geocode/json", params={"address": keyword, "key": "stub"}, timeout=10).json()
+
+
+async def run(label, lookup, lookups, concurrency, stub):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    errors = 0
+
+    async def one(args):
+        nonlocal errors
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                await lookup(*args)
+            except Exception:
+                errors += 1
+            latencies.append(time.perf_counter() - start)
+
+    calls_before = stub.state.calls
+    start = time.perf_counter()
+    await asyncio.gather(*(one(args) for args in lookups))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    print(
+        f"{label:<24} {len(lookups) / elapsed:>8.1f} {latencies[len(latencies) // 2] * 1000:>8.1f} "
+        f"{latencies[int(len(latencies) * 0.99)] * 1000:>8.1f} {stub.state.calls - calls_before:>10} {errors:>7}"
+    )
+
+
+async def main(args, state_dir):
+    base = f"http://127.0.0.1:{args.port}"
+    os.environ["GOOGLE_MAPS_API_BASE"] = base
+    os.environ["STATE_DB"] = os.path.join(state_dir, "state.sqlite3")
+    from visionary import places
+    from common.http_client import close_http_client
+
+    stub = build_stub(args.latency, args.fail_every)
+    server = start_server(stub, args.port)
+    lookups = build_lookups(args.lookups)
+    loop = asyncio.get_running_loop()
+
+    async def blocking(keyword, latitude, longitude):
+        return await loop.run_in_executor(None, blocking_lookup, base, keyword, latitude, longitude)
+
+    async def uncached(keyword, latitude, longitude):
+        places.places_cache._entries.clear()
+        return await places.find_nearest_place(keyword, latitude, longitude, "stub")
+
+    places.places_cache.shared = False
+
+    async def cached(keyword, latitude, longitude):
+        return await places.find_nearest_place(keyword, latitude, longitude, "stub")
+
+    print(f"{len(lookups)} lookups, concurrency {args.concurrency}, stub latency {args.latency * 1000:.0f} ms")
+    print(f"{'mode':<24} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'upstream':>10} {'errors':>7}")
+    await run("requests, per call", blocking, lookups, args.concurrency, stub)
+    await run("pooled client, no cache", uncached, lookups, args.concurrency, stub)
+    places.places_cache.shared = True
+    places.places_cache._entries.clear()
+    await run("pooled client, geo cache", cached, lookups, args.concurrency, stub)
+    print(f"places cache: {places.places_cache.snapshot()}")
+
+    await close_http_client()
+    server.should_exit = True
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--lookups", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--latency", type=float, default=0.05, help="stub upstream latency in seconds")
+    parser.add_argument("--fail-every", type=int, default=0, help="answer every Nth upstream call with 503")
+    parser.add_argument("--port", type=int, default=8766)
+    with tempfile.TemporaryDirectory() as state_dir:
+        asyncio.run(main(parser.parse_args(), state_dir))
@@ -0,0 +1,133 @@
+"""Reply parsing benchmark for Visionary.
+
+Runs a corpus of Gemini replies through the free-text parsing that
+/process_audio_and_image used before (navigation prefix, trailing periods
+stripped, language taken from the last sentence) and through
+visionary.replies.parse_reply. The corpus has well-formed JSON replies and the
+ways they go wrong (code fences, cut off mid-answer, language codes instead of
+names, unknown intents, no answer at all) as well as free-text replies with and
+without the language at the end. Reports how often each parser gets the intent,
+the destination, the TTS voice language and the spoken text right, and the
+cost per reply.
+
+    python -m benchmarks.bench_replies --repeat 200
+"""
+import argparse
+import contextlib
+import io
+import json
+import re
+import time
+
+from visionary.replies import parse_reply
+
+# Same shape as LANGUAGE_VOICES in visionary.py: name -> (language code, voices)
+LANGUAGES = {
+    "english": ("en-US", []), "spanish": ("es-ES", []), "french": ("fr-FR", []), "german": ("de-DE", []),
+    "hindi": ("hi-IN", []), "japanese": ("ja-JP", []), "portuguese": ("pt-BR", []), "norwegian": ("nb-NO", []),
+}
+ANSWERS = {
+    "english": "There is a crosswalk ahead. The light is red, so wait before crossing.",
+    "spanish": "Hay un paso de peatones delante. El semáforo está en rojo, espere antes de cruzar.",
+    "french": "Il y a un passage piéton devant vous. Le feu est rouge, attendez avant de traverser.",
+    "hindi": "आगे एक ज़ेबरा क्रॉसिंग है। बत्ती लाल है, पार करने से पहले रुकिए।",
+    "japanese": "前に横断歩道があります。信号は赤なので、渡る前に待ってください。",
+}
+PLACES = ["Walmart", "the nearest pharmacy", "Central Station"]
+
+
+def legacy_parse(text_response):
+    # What /process_audio_and_image did before structured replies
+    is_navigation = text_response.lower().startswith("opening directions for")
+    location = None
+    if is_navigation:
+        match = re.match(r"opening directions for\s*(.+?)[\.\n]", text_response, re.IGNORECASE)
+        if match:
+            location = match.group(1).strip()
+        else:
+            index = text_response.lower().index("opening directions for") + len("opening directions for")
+            location = re.split(r'[\.\n]', text_response[index:].strip(), 1)[0].strip()
+    text_response_clean = text_response.strip()
+    while text_response_clean and text_response_clean[-1] in '.\n':
+        text_response_clean = text_response_clean[:-1].strip()
+    if '.' in text_response_clean:
+        content, lang = text_response_clean.rsplit('.', 1)
+    else:
+        content = text_response_clean
+        lang = 'english'
+    language = {'english': 'english', 'spanish': 'spanish'}.get(lang.strip().lower(), 'english')
+    intent = "navigate" if is_navigation else "search" if content.lower().startswith("searching") else "answer"
+    return {"intent": intent, "location": location, "language": language, "answer": content.strip()}
+
+
+def corpus():
+    """(kind, reply text, expected {"intent", "location", "language", "answer"})"""
+    cases = []
+    for language, answer in ANSWERS.items():
+        expected = {"intent": "describe", "location": None, "language": language, "answer": answer}
+        as_json = json.dumps({"intent": "describe", "location": None, "language": language, "answer": answer}, ensure_ascii=False)
+        cases += [
+            ("json", as_json, expected),
+            ("json in code fence", f"```json\n{as_json}\n```", expected),
+            ("json cut off", as_json[:-2], expected),
+            ("json language code", as_json.replace(f'"{language}"', f'"{LANGUAGES[language][0]}"'), expected),
+            ("free text + language line", f"{answer}\n{language.capitalize()}", {**expected, "intent": "answer"}),
+            ("free text + language sentence", f"{answer} {language.capitalize()}.", {**expected, "intent": "answer"}),
+            ("free text, no language", answer, {**expected, "intent": "answer", "language": "english"}),
+        ]
+    for place in PLACES:
+        spoken = f"Opening directions for {place}."
+        expected = {"intent": "navigate", "location": place, "language": "english", "answer": spoken}
+        cases += [
+            ("json navigate", json.dumps({"intent": "navigate", "location": place, "language": "english", "answer": spoken}), expected),
+            ("json navigate, no location", json.dumps({"intent": "navigate", "language": "english", "answer": spoken}), expected),
+            ("json unknown intent", json.dumps({"intent": "directions", "location": place, "language": "english", "answer": spoken}), expected),
+            ("free text navigate", f"{spoken}\nEnglish", expected),
+        ]
+    empty = {"intent": "answer", "location": None, "language": "english", "answer": ""}
+    cases.append(("json without answer", '{"intent": "answer", "language": "english"}', empty))
+    return cases
+
+
+def score(parse, cases):
+    rows = {}
+    for kind, text, expected in cases:
+        reply = parse(text)
+        row = rows.setdefault(kind, [0, 0, 0, 0, 0])
+        row[0] += 1
+        row[1] += reply["intent"] == expected["intent"] or {reply["intent"], expected["intent"]} <= {"describe", "answer"}
+        row[2] += reply["location"] == expected["location"]
+        row[3] += reply["language"] == expected["language"]
+        # A cut-off reply can only give back what arrived
+        row[4] += reply["answer"] == expected["answer"] or (kind == "json cut off" and expected["answer"].startswith(reply["answer"]) and reply["answer"])
+    return rows
+
+
+def main(args):
+    cases = corpus()
+    parsers = {"legacy": legacy_parse, "parse_reply": lambda text: parse_reply(text, LANGUAGES)}
+    # parse_navigation prints every place it extracts
+    with contextlib.redirect_stdout(io.StringIO()):
+        results = {name: score(parse, cases) for name, parse in parsers.items()}
+        timings = {}
+        for name, parse in parsers.items():
+            start = time.perf_counter()
+            for _ in range(args.repeat):
+                for _, text, _ in cases:
+                    parse(text)
+            timings[name] = (time.perf_counter() - start) * 1e6 / (args.repeat * len(cases))
+
+    print(f"{'reply kind':<32} {'parser':<12} {'intent':>7} {'place':>6} {'voice':>6} {'spoken':>7}")
+    for kind in results["legacy"]:
+        for name in parsers:
+            n, intent, place, voice, spoken = results[name][kind]
+            print(f"{kind:<32} {name:<12} {intent:>3}/{n:<3} {place:>2}/{n:<3} {voice:>2}/{n:<3} {spoken:>3}/{n:<3}")
+    for name in parsers:
+        totals = [sum(row[i] for row in results[name].values()) for i in range(5)]
+        print(f"{'all':<32} {name:<12} " + " ".join(f"{value / totals[0]:>6.0%}" for value in totals[1:]) + f"  {timings[name]:.1f} us/reply")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=200)
+    main(parser.parse_args())
@@ -0,0 +1,143 @@
+"""Offline retrieval evaluation for Multimodal Mate.
+
+Builds synthetic corpora of the kind users upload (parts-catalogue rows from a
+spreadsheet, staff directory entries, manual paragraphs spread over PDF pages),
+indexes them with PersistentIndex, and asks three kinds of questions whose
+answer chunk is known: exact part numbers, people by name, and topics in other
+words than the manual uses. For each corpus size and retrieval mode it reports
+recall@k per question kind and query latency. A last row checks that a
+file/page filter keeps every hit inside the filtered file.
+
+By default chunks are embedded with a stub bag-of-words model that, like real
+sentence embedders, gives identifiers such as "XJ-4821" little weight. Pass
+--model to use the real embedding model instead.
+
+    python -m benchmarks.bench_retrieval --sizes 200 1000 5000 --k 2 5
+    python -m benchmarks.bench_retrieval --model sentence-transformers/all-MiniLM-L6-v2
+"""
+import argparse
+import random
+import statistics
+import tempfile
+import time
+
+from llama_index.core import Settings
+from llama_index.core.schema import TextNode
+
+from benchmarks.stubs import StubEmbedding
+from multimodal_mate.index_store import PersistentIndex
+
+MODES = ("vector", "keyword", "hybrid")
+ITEMS = "hex bolt,flat washer,lock nut,hinge pin,spring clip,cable tie,ball bearing,drive belt,gasket,rivet".split(",")
+MATERIALS = "stainless steel,brass,nylon,aluminium,zinc plated steel".split(",")
+FIRST = "Priya,Daniel,Mei,Omar,Sofia,Lukas,Amara,Kenji,Elena,Tomas,Nadia,Rafael".split(",")
+LAST = "Raman,Okafor,Lindqvist,Haddad,Moreau,Tanaka,Kowalski,Silva,Brennan,Novak".split(",")
+DUTIES = "returns,warranty claims,supplier invoices,night shift scheduling,forklift training,safety audits".split(",")
+# (manual paragraph, question asked in different words)
+TOPICS = [
+    ("To restore factory settings hold the power button for ten seconds until the lamp blinks twice.",
+     "how do I reset the machine to its defaults"),
+    ("Replace the air filter every three months or sooner when the airflow warning appears.",
+     "how often should the filter be changed"),
+    ("If the conveyor stops unexpectedly check the emergency stop cord along the frame.",
+     "the belt halted suddenly what should I inspect"),
+    ("Lubricate the main bearing with lithium grease after every two hundred operating hours.",
+     "which grease goes on the bearing and when"),
+    ("The display shows error E7 when the coolant temperature exceeds safe limits.",
+     "what does code E7 on the screen mean"),
+    ("Store batteries indoors at room temperature and charge them fully before winter storage.",
+     "how should batteries be kept over winter"),
+]
+
+
+def build_corpus(size, rng):
+    """Returns (nodes, questions); each question is (kind, text, the node that answers it)."""
+    nodes, questions = [], []
+    for i in range(size):
+        kind = ("part", "person", "manual")[i % 3]
+        if kind == "part":
+            part = f"{rng.choice('ABCDEFGHJKLMNPRSTUVWXYZ')}{rng.choice('ABCDEFGHJKLMNPRSTUVWXYZ')}-{1000 + i}"
+            text = (f"Part {part}: {rng.choice(ITEMS)}, {rng.randint(2, 20)} mm, {rng.choice(MATERIALS)}, "
+                    f"bin {rng.randint(1, 60)}, reorder at {rng.randint(5, 500)} units.")
+            metadata = {"file_name": "parts.xlsx", "page_label": "1"}
+            question = f"What material is part {part}?"
+        elif kind == "person":
+            name = f"{rng.choice(FIRST)} {rng.choice(LAST)} {i}"
+            text = f"{name} handles {rng.choice(DUTIES)} for region {rng.randint(1, 40)}, extension {rng.randint(100, 999)}."
+            metadata = {"file_name": "staff.docx", "page_label": "1"}
+            question = f"What does {name} handle?"
+        else:
+            paragraph, paraphrase = TOPICS[(i // 3) % len(TOPICS)]
+            model = f"model {rng.choice('ABCDEFG')}{i}"
+            text = f"{model.capitalize()} maintenance. {paragraph}"
+            metadata = {"file_name": "manual.pdf", "page_label": str(i // 30 + 1)}
+            question = f"For {model}, {paraphrase}?"
+        node = TextNode(text=text, metadata=metadata)
+        nodes.append(node)
+        questions.append((kind, question, node))
+    return nodes, questions
+
+
+def evaluate(index_store, questions, k_values, mode):
+    hits = {(kind, k): 0 for kind in ("part", "person", "manual") for k in k_values}
+    totals = {kind: 0 for kind in ("part", "person", "manual")}
+    latencies = []
+    retriever = index_store.retriever(top_k=max(k_values), mode=mode)
+    for kind, question, node in questions:
+        start = time.perf_counter()
+        results = retriever.retrieve(question)
+        latencies.append(time.perf_counter() - start)
+        ranked = [result.node.get_content() for result in results]
+        totals[kind] += 1
+        for k in k_values:
+            hits[(kind, k)] += node.get_content() in ranked[:k]
+    recall = {key: hits[key] / totals[key[0]] for key in hits}
+    return recall, latencies
+
+
+def check_filters(index_store, questions):
+    # Every hit for a filtered query must come from the filtered file and page
+    retriever = index_store.retriever({"file_name": "manual.pdf", "page_label": ["1", "2"]}, top_k=5)
+    leaks = 0
+    for _, question, _ in questions[:50]:
+        leaks += sum(
+            result.node.metadata["file_name"] != "manual.pdf" or result.node.metadata["page_label"] not in ("1", "2")
+            for result in retriever.retrieve(question)
+        )
+    return leaks
+
+
+def main(args):
+    if args.model:
+        from multimodal_mate.embeddings import build_embedding_service
+
+        Settings.embed_model = build_embedding_service(args.model)
+    else:
+        Settings.embed_model = StubEmbedding(model_name="stub", dim=256)
+
+    rng = random.Random(7)
+    columns = [f"{kind[:6]}@{k}" for k in args.k for kind in ("part", "person", "manual")]
+    print(f"{'chunks':>7} {'mode':<8} " + " ".join(f"{c:>10}" for c in columns) + f" {'p50 ms':>8} {'p95 ms':>8}")
+    for size in args.sizes:
+        nodes, questions = build_corpus(size, rng)
+        sample = rng.sample(questions, min(args.queries, len(questions)))
+        with tempfile.TemporaryDirectory() as tmp:
+            index_store = PersistentIndex(tmp)
+            start = time.perf_counter()
+            index_store.insert_nodes(nodes)
+            index_seconds = time.perf_counter() - start
+            for mode in MODES:
+                recall, latencies = evaluate(index_store, sample, args.k, mode)
+                cuts = statistics.quantiles(latencies, n=20)
+                cells = " ".join(f"{recall[(kind, k)]:>10.2f}" for k in args.k for kind in ("part", "person", "manual"))
+                print(f"{size:>7} {mode:<8} {cells} {statistics.median(latencies) * 1000:>8.2f} {cuts[18] * 1000:>8.2f}")
+            print(f"{'':>7} indexed in {index_seconds:.1f} s, filter leaks: {check_filters(index_store, sample)}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[200, 1000, 5000], help="chunks per corpus")
+    parser.add_argument("--k", type=int, nargs="+", default=[2, 5])
+    parser.add_argument("--queries", type=int, default=150, help="questions sampled per corpus")
+    parser.add_argument("--model", help="embedding model to use instead of the stub")
+    main(parser.parse_args())
@@ -0,0 +1,105 @@
+"""Change detection benchmark for Visionary's scene mode.
+
+Simulates a walk as a sequence of camera frames: stretches where the camera
+shakes a little over the same scene (small shifts, exposure changes, sensor
+noise), slow pans across a wide scene, and cuts to a different scene. Every
+frame goes through the same preprocessing and SceneState as /ws/scene, and for
+each change threshold the benchmark counts how many Gemini description calls
+scene mode would make, how many scene cuts it caught, and how many calls were set
+off by camera shake alone.
+
+    python -m benchmarks.bench_scene --frames 600 --bits 6 9 12 16 20 --min-interval 3
+"""
+import argparse
+import io
+import random
+import time
+
+from PIL import Image, ImageDraw, ImageEnhance
+
+from common.images import prepare_image
+from visionary.scene import SCENE_FRAME_INTERVAL_MS, SCENE_MIN_INTERVAL, SceneState
+
+WIDTH, HEIGHT = 640, 480
+
+
+def random_scene(rng, width=WIDTH):
+    image = Image.new("RGB", (width, HEIGHT), tuple(rng.randrange(256) for _ in range(3)))
+    draw = ImageDraw.Draw(image)
+    for _ in range(rng.randint(6, 14)):
+        x, y = rng.randrange(width), rng.randrange(HEIGHT)
+        w, h = rng.randint(40, 260), rng.randint(40, 260)
+        draw.rectangle((x, y, x + w, y + h), fill=tuple(rng.randrange(256) for _ in range(3)))
+    return image
+
+
+def shaken(rng, image, left=0):
+    # The same view with a few pixels of shake, a small exposure change and JPEG noise
+    dx, dy = rng.randint(-6, 6), rng.randint(-6, 6)
+    frame = image.crop((left + 8 + dx, 8 + dy, left + 8 + dx + WIDTH - 16, 8 + dy + HEIGHT - 16))
+    frame = ImageEnhance.Brightness(frame).enhance(rng.uniform(0.92, 1.08))
+    buffer = io.BytesIO()
+    frame.save(buffer, "JPEG", quality=rng.randint(55, 80))
+    return buffer.getvalue()
+
+
+def walk(frames, rng):
+    """Yields (jpeg, kind): kind is "cut" for the first frame of a new scene, else "pan" or "still"."""
+    produced = 0
+    while produced < frames:
+        length = rng.randint(8, 30)
+        if rng.random() < 0.3:
+            # Pan across a scene twice as wide as the frame
+            scene = random_scene(rng, WIDTH * 2)
+            for i in range(length):
+                yield shaken(rng, scene, left=int(i * (WIDTH - 16) / length)), "cut" if i == 0 else "pan"
+        else:
+            scene = random_scene(rng)
+            for i in range(length):
+                yield shaken(rng, scene), "cut" if i == 0 else "still"
+        produced += length
+
+
+def main(args):
+    frames = list(walk(args.frames, random.Random(args.seed)))[:args.frames]
+    start = time.perf_counter()
+    prepared = [(prepare_image(data, "image/jpeg"), kind) for data, kind in frames]
+    per_frame_ms = (time.perf_counter() - start) * 1000 / len(frames)
+    cuts = sum(kind == "cut" for _, kind in prepared)
+    interval = args.frame_interval_ms / 1000
+
+    print(f"{len(frames)} frames ({interval:g} s apart), {cuts} scene cuts, "
+          f"{per_frame_ms:.1f} ms per frame to downscale and hash")
+    print(f"{'bits':>5} {'calls':>6} {'cuts caught':>12} {'pan calls':>10} {'shake calls':>12} {'calls/min':>10}")
+    for bits in args.bits:
+        clock = [0.0]
+        scene = SceneState(change_bits=bits, min_interval=args.min_interval, max_age=0, clock=lambda: clock[0])
+        calls = caught = pan = shake = 0
+        pending_cut = False
+        for (data, mime_type, frame_hash), kind in prepared:
+            clock[0] += interval
+            pending_cut = pending_cut or kind == "cut"
+            if scene.observe(data, mime_type, frame_hash) != "changed":
+                continue
+            scene.begin()
+            scene.update(f"description {calls}", frame_hash)
+            calls += 1
+            if pending_cut:
+                caught += 1
+                pending_cut = False
+            elif kind == "pan":
+                pan += 1
+            else:
+                shake += 1
+        minutes = len(frames) * interval / 60
+        print(f"{bits:>5} {calls:>6} {caught:>8}/{cuts:<3} {pan:>10} {shake:>12} {calls / minutes:>10.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--frames", type=int, default=600, help="frames in the walk (one per second in scene mode)")
+    parser.add_argument("--bits", type=int, nargs="+", default=[6, 9, 12, 16, 20], help="change thresholds to try")
+    parser.add_argument("--frame-interval-ms", type=int, default=SCENE_FRAME_INTERVAL_MS)
+    parser.add_argument("--min-interval", type=float, default=SCENE_MIN_INTERVAL, help="seconds between description calls")
+    parser.add_argument("--seed", type=int, default=1)
+    main(parser.parse_args())
@@ -0,0 +1,98 @@
+"""Startup time and memory benchmark.
+
+Each measurement runs in a fresh interpreter: import the app module, run its
+lifespan (startup), then optionally load the RAG stack (embedding model and LLM)
+the way the first document upload or query does. Reports wall time and max RSS
+after each step, plus the slowest imports from -X importtime.
+
+    python -m benchmarks.bench_startup
+    python -m benchmarks.bench_startup --module main --with-rag --repeat 3
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+CHILD = r"""
+import json, resource, sys, time
+
+def rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+result = {}
+start = time.perf_counter()
+module = __import__(sys.argv[1], fromlist=["_"])
+result["import_s"] = time.perf_counter() - start
+result["import_rss_mb"] = rss_mb()
+
+app = getattr(module, "app", None)
+if app is not None:
+    from fastapi.testclient import TestClient
+
+    start = time.perf_counter()
+    with TestClient(app):
+        result["startup_s"] = time.perf_counter() - start
+    result["startup_rss_mb"] = rss_mb()
+
+if sys.argv[2] == "1":
+    from multimodal_mate.models import load_rag_stack
+
+    start = time.perf_counter()
+    load_rag_stack()
+    result["rag_s"] = time.perf_counter() - start
+    result["rag_rss_mb"] = rss_mb()
+
+print(json.dumps(result))
+"""
+
+
+def run_child(module, with_rag, importtime=False):
+    env = dict(os.environ)
+    # Background warm-ups would otherwise race with the measurement
+    env.setdefault("MATE_WARMUP", "false")
+    env.setdefault("VISIONARY_TTS_WARMUP", "0")
+    command = [sys.executable] + (["-X", "importtime"] if importtime else []) + ["-c", CHILD, module, "1" if with_rag else "0"]
+    completed = subprocess.run(command, capture_output=True, text=True, env=env)
+    if completed.returncode != 0:
+        sys.exit(f"{module} failed to start:\n{completed.stderr[-2000:]}")
+    return json.loads(completed.stdout.strip().splitlines()[-1]), completed.stderr
+
+
+def slowest_imports(stderr, top, max_depth=2):
+    # importtime lines: "import time: self [us] | cumulative | <indent>package", two spaces per level
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        if 0 < depth <= max_depth:
+            rows.append((int(cumulative), name.strip()))
+    return sorted(rows, reverse=True)[:top]
+
+
+def main(args):
+    runs = [run_child(args.module, args.with_rag)[0] for _ in range(args.repeat)]
+    print(f"{args.module}: median of {args.repeat} fresh interpreters")
+    for step in ("import", "startup", "rag"):
+        if f"{step}_s" in runs[0]:
+            seconds = statistics.median(run[f"{step}_s"] for run in runs)
+            rss = statistics.median(run[f"{step}_rss_mb"] for run in runs)
+            print(f"  {step:<8} {seconds:>7.2f} s   {rss:>7.0f} MB max RSS")
+
+    if args.top:
+        _, stderr = run_child(args.module, args.with_rag, importtime=True)
+        print("slowest imports:")
+        for cumulative, name in slowest_imports(stderr, args.top):
+            print(f"  {cumulative / 1e6:>7.2f} s  {name}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--module", default="main", help="module to import, e.g. main or visionary.visionary")
+    parser.add_argument("--with-rag", action="store_true", help="also load the embedding model and LLM")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--top", type=int, default=10, help="show the N slowest imports")
+    main(parser.parse_args())
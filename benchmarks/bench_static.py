@@ -0,0 +1,111 @@
+"""Page load benchmark for the static asset layer.
+
+Serves the three pages and their scripts the way main.py does, and loads each
+page like a browser: first visit (empty cache, gzip accepted), then a repeat
+visit that revalidates the page with If-None-Match and finds the hashed
+scripts in its cache. For comparison it also serves the same files with the
+per-request FileResponse routes main.py used before, which answer every
+request with the whole file.
+
+    python -m benchmarks.bench_static --repeat 200
+"""
+import argparse
+import re
+import time
+
+from fastapi import FastAPI, Request
+from fastapi.responses import FileResponse, HTMLResponse
+from fastapi.templating import Jinja2Templates
+from fastapi.testclient import TestClient
+
+from common.static_assets import StaticAssets, page_response, static_url
+
+PAGES = {
+    "/": ("templates", "index.html", {}),
+    "/mate/": ("multimodal_mate/templates", "mate.html", {}),
+    "/visionary/": ("visionary/templates", "visionary.html", {"mapbox_api_key": "pk.stub"}),
+}
+MOUNTS = {
+    "/static": ("static", "static"),
+    "/mate/static": ("multimodal_mate/static", "mate_static"),
+    "/visionary/static": ("visionary/static", "visionary_static"),
+}
+SCRIPT = re.compile(r'<script src="(/[^"]+)"')
+
+
+def plain_url(name, path):
+    prefix = next(prefix for prefix, (_, mount_name) in MOUNTS.items() if mount_name == name)
+    return f"{prefix}/{path}"
+
+
+def build_app(legacy):
+    app = FastAPI()
+    for prefix, (directory, name) in MOUNTS.items():
+        if legacy:
+            app.add_api_route(prefix + "/{path:path}", lambda path, directory=directory: FileResponse(f"{directory}/{path}"))
+        else:
+            app.mount(prefix, StaticAssets(directory, name, prefix), name=name)
+
+    for path, (directory, template, context) in PAGES.items():
+        templates = Jinja2Templates(directory=directory)
+        templates.env.loader.searchpath.append("templates")
+        templates.env.globals["static_url"] = plain_url if legacy else static_url
+
+        async def page(request: Request, templates=templates, template=template, context=context):
+            if legacy:
+                return HTMLResponse(templates.get_template(template).render(**context))
+            return page_response(request, templates, template, **context)
+
+        app.add_api_route(path, page)
+    return app
+
+
+def fetch(client, url, cache):
+    # Returns the body (from the cache on a 304) and the bytes on the wire
+    headers = {"Accept-Encoding": "gzip, br"}
+    if url in cache and cache[url][0]:
+        headers["If-None-Match"] = cache[url][0]
+    response = client.get(url, headers=headers)
+    if response.status_code == 200:
+        cache[url] = (response.headers.get("etag"), response.headers.get("cache-control", ""), response.text)
+    return cache[url][2], int(response.headers.get("content-length", 0))
+
+
+def visit(client, path, cache):
+    """Load a page and its scripts like a browser with the given cache. Returns (requests, bytes)."""
+    body, sent = fetch(client, path, cache)
+    requests = 1
+    for script in SCRIPT.findall(body):
+        if script in cache and "immutable" in cache[script][1]:
+            continue
+        sent += fetch(client, script, cache)[1]
+        requests += 1
+    return requests, sent
+
+
+def measure(legacy, repeat):
+    client = TestClient(build_app(legacy))
+    rows = {}
+    for path in PAGES:
+        first = visit(client, path, {})
+        cache = {}
+        visit(client, path, cache)
+        start = time.perf_counter()
+        for _ in range(repeat):
+            requests, sent = visit(client, path, cache)
+        rows[path] = (first, (requests, sent), (time.perf_counter() - start) * 1000 / repeat)
+    return rows
+
+
+def main(args):
+    print(f"{'page':<12} {'mode':<8} {'first KB':>9} {'repeat reqs':>11} {'repeat KB':>10} {'repeat ms':>10}")
+    for legacy in (True, False):
+        for path, ((_, first_sent), (requests, sent), ms) in measure(legacy, args.repeat).items():
+            mode = "legacy" if legacy else "assets"
+            print(f"{path:<12} {mode:<8} {first_sent / 1024:>9.1f} {requests:>11} {sent / 1024:>10.1f} {ms:>10.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=200)
+    main(parser.parse_args())
@@ -0,0 +1,176 @@
+"""Throughput benchmark for multi-worker deployments.
+
+Starts the real main:app under gunicorn with gunicorn.conf.py and 1, 2, 4 and 8
+uvicorn workers in turn, with benchmarks.stubs in place of Gemini, Cloud
+Text-to-Speech and the embedding model (installed by build_app() below, before
+main is imported) and the Places stub from benchmarks.bench_places. Traffic is
+a mix of Mate chats and Visionary image questions, a share of them repeating an
+earlier payload. Each run gets a fresh state directory, so the shared hit
+columns count answers one worker took from an entry another worker stored.
+Memory is the proportional set size summed over the master and its workers, so
+pages shared copy-on-write are counted once (Linux only).
+
+    python -m benchmarks.bench_workers
+    python -m benchmarks.bench_workers --workers 1 4 --requests 600 --gemini-latency 0.3
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+from benchmarks.bench_e2e import FLOWS, Payloads, app_env, free_port, read_metric, stage_counts
+from benchmarks.bench_places import build_stub, start_server
+
+MIX = {"mate_chat": 1, "visionary_process": 1}
+
+
+def build_app():
+    """App factory run by gunicorn (benchmarks.bench_workers:build_app()): the stubs, then main:app."""
+    from benchmarks import stubs
+
+    gemini = float(os.getenv("BENCH_GEMINI_LATENCY", "0.2"))
+    stubs.install(gemini=gemini, llm=gemini, tts=float(os.getenv("BENCH_TTS_LATENCY", "0.1")),
+                  embed_call=float(os.getenv("BENCH_EMBED_LATENCY", "0.008")))
+    import main
+
+    return main.app
+
+
+def start_gunicorn(workers, args, tmp, places_url):
+    port = free_port()
+    env = dict(
+        app_env(tmp, places_url),
+        BIND=f"127.0.0.1:{port}",
+        WEB_CONCURRENCY=str(workers),
+        METRICS_PUBLISH_INTERVAL="0.5",
+        BENCH_GEMINI_LATENCY=str(args.gemini_latency),
+        BENCH_TTS_LATENCY=str(args.tts_latency),
+        BENCH_EMBED_LATENCY=str(args.embed_latency),
+    )
+    process = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "--log-level", "warning",
+         "benchmarks.bench_workers:build_app()"],
+        env=env,
+        stdout=None if args.verbose else subprocess.DEVNULL,
+        stderr=None if args.verbose else subprocess.DEVNULL,
+    )
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.time() + 120
+    while time.time() < deadline:
+        try:
+            httpx.get(f"{url}/cache/stats", timeout=1)
+            return process, url
+        except httpx.TransportError:
+            if process.poll() is not None:
+                sys.exit("gunicorn exited during startup")
+            time.sleep(0.2)
+    process.terminate()
+    sys.exit("gunicorn did not start within 120 s")
+
+
+def pss_mb(pid):
+    """Proportional set size of pid and its child processes in MB, from /proc; None elsewhere."""
+    total, pids = 0, [pid]
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children") as f:
+            pids += [int(child) for child in f.read().split()]
+        for each in pids:
+            with open(f"/proc/{each}/smaps_rollup") as f:
+                for line in f:
+                    if line.startswith("Pss:"):
+                        total += int(line.split()[1])
+    except OSError:
+        return None
+    return total / 1024
+
+
+def cache_lookups(url):
+    """{(cache, result): count} summed over every worker."""
+    return {(labels["cache"], labels["result"]): value for labels, value in read_metric(url, "cache_lookups_total")}
+
+
+async def drive(url, args, rng):
+    payloads = {flow: Payloads(random.Random(rng.random()), args.repeat_ratio) for flow in MIX}
+    plan = [(flow, payloads[flow].next()) for flow in rng.choices(list(MIX), weights=list(MIX.values()), k=args.requests)]
+    plan.reverse()
+    latencies, errors = [], []
+
+    async def user_loop(client, session):
+        while plan:
+            flow, seed = plan.pop()
+            start = time.perf_counter()
+            try:
+                await FLOWS[flow](client, url, session, seed)
+            except Exception as e:
+                errors.append(f"{flow}: {e}")
+            else:
+                latencies.append(time.perf_counter() - start)
+
+    limits = httpx.Limits(max_connections=args.concurrency)
+    async with httpx.AsyncClient(limits=limits, timeout=120) as client:
+        sessions = [{"X-Mate-Session": f"workers-{user}"} for user in range(args.concurrency)]
+        start = time.perf_counter()
+        await asyncio.gather(*(user_loop(client, session) for session in sessions))
+        return time.perf_counter() - start, latencies, errors
+
+
+def main(args):
+    print(
+        f"{args.requests} requests, repeat ratio {args.repeat_ratio}, concurrency {args.concurrency}, "
+        f"gemini {args.gemini_latency} s, tts {args.tts_latency} s, {os.cpu_count()} cores"
+    )
+    print(f"{'workers':>7} {'req/s':>7} {'p50 ms':>8} {'p99 ms':>8} {'err':>4} {'gemini':>6} "
+          f"{'hits':>5} {'shared':>6} {'misses':>6} {'pss MB':>7}")
+    places = build_stub(args.places_latency, 0)
+    places_port = free_port()
+    places_server = start_server(places, places_port)
+    try:
+        for workers in args.workers:
+            with tempfile.TemporaryDirectory() as tmp:
+                process, url = start_gunicorn(workers, args, tmp, f"http://127.0.0.1:{places_port}")
+                try:
+                    elapsed, latencies, errors = asyncio.run(drive(url, args, random.Random(args.seed)))
+                    # Let every worker publish its final counters before reading them back
+                    time.sleep(1.5)
+                    upstream = stage_counts(url)
+                    lookups = cache_lookups(url)
+                    memory = pss_mb(process.pid)
+                finally:
+                    process.terminate()
+                    process.wait()
+            cuts = statistics.quantiles(latencies, n=100) if len(latencies) > 1 else [0.0] * 99
+
+            def count(result):
+                return int(sum(lookups.get((cache, result), 0) for cache in ("mate", "visionary")))
+
+            print(
+                f"{workers:>7} {len(latencies) / elapsed:>7.1f} {cuts[49] * 1000:>8.1f} {cuts[98] * 1000:>8.1f} "
+                f"{len(errors):>4} {upstream['gemini']:>6} {count('hits'):>5} {count('shared_hits'):>6} "
+                f"{count('misses'):>6} {memory or 0:>7.0f}"
+            )
+            for sample in sorted(set(errors))[:3]:
+                print(f"{'':>7} error: {sample}")
+    finally:
+        places_server.should_exit = True
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=32, help="virtual users sending requests back to back")
+    parser.add_argument("--repeat-ratio", type=float, default=0.5, help="share of requests that repeat an earlier payload")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--gemini-latency", type=float, default=0.2, help="seconds per Gemini call")
+    parser.add_argument("--tts-latency", type=float, default=0.1, help="seconds per speech synthesis call")
+    parser.add_argument("--places-latency", type=float, default=0.05, help="seconds per Places API call")
+    parser.add_argument("--embed-latency", type=float, default=0.008, help="seconds per embedding batch")
+    parser.add_argument("--verbose", action="store_true", help="show gunicorn's and the app's own output")
+    main(parser.parse_args())
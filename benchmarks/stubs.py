@@ -0,0 +1,224 @@
+"""Deterministic local stand-ins for the services the app calls out to.
+
+install() puts stub modules in place of google.generativeai, the Cloud
+Text-to-Speech client, llama-index's Gemini LLM and its HuggingFace embedding,
+so main.py can be imported and served without API keys, credentials or model
+downloads. Every stub sleeps for a configurable time to stand in for the network
+or the model, and answers deterministically from its input. The Places API is
+stubbed as an HTTP server instead (benchmarks.bench_places.build_stub), because
+the app reaches it through its own HTTP client.
+"""
+import hashlib
+import importlib
+import json
+import re
+import sys
+import time
+import types
+import zlib
+
+import numpy as np
+from llama_index.core.base.llms.types import CompletionResponse, CompletionResponseGen, LLMMetadata
+from llama_index.core.embeddings import BaseEmbedding
+from llama_index.core.llms import CustomLLM
+
+# Seconds; install() overrides these
+LATENCY = {
+    "gemini": 0.4,        # Gemini request until the first token
+    "gemini_token": 0.01,  # Between streamed chunks
+    "llm": 0.4,           # llama-index Gemini LLM (RAG answers)
+    "tts": 0.15,          # One synthesize_speech call
+    "embed_call": 0.008,  # One embedding batch
+    "embed_text": 0.0005,  # Each text in a batch
+}
+
+PLACES = ("Walmart", "the pharmacy", "Central Station")
+
+
+def _digest(value):
+    return int(hashlib.sha256(str(value).encode()).hexdigest()[:8], 16)
+
+
+def _words(seed, count):
+    vocabulary = "the a crosswalk door table person car step light red green left right ahead open sign".split()
+    return " ".join(vocabulary[(seed >> i) % len(vocabulary)] for i in range(count))
+
+
+class StubResponse:
+    def __init__(self, text):
+        self.text = text
+
+
+class StubGenerativeModel:
+    """google.generativeai.GenerativeModel: a deterministic answer after LATENCY["gemini"]."""
+
+    calls = 0
+
+    def __init__(self, model_name, **kwargs):
+        self.model_name = model_name
+
+    def _answer(self, contents, generation_config):
+        seed = _digest(contents)
+        visionary = "Process this audio input" in str(contents)
+        if visionary and seed % 5 == 0:
+            place = PLACES[seed % len(PLACES)]
+            answer, intent, location = f"Opening directions for {place}.", "navigate", place
+        else:
+            answer = f"{_words(seed, 12).capitalize()}. {_words(seed >> 3, 8).capitalize()}."
+            intent, location = "describe", None
+        if (generation_config or {}).get("response_mime_type") == "application/json":
+            return json.dumps({"intent": intent, "location": location, "language": "english", "answer": answer})
+        return f"{answer}\nEnglish" if visionary else answer
+
+    def generate_content(self, contents, stream=False, generation_config=None, **kwargs):
+        StubGenerativeModel.calls += 1
+        time.sleep(LATENCY["gemini"])
+        text = self._answer(contents, generation_config)
+        if not stream:
+            return StubResponse(text)
+        if "start your response with the name of the language" in str(contents):
+            text = "English\n" + text
+
+        def chunks():
+            for i, word in enumerate(text.split(" ")):
+                if i:
+                    time.sleep(LATENCY["gemini_token"])
+                yield StubResponse(word + " ")
+
+        return chunks()
+
+
+class _StubFile:
+    def __init__(self, name, mime_type):
+        self.name = name
+        self.uri = f"https://stub.invalid/files/{name}"
+        self.mime_type = mime_type
+        self.state = types.SimpleNamespace(name="ACTIVE")
+
+
+def _upload_file(path, mime_type=None, **kwargs):
+    time.sleep(LATENCY["gemini"])
+    return _StubFile(f"files/{_digest(path):08x}", mime_type)
+
+
+class StubLLM(CustomLLM):
+    """llama-index Gemini LLM: echoes part of the retrieved context back as the answer."""
+
+    model_name: str = "stub"
+
+    @property
+    def metadata(self):
+        return LLMMetadata(context_window=32768, num_output=512, model_name=self.model_name)
+
+    def _answer(self, prompt):
+        context = re.findall(r"[A-Za-z][\w-]+", prompt.split("Query:")[0])[-40:]
+        return "According to your documents, " + " ".join(context[:24]) + "."
+
+    def complete(self, prompt, formatted=False, **kwargs):
+        time.sleep(LATENCY["llm"])
+        return CompletionResponse(text=self._answer(prompt))
+
+    def stream_complete(self, prompt, formatted=False, **kwargs) -> CompletionResponseGen:
+        time.sleep(LATENCY["llm"])
+        text = ""
+        for i, word in enumerate(self._answer(prompt).split(" ")):
+            if i:
+                time.sleep(LATENCY["gemini_token"])
+            delta = word + " "
+            text += delta
+            yield CompletionResponse(text=text, delta=delta)
+
+
+class StubEmbedding(BaseEmbedding):
+    """
+    Hashed bag of alphabetic words, so texts sharing words get similar vectors. Digits and
+    short tokens are ignored, as dense models mostly do. Sleeps like a model when latency is on.
+    """
+
+    dim: int = 384
+    latency: bool = False
+
+    def _vector(self, text):
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for word in re.findall(r"[a-z]{3,}", text.lower()):
+            vector[zlib.crc32(word.encode()) % self.dim] += 1.0
+        return (vector / (np.linalg.norm(vector) or 1.0)).tolist()
+
+    def _get_query_embedding(self, query):
+        return self._get_text_embeddings([query])[0]
+
+    async def _aget_query_embedding(self, query):
+        return self._get_query_embedding(query)
+
+    def _get_text_embedding(self, text):
+        return self._get_text_embeddings([text])[0]
+
+    def _get_text_embeddings(self, texts):
+        if self.latency:
+            time.sleep(LATENCY["embed_call"] + LATENCY["embed_text"] * len(texts))
+        return [self._vector(text) for text in texts]
+
+
+class StubTextToSpeechClient:
+    """texttospeech_v1.TextToSpeechClient: about 200 bytes of "MP3" per character."""
+
+    calls = 0
+
+    def __init__(self, **kwargs):
+        pass
+
+    def synthesize_speech(self, input=None, voice=None, audio_config=None, **kwargs):
+        StubTextToSpeechClient.calls += 1
+        time.sleep(LATENCY["tts"])
+        text = input["text"]
+        seed = hashlib.sha256(text.encode()).digest()
+        return types.SimpleNamespace(audio_content=b"ID3" + seed * (len(text) * 200 // len(seed) + 1))
+
+
+def _module(name, **attributes):
+    module = types.ModuleType(name)
+    module.__dict__.update(attributes)
+    sys.modules[name] = module
+    parent, _, child = name.rpartition(".")
+    if parent:
+        setattr(_package(parent), child, module)
+    return module
+
+
+def _package(name):
+    # google, google.cloud and google.oauth2 may already exist as real namespace packages
+    try:
+        return importlib.import_module(name)
+    except ImportError:
+        return _module(name, __path__=[])
+
+
+def install(**latency):
+    """Replace the external SDKs with the stubs above. Call before importing main."""
+    LATENCY.update(latency)
+
+    _module(
+        "google.generativeai",
+        configure=lambda **kwargs: None,
+        GenerativeModel=StubGenerativeModel,
+        upload_file=_upload_file,
+        get_file=lambda name: _StubFile(name, None),
+        delete_file=lambda name: None,
+    )
+    _module(
+        "google.cloud.texttospeech_v1",
+        TextToSpeechClient=StubTextToSpeechClient,
+        SynthesisInput=lambda **kwargs: kwargs,
+        VoiceSelectionParams=lambda **kwargs: kwargs,
+        AudioConfig=lambda **kwargs: kwargs,
+        AudioEncoding=types.SimpleNamespace(MP3="MP3", OGG_OPUS="OGG_OPUS", LINEAR16="LINEAR16"),
+    )
+    _module(
+        "google.oauth2.service_account",
+        Credentials=types.SimpleNamespace(from_service_account_file=lambda path, **kwargs: None),
+    )
+    _module("llama_index.llms.gemini", Gemini=lambda **kwargs: StubLLM())
+    _module(
+        "llama_index.embeddings.huggingface",
+        HuggingFaceEmbedding=lambda model_name, **kwargs: StubEmbedding(model_name=model_name, latency=True),
+    )
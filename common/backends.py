@@ -0,0 +1,156 @@
+import asyncio
+import contextvars
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from common.telemetry import record_stage, span
+
+logger = logging.getLogger(__name__)
+
+# Default (max concurrency, timeout in seconds) for each blocking backend.
+# Override per backend with e.g. GEMINI_MAX_CONCURRENCY=16 / GEMINI_TIMEOUT=30.
+BACKEND_DEFAULTS = {
+    "gemini": (8, 60.0),
+    "rag": (4, 120.0),
+    "tts": (8, 20.0),
+    "images": (4, 10.0),
+    "audio": (4, 10.0),
+    # Reads and writes of the shared state database (common/shared_state.py)
+    "state": (4, 30.0),
+}
+
+
+class BackendTimeoutError(Exception):
+    pass
+
+
+class Backend:
+    """Runs blocking client calls in a bounded thread pool off the event loop."""
+
+    def __init__(self, name, max_concurrency, timeout):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix=f"{name}-backend")
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self.in_flight = 0
+
+    def _on_done(self, future):
+        self.in_flight -= 1
+        self._semaphore.release()
+        # Retrieve the result so abandoned (timed out) calls don't log "exception was never retrieved"
+        if not future.cancelled():
+            future.exception()
+
+    async def _submit(self, call):
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), self.timeout)
+        except asyncio.TimeoutError:
+            raise BackendTimeoutError(f"{self.name} backend is saturated ({self.max_concurrency} calls in flight)")
+
+        # The slot is released when the call actually finishes, not when we stop waiting for it,
+        # so a stuck upstream can never push more than max_concurrency threads onto the pool.
+        self.in_flight += 1
+        # Run the call in a copy of the caller's context so spans inside it join the request's trace
+        future = asyncio.get_running_loop().run_in_executor(self._executor, contextvars.copy_context().run, call)
+        future.add_done_callback(self._on_done)
+        return future
+
+    async def run(self, fn, *args, **kwargs):
+        timeout = self.timeout
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+
+        with span(self.name):
+            future = await self._submit(partial(fn, *args, **kwargs))
+
+            try:
+                return await asyncio.wait_for(asyncio.shield(future), max(deadline - loop.time(), 0))
+            except asyncio.TimeoutError:
+                logger.warning(f"{self.name} backend call timed out after {timeout}s")
+                raise BackendTimeoutError(f"{self.name} backend timed out after {timeout}s")
+
+    async def stream(self, fn, *args, **kwargs):
+        """Iterate a blocking generator on the pool, yielding its items as they arrive.
+
+        The slot is held for the whole stream; the timeout applies to the gap between items.
+        """
+        loop = asyncio.get_running_loop()
+        items = asyncio.Queue()
+        stopped = threading.Event()
+        finished = object()
+
+        def produce():
+            try:
+                for item in fn(*args, **kwargs):
+                    if stopped.is_set():
+                        break
+                    loop.call_soon_threadsafe(items.put_nowait, (item, None))
+            except BaseException as e:
+                loop.call_soon_threadsafe(items.put_nowait, (finished, e))
+            else:
+                loop.call_soon_threadsafe(items.put_nowait, (finished, None))
+
+        start = loop.time()
+        first = True
+        with span(self.name):
+            await self._submit(produce)
+
+            try:
+                while True:
+                    try:
+                        item, error = await asyncio.wait_for(items.get(), self.timeout)
+                    except asyncio.TimeoutError:
+                        logger.warning(f"{self.name} backend stream stalled for {self.timeout}s")
+                        raise BackendTimeoutError(f"{self.name} backend timed out after {self.timeout}s")
+                    if item is finished:
+                        if error is not None:
+                            raise error
+                        return
+                    if first:
+                        # Time to first token is what the user waits for
+                        record_stage(f"{self.name}_first_item", loop.time() - start)
+                        first = False
+                    yield item
+            finally:
+                # Stops the producer early when the client goes away mid-stream
+                stopped.set()
+
+
+_backends = {}
+
+
+def _env_number(name, default, cast):
+    value = os.getenv(name)
+    if not value:
+        return default
+    try:
+        return cast(value)
+    except ValueError:
+        logger.warning(f"Ignoring invalid value for {name}: {value!r}")
+        return default
+
+
+def get_backend(name):
+    backend = _backends.get(name)
+    if backend is None:
+        default_concurrency, default_timeout = BACKEND_DEFAULTS.get(name, (4, 60.0))
+        prefix = name.upper()
+        backend = Backend(
+            name,
+            max_concurrency=_env_number(f"{prefix}_MAX_CONCURRENCY", default_concurrency, int),
+            timeout=_env_number(f"{prefix}_TIMEOUT", default_timeout, float),
+        )
+        _backends[name] = backend
+    return backend
+
+
+async def run_blocking(backend_name, fn, *args, **kwargs):
+    return await get_backend(backend_name).run(fn, *args, **kwargs)
+
+
+def stream_blocking(backend_name, fn, *args, **kwargs):
+    return get_backend(backend_name).stream(fn, *args, **kwargs)
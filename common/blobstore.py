@@ -0,0 +1,68 @@
+import hashlib
+import json
+import os
+import re
+import tempfile
+
+import aiofiles
+
+CHUNK_SIZE = 1024 * 1024
+_HANDLE_PATTERN = re.compile(r"^[0-9a-f]{64}$")
+
+
+class BlobStore:
+    """
+    Content-addressed file store for uploads.
+
+    Uploads are streamed to disk in fixed-size chunks while being hashed, then renamed
+    to their SHA-256, which doubles as the handle returned to the client. Identical
+    uploads share one blob. A small JSON sidecar keeps the original filename and type.
+    """
+
+    def __init__(self, root_dir):
+        self.root_dir = root_dir
+        os.makedirs(os.path.join(root_dir, "tmp"), exist_ok=True)
+
+    def path(self, handle):
+        if not handle or not _HANDLE_PATTERN.match(handle):
+            raise ValueError("Invalid file handle")
+        return os.path.join(self.root_dir, handle[:2], handle)
+
+    def exists(self, handle):
+        try:
+            return os.path.exists(self.path(handle))
+        except ValueError:
+            return False
+
+    def metadata(self, handle):
+        with open(self.path(handle) + ".json") as meta_file:
+            return json.load(meta_file)
+
+    async def save_upload(self, upload, mime_type):
+        """Stream an UploadFile into the store and return (handle, size)."""
+        digest = hashlib.sha256()
+        size = 0
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.join(self.root_dir, "tmp"))
+        os.close(fd)
+        try:
+            async with aiofiles.open(tmp_path, "wb") as out:
+                while chunk := await upload.read(CHUNK_SIZE):
+                    digest.update(chunk)
+                    size += len(chunk)
+                    await out.write(chunk)
+
+            handle = digest.hexdigest()
+            blob_path = self.path(handle)
+            os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+            if os.path.exists(blob_path):
+                os.remove(tmp_path)
+            else:
+                os.replace(tmp_path, blob_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        with open(blob_path + ".json", "w") as meta_file:
+            json.dump({"filename": upload.filename, "mime_type": mime_type, "size": size}, meta_file)
+        return handle, size
@@ -0,0 +1,62 @@
+import asyncio
+import logging
+import os
+import random
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+# Upstream statuses worth another attempt; anything else is returned to the caller as is
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+_client = None
+_client_loop = None
+
+
+def get_http_client():
+    """Shared pooled AsyncClient for outbound API calls, created on first use."""
+    global _client, _client_loop
+    loop = asyncio.get_running_loop()
+    # Pooled connections belong to the loop that opened them
+    if _client is None or _client.is_closed or _client_loop is not loop:
+        _client = httpx.AsyncClient(
+            timeout=httpx.Timeout(float(os.getenv("HTTP_TIMEOUT", "10")), connect=float(os.getenv("HTTP_CONNECT_TIMEOUT", "3"))),
+            limits=httpx.Limits(
+                max_connections=int(os.getenv("HTTP_MAX_CONNECTIONS", "32")),
+                max_keepalive_connections=int(os.getenv("HTTP_MAX_KEEPALIVE", "16")),
+            ),
+        )
+        _client_loop = loop
+    return _client
+
+
+async def close_http_client():
+    global _client
+    if _client is not None and not _client.is_closed:
+        await _client.aclose()
+    _client = None
+
+
+async def get_json(url, params=None, retries=None, backoff=None):
+    """
+    GET url and decode the JSON body, retrying connection errors, timeouts and
+    RETRY_STATUSES with exponential backoff and jitter. Raises httpx.HTTPError once
+    the retries are used up.
+    """
+    retries = int(os.getenv("HTTP_RETRIES", "2")) if retries is None else retries
+    backoff = float(os.getenv("HTTP_RETRY_BACKOFF", "0.2")) if backoff is None else backoff
+    client = get_http_client()
+
+    for attempt in range(retries + 1):
+        try:
+            response = await client.get(url, params=params)
+            if response.status_code not in RETRY_STATUSES or attempt == retries:
+                response.raise_for_status()
+                return response.json()
+            logger.warning(f"GET {url} returned {response.status_code}, retrying")
+        except httpx.TransportError as e:
+            if attempt == retries:
+                raise
+            logger.warning(f"GET {url} failed ({e!r}), retrying")
+        await asyncio.sleep(backoff * 2 ** attempt * (0.5 + random.random()))
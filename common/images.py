@@ -0,0 +1,101 @@
+import io
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from PIL import Image, ImageOps
+
+# Gemini tiles images at roughly 768 px, so larger frames mostly cost upload time
+MAX_DIMENSION = int(os.getenv("IMAGE_MAX_DIMENSION", "1024"))
+JPEG_QUALITY = int(os.getenv("IMAGE_JPEG_QUALITY", "80"))
+PREPROCESS_IMAGES = os.getenv("IMAGE_PREPROCESS", "true").lower() != "false"
+
+# Animated or vector formats are passed through untouched
+_PREPROCESSED_TYPES = {"image/jpeg", "image/jpg", "image/png", "image/webp", "image/bmp", "image/tiff"}
+
+
+def dhash(image, size=8):
+    """64-bit difference hash; near-identical frames differ in only a few bits."""
+    small = image.convert("L").resize((size + 1, size), Image.BILINEAR)
+    pixels = list(small.getdata())
+    bits = 0
+    for row in range(size):
+        for col in range(size):
+            left = pixels[row * (size + 1) + col]
+            right = pixels[row * (size + 1) + col + 1]
+            bits = (bits << 1) | (left > right)
+    return bits
+
+
+def hamming(a, b):
+    return bin(a ^ b).count("1")
+
+
+def prepare_image(data, mime_type):
+    """
+    Downscale an image to MAX_DIMENSION, apply its EXIF orientation and re-encode it
+    without metadata. Returns (data, mime_type, dhash). Blocking; run it on the
+    images backend. Formats it doesn't handle come back unchanged with a None hash.
+    """
+    if not PREPROCESS_IMAGES or (mime_type or "").lower() not in _PREPROCESSED_TYPES:
+        return data, mime_type, None
+    try:
+        image = Image.open(io.BytesIO(data))
+        # Lets libjpeg decode straight to a reduced size instead of the full frame
+        image.draft("RGB", (MAX_DIMENSION, MAX_DIMENSION))
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((MAX_DIMENSION, MAX_DIMENSION), Image.LANCZOS)
+    except (OSError, ValueError, Image.DecompressionBombError):
+        return data, mime_type, None
+
+    # Keep transparency as PNG; everything else becomes a JPEG
+    if image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info):
+        out_format, out_mime = "PNG", "image/png"
+        save_kwargs = {"optimize": True}
+    else:
+        image = image.convert("RGB")
+        out_format, out_mime = "JPEG", "image/jpeg"
+        save_kwargs = {"quality": JPEG_QUALITY, "optimize": True}
+
+    # A fresh save carries no EXIF (GPS, device) unless it is passed in explicitly
+    buffer = io.BytesIO()
+    image.save(buffer, out_format, **save_kwargs)
+    return buffer.getvalue(), out_mime, dhash(image)
+
+
+class FrameCache:
+    """
+    Recent answers per scope, looked up by perceptual hash, so a frame that is nearly
+    identical to a recent one (within max_distance bits) can reuse its answer.
+    """
+
+    def __init__(self, max_scopes, max_distance, ttl, per_scope=8):
+        self.max_scopes = max_scopes
+        self.max_distance = max_distance
+        self.ttl = ttl
+        self.per_scope = per_scope
+        self._scopes = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, scope, frame_hash):
+        if frame_hash is None:
+            return None
+        now = time.time()
+        with self._lock:
+            for cached_hash, value, created_at in reversed(self._scopes.get(scope, [])):
+                if now - created_at <= self.ttl and hamming(cached_hash, frame_hash) <= self.max_distance:
+                    self._scopes.move_to_end(scope)
+                    return value
+        return None
+
+    def put(self, scope, frame_hash, value):
+        if frame_hash is None:
+            return
+        with self._lock:
+            entries = self._scopes.setdefault(scope, [])
+            entries.append((frame_hash, value, time.time()))
+            del entries[:-self.per_scope]
+            self._scopes.move_to_end(scope)
+            while len(self._scopes) > self.max_scopes:
+                self._scopes.popitem(last=False)
@@ -0,0 +1,247 @@
+import hashlib
+import json
+import re
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from common import shared_state
+from common.backends import run_blocking
+from common.shared_state import connect
+
+# Every cache registers itself here so its stats can be exposed in one place
+caches = {}
+
+
+def normalize_prompt(prompt):
+    return re.sub(r"\s+", " ", (prompt or "").strip().lower()).rstrip(" ?!.")
+
+
+def attachment_hash(*parts):
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part if isinstance(part, bytes) else str(part or "").encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class ResponseCache:
+    """
+    Size-bounded TTL cache for model responses.
+
+    Entries are keyed on (scope, index version, normalized prompt, attachment hash). A
+    scope is whatever owns the index (a Mate session, say); when a scope is seen with a
+    new index version its old entries are dropped, so answers never outlive the documents
+    they came from. With an embed_fn and a similarity threshold, prompts that miss the
+    exact lookup are compared by cosine similarity against cached prompts in the same
+    scope, version and attachment.
+
+    With shared=True, exact entries are also stored in the shared state database so
+    every worker process can answer from them; semantic lookups stay per process.
+    aget() and aput() do the database half on the state backend, off the event loop.
+    """
+
+    def __init__(self, name, max_entries, ttl, embed_fn=None, similarity_threshold=None, shared=True):
+        self.name = name
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.embed_fn = embed_fn
+        self.similarity_threshold = similarity_threshold
+        self.shared = shared
+        self.stats = {"hits": 0, "semantic_hits": 0, "shared_hits": 0, "misses": 0, "evictions": 0, "invalidations": 0}
+        self._entries = OrderedDict()
+        # Latest index version per scope, for invalidation; bounded like the entries. A scope that
+        # drops out only skips that cleanup: keys include the version, so stale entries never match
+        self._versions = OrderedDict()
+        self._puts = 0
+        self._lock = threading.Lock()
+        caches[name] = self
+
+    @property
+    def semantic(self):
+        return self.embed_fn is not None and bool(self.similarity_threshold)
+
+    def _key(self, scope, version, prompt, attachment):
+        return (scope, version, normalize_prompt(prompt), attachment or "")
+
+    def _db(self):
+        return connect() if self.shared else None
+
+    @property
+    def _uses_db(self):
+        return self.shared and bool(shared_state.STATE_DB)
+
+    @staticmethod
+    def _shared_key(key):
+        return hashlib.sha256(json.dumps(key, default=str).encode("utf-8")).hexdigest()
+
+    def _check_version(self, scope, version):
+        """Drop in-memory entries of older versions of scope; True if the version changed."""
+        changed = self._versions.pop(scope, version) != version
+        if changed:
+            stale = [key for key in self._entries if key[0] == scope and key[1] != version]
+            for key in stale:
+                del self._entries[key]
+            self.stats["invalidations"] += len(stale)
+        self._versions[scope] = version
+        while len(self._versions) > self.max_entries:
+            self._versions.popitem(last=False)
+        return changed
+
+    def _invalidate_shared(self, db, scope, version):
+        db.execute(
+            "DELETE FROM cache_entries WHERE cache = ? AND scope = ? AND version != ?",
+            (self.name, str(scope), str(version)),
+        )
+
+    def _get_memory(self, key, now):
+        # Returns (value or None, whether the scope's version changed)
+        with self._lock:
+            changed = self._check_version(key[0], key[1])
+            entry = self._entries.get(key)
+            if entry is not None and now - entry[2] <= self.ttl:
+                self._entries.move_to_end(key)
+                self.stats["hits"] += 1
+                return entry[0], changed
+            if entry is not None:
+                del self._entries[key]
+        return None, changed
+
+    def _get_shared(self, key, now, changed):
+        # Blocking: runs SQLite queries
+        db = self._db()
+        if db is None:
+            return None
+        if changed:
+            self._invalidate_shared(db, key[0], key[1])
+        row = db.execute(
+            "SELECT value, created_at FROM cache_entries WHERE cache = ? AND key = ?",
+            (self.name, self._shared_key(key)),
+        ).fetchone()
+        if row is None or now - row[1] > self.ttl:
+            return None
+        value = json.loads(row[0])
+        with self._lock:
+            self._entries[key] = (value, None, row[1])
+            self._trim()
+        return value
+
+    def _count_shared(self, value):
+        with self._lock:
+            if value is not None:
+                self.stats["shared_hits"] += 1
+            elif not self.semantic:
+                self.stats["misses"] += 1
+
+    def _put_memory(self, key, value, embedding, created_at):
+        with self._lock:
+            changed = self._check_version(key[0], key[1])
+            self._entries[key] = (value, embedding, created_at)
+            self._entries.move_to_end(key)
+            self._trim()
+        return changed
+
+    def _put_shared(self, key, value, created_at, changed):
+        # Blocking: runs SQLite queries
+        db = self._db()
+        if db is None:
+            return
+        if changed:
+            self._invalidate_shared(db, key[0], key[1])
+        db.execute(
+            "INSERT OR REPLACE INTO cache_entries (cache, key, scope, version, value, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+            (self.name, self._shared_key(key), str(key[0]), str(key[1]), json.dumps(value), created_at),
+        )
+        with self._lock:
+            self._puts += 1
+            cleanup = self._puts % 64 == 0
+        if cleanup:
+            # Every so often drop expired rows and everything beyond the newest max_entries
+            db.execute(
+                "DELETE FROM cache_entries WHERE cache = ? AND (created_at < ? OR key IN ("
+                "SELECT key FROM cache_entries WHERE cache = ? ORDER BY created_at DESC LIMIT -1 OFFSET ?))",
+                (self.name, created_at - self.ttl, self.name, self.max_entries),
+            )
+
+    def _trim(self):
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.stats["evictions"] += 1
+
+    def get(self, scope, version, prompt, attachment=""):
+        """Exact lookup in memory, then in the shared database; blocking, so use aget() on the event loop."""
+        key = self._key(scope, version, prompt, attachment)
+        now = time.time()
+        value, changed = self._get_memory(key, now)
+        if value is None:
+            value = self._get_shared(key, now, changed)
+            self._count_shared(value)
+        return value
+
+    def get_similar(self, scope, version, prompt, attachment=""):
+        """Semantic lookup; calls embed_fn, so run it off the event loop."""
+        query = np.asarray(self.embed_fn(normalize_prompt(prompt)), dtype=np.float32)
+        query /= np.linalg.norm(query) or 1.0
+        now = time.time()
+        with self._lock:
+            best_key, best_score = None, self.similarity_threshold
+            for key, (_, embedding, created_at) in self._entries.items():
+                if key[0] != scope or key[1] != version or key[3] != (attachment or ""):
+                    continue
+                if embedding is None or now - created_at > self.ttl:
+                    continue
+                score = float(np.dot(query, embedding))
+                if score >= best_score:
+                    best_key, best_score = key, score
+            if best_key is None:
+                self.stats["misses"] += 1
+                return None
+            self._entries.move_to_end(best_key)
+            self.stats["semantic_hits"] += 1
+            return self._entries[best_key][0]
+
+    def put(self, scope, version, prompt, value, attachment=""):
+        """Blocking (embeds the prompt, writes the shared database); use aput() on the event loop."""
+        embedding = None
+        if self.semantic:
+            embedding = np.asarray(self.embed_fn(normalize_prompt(prompt)), dtype=np.float32)
+            embedding /= np.linalg.norm(embedding) or 1.0
+        key = self._key(scope, version, prompt, attachment)
+        created_at = time.time()
+        changed = self._put_memory(key, value, embedding, created_at)
+        self._put_shared(key, value, created_at, changed)
+
+    async def aget(self, scope, version, prompt, attachment=""):
+        key = self._key(scope, version, prompt, attachment)
+        now = time.time()
+        value, changed = self._get_memory(key, now)
+        if value is None:
+            if self._uses_db:
+                value = await run_blocking("state", self._get_shared, key, now, changed)
+            self._count_shared(value)
+        if value is None and self.semantic:
+            value = await run_blocking("rag", self.get_similar, scope, version, prompt, attachment)
+        return value
+
+    async def aput(self, scope, version, prompt, value, attachment=""):
+        if self.semantic:
+            await run_blocking("rag", self.put, scope, version, prompt, value, attachment)
+            return
+        key = self._key(scope, version, prompt, attachment)
+        created_at = time.time()
+        changed = self._put_memory(key, value, None, created_at)
+        if self._uses_db:
+            await run_blocking("state", self._put_shared, key, value, created_at, changed)
+
+    def snapshot(self):
+        with self._lock:
+            hits = self.stats["hits"] + self.stats["semantic_hits"] + self.stats["shared_hits"]
+            lookups = hits + self.stats["misses"]
+            return {
+                **self.stats,
+                "size": len(self._entries),
+                "max_entries": self.max_entries,
+                "hit_rate": hits / lookups if lookups else 0.0,
+            }
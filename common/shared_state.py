@@ -0,0 +1,42 @@
+import os
+import sqlite3
+import threading
+
+# One SQLite file holds state that every worker process must see: response caches,
+# ingestion job status and each worker's metrics. Set STATE_DB empty to keep that state in process memory only.
+STATE_DB = os.getenv("STATE_DB", "storage/state.sqlite3")
+
+_local = threading.local()
+
+
+def connect(db_path=None):
+    """
+    Connection to the shared state database for the calling thread, or None when shared
+    state is disabled. Connections are never reused across threads or forked processes.
+    """
+    db_path = STATE_DB if db_path is None else db_path
+    if not db_path:
+        return None
+    connections = getattr(_local, "connections", None)
+    if connections is None or _local.pid != os.getpid():
+        connections = _local.connections = {}
+        _local.pid = os.getpid()
+    connection = connections.get(db_path)
+    if connection is None:
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        connection = sqlite3.connect(db_path, timeout=30, isolation_level=None)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS cache_entries ("
+            "cache TEXT, key TEXT, scope TEXT, version TEXT, value TEXT, created_at REAL, "
+            "PRIMARY KEY (cache, key))"
+        )
+        connection.execute("CREATE INDEX IF NOT EXISTS cache_entries_scope ON cache_entries (cache, scope, version)")
+        connection.execute("CREATE INDEX IF NOT EXISTS cache_entries_age ON cache_entries (cache, created_at)")
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS jobs (id TEXT PRIMARY KEY, session_id TEXT, record TEXT, updated_at REAL)"
+        )
+        connection.execute("CREATE TABLE IF NOT EXISTS metrics (pid INTEGER PRIMARY KEY, snapshot TEXT, updated_at REAL)")
+        connections[db_path] = connection
+    return connection
@@ -0,0 +1,180 @@
+import gzip
+import hashlib
+import mimetypes
+import os
+from urllib.parse import unquote
+
+from starlette.responses import Response
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "no-cache"
+COMPRESSIBLE_TYPES = ("text/", "application/javascript", "application/json", "image/svg+xml")
+# Re-read assets and templates from disk when they change (development)
+RELOAD = os.getenv("STATIC_RELOAD", "false").lower() == "true"
+
+# Every mounted asset directory registers itself here so templates can link to it by name
+assets = {}
+
+
+def accepted_encodings(accept_encoding):
+    encodings = set()
+    for part in (accept_encoding or "").split(","):
+        name, _, params = part.partition(";")
+        params = params.replace(" ", "")
+        if params.startswith("q="):
+            try:
+                if float(params[2:]) == 0:
+                    continue
+            except ValueError:
+                continue
+        encodings.add(name.strip().lower())
+    return encodings
+
+
+class Encoded:
+    """A response body with its gzip and brotli variants and an ETag per variant."""
+
+    def __init__(self, body, media_type):
+        self.body = body
+        self.media_type = media_type
+        self.digest = hashlib.sha256(body).hexdigest()
+        self.variants = {}
+        if media_type.startswith(COMPRESSIBLE_TYPES) and len(body) > 256:
+            if brotli is not None:
+                self.variants["br"] = brotli.compress(body, quality=11)
+            self.variants["gzip"] = gzip.compress(body, compresslevel=9, mtime=0)
+            self.variants = {name: data for name, data in self.variants.items() if len(data) < len(body)}
+
+    def etags(self):
+        return [f'"{self.digest[:20]}"'] + [f'"{self.digest[:20]}-{name}"' for name in self.variants]
+
+    def response(self, request_headers, cache_control, method="GET"):
+        headers = {"Cache-Control": cache_control, "Vary": "Accept-Encoding"}
+        if_none_match = request_headers.get("if-none-match", "")
+        if if_none_match:
+            offered = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+            if "*" in offered or offered & set(self.etags()):
+                headers["ETag"] = self.etags()[0]
+                return Response(status_code=304, headers=headers)
+
+        body, etag = self.body, self.etags()[0]
+        accepted = accepted_encodings(request_headers.get("accept-encoding"))
+        for name in ("br", "gzip"):
+            if name in self.variants and name in accepted:
+                body, etag = self.variants[name], f'"{self.digest[:20]}-{name}"'
+                headers["Content-Encoding"] = name
+                break
+        headers["ETag"] = etag
+        response = Response(body, headers=headers, media_type=self.media_type)
+        if method == "HEAD":
+            response.body = b""
+        return response
+
+
+class StaticAssets:
+    """
+    ASGI app serving one directory of static files from memory.
+
+    Every file is read, hashed and compressed once, when the app is created. Each
+    file is served under its own name with a revalidation policy, and under a
+    content-hashed name (app.js -> app.<hash>.js) that can be cached forever; use
+    url() or the static_url() template global to link to the latter. Only files
+    that were found at startup are served, so no request path reaches the
+    filesystem.
+    """
+
+    def __init__(self, directory, name, prefix):
+        self.directory = directory
+        self.name = name
+        self.prefix = prefix.rstrip("/")
+        self._files = {}
+        self._hashed = {}
+        self._mtimes = {}
+        for root, dirs, files in os.walk(directory):
+            dirs[:] = [d for d in dirs if not d.startswith(".")]
+            for filename in files:
+                if not filename.startswith("."):
+                    self._load(os.path.relpath(os.path.join(root, filename), directory).replace(os.sep, "/"))
+        assets[name] = self
+
+    def _load(self, path):
+        full_path = os.path.join(self.directory, path)
+        with open(full_path, "rb") as f:
+            body = f.read()
+        self._mtimes[path] = os.path.getmtime(full_path)
+        media_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+        if media_type.startswith("text/") or media_type == "application/javascript":
+            media_type += "; charset=utf-8"
+        encoded = Encoded(body, media_type)
+        stem, ext = os.path.splitext(path)
+        self._files[path] = encoded
+        self._hashed[path] = f"{stem}.{encoded.digest[:10]}{ext}"
+
+    def _lookup(self, path):
+        # Returns (asset, immutable) for a plain or a hashed file name
+        original, immutable = path, False
+        if path not in self._files:
+            stem, ext = os.path.splitext(path)
+            original = stem.rpartition(".")[0]
+            original += ext
+            if self._hashed.get(original) != path:
+                return None, False
+            immutable = True
+        if RELOAD:
+            self._reload(original)
+        return self._files[original], immutable
+
+    def _reload(self, path):
+        full_path = os.path.join(self.directory, path)
+        if os.path.exists(full_path) and os.path.getmtime(full_path) != self._mtimes[path]:
+            self._load(path)
+
+    def url(self, path):
+        if RELOAD and path in self._files:
+            self._reload(path)
+        return f"{self.prefix}/{self._hashed.get(path, path)}"
+
+    async def __call__(self, scope, receive, send):
+        path = scope["path"]
+        root_path = scope.get("root_path", "")
+        # Depending on the Starlette version, a mount either strips its prefix or moves it to root_path
+        if root_path and path.startswith(root_path + "/"):
+            path = path[len(root_path):]
+        path = unquote(path).lstrip("/")
+
+        headers = {key.decode("latin-1"): value.decode("latin-1") for key, value in scope["headers"]}
+        if scope["method"] not in ("GET", "HEAD"):
+            response = Response(status_code=405, headers={"Allow": "GET, HEAD"})
+        else:
+            encoded, immutable = self._lookup(path)
+            if encoded is None:
+                response = Response("Not Found", status_code=404, media_type="text/plain")
+            else:
+                response = encoded.response(headers, IMMUTABLE if immutable else REVALIDATE, scope["method"])
+        await response(scope, receive, send)
+
+
+def static_url(name, path):
+    """URL of a static file with its content hash in the name, e.g. static_url("static", "app.js")."""
+    return assets[name].url(path)
+
+
+_pages = {}
+
+
+def page_response(request, templates, name, **context):
+    """
+    Render a template that only depends on its context (not on the request) once, and
+    serve it compressed with an ETag, so repeat page loads are answered with a 304.
+    """
+    key = (id(templates), name, tuple(sorted(context.items())))
+    page = _pages.get(key)
+    if page is None or RELOAD:
+        html = templates.get_template(name).render(**context)
+        page = _pages[key] = Encoded(html.encode("utf-8"), "text/html; charset=utf-8")
+    return page.response(request.headers, REVALIDATE, request.method)
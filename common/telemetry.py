@@ -0,0 +1,413 @@
+import asyncio
+import contextvars
+import json
+import logging
+import os
+import re
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+from common.shared_state import connect
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+SIZE_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+# name -> (type, help, histogram buckets)
+METRICS = {
+    "http_requests_total": ("counter", "HTTP requests by method, route and status.", None),
+    "http_request_duration_seconds": ("histogram", "Time until the response is complete.", LATENCY_BUCKETS),
+    "stage_duration_seconds": ("histogram", "Time spent in each pipeline stage and backend call.", LATENCY_BUCKETS),
+    "stage_errors_total": ("counter", "Pipeline stages and backend calls that raised, by exception type.", None),
+    "stage_payload_bytes": ("histogram", "Bytes going into and coming out of pipeline stages.", SIZE_BUCKETS),
+    "backend_in_flight": ("gauge", "Blocking backend calls currently running.", None),
+    "cache_lookups_total": ("counter", "Cache lookups by cache and result.", None),
+    "cache_evictions_total": ("counter", "Entries evicted from each cache.", None),
+    "scene_frames_total": ("counter", "Visionary scene-mode frames by outcome (changed, unchanged, throttled).", None),
+    "scene_questions_total": ("counter", "Visionary scene-mode questions by what answered them.", None),
+}
+
+# Requests slower than this have their stacks sampled into PROFILE_DIR; 0 turns profiling off
+SLOW_REQUEST_MS = float(os.getenv("SLOW_REQUEST_PROFILE_MS", "0"))
+PROFILE_DIR = os.getenv("PROFILE_DIR", "storage/profiles")
+PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL_MS", "5")) / 1000
+# How often a worker copies its metrics into the shared state database for /metrics
+PUBLISH_INTERVAL = float(os.getenv("METRICS_PUBLISH_INTERVAL", "5"))
+
+# Stages recorded for the current request, in completion order: [(stage, seconds)]
+_trace = contextvars.ContextVar("trace", default=None)
+
+
+class Metrics:
+    """Counters, gauges and fixed-bucket histograms for one process."""
+
+    def __init__(self):
+        self.values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, name, labels, value=1.0):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.values[key] = self.values.get(key, 0.0) + value
+
+    def observe(self, name, labels, value):
+        buckets = METRICS[name][2]
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            # Per-bucket counts (not cumulative) followed by sum and count
+            counts = self.values.get(key)
+            if counts is None:
+                counts = self.values[key] = [0] * len(buckets) + [0.0, 0]
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            counts[-2] += value
+            counts[-1] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return [[name, list(labels), list(value) if isinstance(value, list) else value]
+                    for (name, labels), value in self.values.items()]
+
+
+metrics = Metrics()
+
+
+class Span:
+    __slots__ = ("stage", "attrs")
+
+    def __init__(self, stage, attrs):
+        self.stage = stage
+        self.attrs = attrs
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+
+@contextmanager
+def span(stage, **attrs):
+    """
+    Time a pipeline stage. Attributes set on the span are recorded too: bytes_in and
+    bytes_out as payload sizes, cache ("hit" or "miss") as a cache lookup for the stage.
+    """
+    current = Span(stage, attrs)
+    start = time.perf_counter()
+    try:
+        yield current
+    except (asyncio.CancelledError, GeneratorExit, KeyboardInterrupt, SystemExit):
+        raise
+    except BaseException as e:
+        metrics.inc("stage_errors_total", {"stage": stage, "error": type(e).__name__})
+        raise
+    finally:
+        record_stage(stage, time.perf_counter() - start, **current.attrs)
+
+
+def record_stage(stage, seconds, bytes_in=None, bytes_out=None, cache=None):
+    metrics.observe("stage_duration_seconds", {"stage": stage}, seconds)
+    if bytes_in is not None:
+        metrics.observe("stage_payload_bytes", {"stage": stage, "direction": "in"}, bytes_in)
+    if bytes_out is not None:
+        metrics.observe("stage_payload_bytes", {"stage": stage, "direction": "out"}, bytes_out)
+    if cache is not None:
+        metrics.inc("cache_lookups_total", {"cache": stage, "result": cache})
+    trace = _trace.get()
+    if trace is not None:
+        trace.append((stage, seconds))
+
+
+@contextmanager
+def request_trace():
+    """Collect the stages of one request (or one WebSocket query) into a list."""
+    trace = []
+    token = _trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _trace.reset(token)
+
+
+def summarize(trace):
+    """Total milliseconds and call count per stage, in the order the stages first finished."""
+    stages = {}
+    for stage, seconds in list(trace):
+        total, calls = stages.get(stage, (0.0, 0))
+        stages[stage] = (total + seconds * 1000, calls + 1)
+    return stages
+
+
+def current_timings():
+    """Milliseconds per stage so far in the current trace, for responses that report their own timings."""
+    return {stage: round(ms, 1) for stage, (ms, _) in summarize(_trace.get() or []).items()}
+
+
+def server_timing(trace, total_seconds):
+    entries = []
+    for stage, (ms, calls) in summarize(trace).items():
+        name = re.sub(r"[^A-Za-z0-9_.-]", "_", stage)
+        entries.append(f'{name};dur={ms:.1f}' + (f';desc="{calls} calls"' if calls > 1 else ""))
+    entries.append(f"total;dur={total_seconds * 1000:.1f}")
+    return ", ".join(entries)
+
+
+class StackSampler:
+    """
+    Samples the stacks of every thread while at least one slow request is running.
+
+    Each slow request gets its own collapsed-stack counter ("thread;frame;frame count"
+    lines, the input format of flamegraph.pl and speedscope).
+    """
+
+    def __init__(self, interval):
+        self.interval = interval
+        self._active = {}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self):
+        profile = {}
+        with self._lock:
+            self._active[id(profile)] = profile
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+                self._thread.start()
+        return profile
+
+    def stop(self, profile):
+        with self._lock:
+            self._active.pop(id(profile), None)
+        return profile
+
+    def _run(self):
+        names = {}
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                active = list(self._active.values())
+                if not active:
+                    self._thread = None
+                    return
+            if len(names) > 1000:
+                names.clear()
+            for thread in threading.enumerate():
+                names[thread.ident] = thread.name
+            me = threading.get_ident()
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                    frame = frame.f_back
+                line = ";".join([names.get(ident, str(ident))] + stack[::-1])
+                for profile in active:
+                    profile[line] = profile.get(line, 0) + 1
+
+
+_sampler = StackSampler(PROFILE_INTERVAL)
+
+
+def _write_profile(profile, method, route, seconds, trace):
+    stages = ", ".join(f"{stage} {ms:.0f} ms" for stage, (ms, _) in summarize(trace).items())
+    message = f"Slow request {method} {route} took {seconds * 1000:.0f} ms ({stages})"
+    if profile:
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        name = re.sub(r"[^A-Za-z0-9]+", "_", f"{method} {route}").strip("_")
+        path = os.path.join(PROFILE_DIR, f"{time.strftime('%Y%m%d-%H%M%S')}-{time.time_ns() % 10**9:09d}-{os.getpid()}-{name}.txt")
+        with open(path, "w") as f:
+            f.write("".join(f"{line} {count}\n" for line, count in sorted(profile.items())))
+        message += f"; profile in {path}"
+    logger.warning(message)
+
+
+def _route_label(scope):
+    # The path with its parameters put back as placeholders, e.g. /mate/jobs/{job_id}
+    if scope.get("route") is None:
+        if scope.get("endpoint") is None:
+            return "unmatched"
+        # A mounted app, e.g. the static files
+        return scope["root_path"][len(scope.get("app_root_path", "")):] + "/{path}"
+    path = scope["path"]
+    for name, value in scope.get("path_params", {}).items():
+        head, found, tail = path.rpartition(str(value))
+        if found:
+            path = f"{head}{{{name}}}{tail}"
+    return path
+
+
+class TelemetryMiddleware:
+    """
+    Times every HTTP request and adds a Server-Timing header with the stages that
+    finished before the response started. WebSocket connections are passed through;
+    the Visionary socket traces each query itself.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start_publisher()
+        start = time.perf_counter()
+        status = 500
+        profile = None
+
+        def start_profile():
+            nonlocal profile
+            profile = _sampler.start()
+
+        timer = asyncio.get_running_loop().call_later(SLOW_REQUEST_MS / 1000, start_profile) if SLOW_REQUEST_MS else None
+
+        with request_trace() as trace:
+            async def send_with_timing(message):
+                nonlocal status
+                if message["type"] == "http.response.start":
+                    status = message["status"]
+                    header = server_timing(trace, time.perf_counter() - start)
+                    message["headers"] = list(message.get("headers", [])) + [(b"server-timing", header.encode("latin-1"))]
+                await send(message)
+
+            try:
+                await self.app(scope, receive, send_with_timing)
+            finally:
+                seconds = time.perf_counter() - start
+                route = _route_label(scope)
+                metrics.inc("http_requests_total", {"method": scope["method"], "route": route, "status": str(status)})
+                metrics.observe("http_request_duration_seconds", {"method": scope["method"], "route": route}, seconds)
+                if timer is not None:
+                    timer.cancel()
+                if profile is not None:
+                    _write_profile(_sampler.stop(profile), scope["method"], route, seconds, trace)
+
+
+def collect():
+    """This process's metrics, including cache counters and backend gauges."""
+    from common.backends import _backends
+    from common.response_cache import caches
+
+    snapshot = metrics.snapshot()
+    for name, backend in _backends.items():
+        snapshot.append(["backend_in_flight", [["backend", name]], backend.in_flight])
+    for name, cache in caches.items():
+        stats = cache.snapshot()
+        for result in ("hits", "semantic_hits", "shared_hits", "disk_hits", "misses"):
+            if result in stats:
+                snapshot.append(["cache_lookups_total", [["cache", name], ["result", result]], stats[result]])
+        snapshot.append(["cache_evictions_total", [["cache", name]], stats.get("evictions", 0)])
+    return snapshot
+
+
+_published_at = 0.0
+_publisher = None
+
+
+def publish(force=False):
+    """Copy this process's metrics to the shared state database, at most every PUBLISH_INTERVAL."""
+    global _published_at
+    now = time.time()
+    if not force and now - _published_at < PUBLISH_INTERVAL:
+        return
+    db = connect()
+    if db is None:
+        return
+    _published_at = now
+    db.execute(
+        "INSERT OR REPLACE INTO metrics (pid, snapshot, updated_at) VALUES (?, ?, ?)",
+        (os.getpid(), json.dumps(collect()), now),
+    )
+
+
+async def _publish_loop():
+    while True:
+        await asyncio.sleep(max(PUBLISH_INTERVAL, 0.1))
+        try:
+            # SQLite can wait on another worker's lock; that must not hold up the event loop
+            await asyncio.to_thread(publish, True)
+        except Exception as e:
+            logger.warning(f"Could not publish metrics: {e}")
+
+
+def start_publisher():
+    """Publish this process's metrics from a background task on the running loop, if not already."""
+    global _publisher
+    loop = asyncio.get_running_loop()
+    if _publisher is None or _publisher.done() or _publisher.get_loop() is not loop:
+        # A fresh context keeps the task out of the trace of the request that started it
+        _publisher = contextvars.Context().run(loop.create_task, _publish_loop())
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _merge(snapshots):
+    merged = {}
+    for snapshot in snapshots:
+        for name, labels, value in snapshot:
+            key = (name, tuple(tuple(label) for label in labels))
+            if isinstance(value, list):
+                current = merged.setdefault(key, [0] * len(value))
+                merged[key] = [a + b for a, b in zip(current, value)]
+            else:
+                merged[key] = merged.get(key, 0) + value
+    return merged
+
+
+def _labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+def render_metrics():
+    """
+    Prometheus text exposition of the metrics of every live worker process sharing
+    STATE_DB (or of this process only when shared state is disabled). Blocking; reads SQLite.
+    """
+    snapshots = [collect()]
+    db = connect()
+    if db is not None:
+        publish(force=True)
+        snapshots = []
+        for pid, snapshot in db.execute("SELECT pid, snapshot FROM metrics").fetchall():
+            if pid == os.getpid() or _pid_alive(pid):
+                snapshots.append(json.loads(snapshot))
+            else:
+                db.execute("DELETE FROM metrics WHERE pid = ?", (pid,))
+
+    merged = _merge(snapshots)
+    lines = []
+    for name, (kind, help_text, buckets) in METRICS.items():
+        series = sorted((labels, value) for (metric, labels), value in merged.items() if metric == name)
+        if not series:
+            continue
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for labels, value in series:
+            if kind != "histogram":
+                lines.append(f"{name}{_labels(labels)} {value}")
+                continue
+            cumulative = 0
+            for bound, count in zip(buckets, value):
+                cumulative += count
+                lines.append(f"{name}_bucket{_labels(labels, [('le', bound)])} {cumulative}")
+            lines.append(f"{name}_bucket{_labels(labels, [('le', '+Inf')])} {value[-1]}")
+            lines.append(f"{name}_sum{_labels(labels)} {value[-2]}")
+            lines.append(f"{name}_count{_labels(labels)} {value[-1]}")
+    return "\n".join(lines) + "\n"
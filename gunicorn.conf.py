@@ -0,0 +1,41 @@
+"""gunicorn settings for serving the app from several worker processes.
+
+    gunicorn -c gunicorn.conf.py main:app
+    WEB_CONCURRENCY=8 gunicorn -c gunicorn.conf.py main:app
+
+Indexes, uploads, embeddings, synthesized speech, response caches and ingestion job
+status live on disk or in the shared state database (STATE_DB), so any worker can
+serve any request.
+"""
+import multiprocessing
+import os
+import sys
+
+bind = os.getenv("BIND", f"0.0.0.0:{os.getenv('PORT', '8000')}")
+workers = int(os.getenv("WEB_CONCURRENCY", str(min(4, multiprocessing.cpu_count()))))
+worker_class = "uvicorn_worker.UvicornWorker"
+# RAG queries and first-time model loads can take a while
+timeout = int(os.getenv("WEB_TIMEOUT", "180"))
+graceful_timeout = 30
+keepalive = 5
+
+# Import the app once in the master; workers are forked from it and share its memory copy-on-write
+preload_app = True
+
+
+def when_ready(server):
+    # Load the embedding weights before forking so all workers share one copy of them.
+    # Only the weights: the Gemini clients open gRPC channels, which must not cross a fork.
+    if os.getenv("MATE_PRELOAD_MODELS", "true").lower() == "true":
+        os.environ.setdefault("TOKENIZERS_PARALLELISM", "false")
+        from multimodal_mate.models import get_embed_model
+
+        get_embed_model()
+        server.log.info("Loaded embedding model in the master process")
+
+
+def post_fork(server, worker):
+    # Split the cores between workers instead of letting every worker's torch use all of them
+    torch = sys.modules.get("torch")
+    if torch is not None:
+        torch.set_num_threads(max(1, multiprocessing.cpu_count() // workers))
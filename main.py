@@ -1,10 +1,19 @@
+import asyncio
 import os
+import sys
+
+if __name__ == "__main__":
+    # Serve through uvicorn's module entry point rather than from this script: the document
+    # parsing processes ingestion spawns re-import __main__, and importing this file builds the
+    # whole app, while uvicorn's __main__ is skipped
+    app_dir = os.path.dirname(os.path.abspath(__file__))
+    os.execv(sys.executable, [sys.executable, "-m", "uvicorn", "main:app", "--app-dir", app_dir,
+                              "--host", "0.0.0.0", "--port", "8000"])
+
 from fastapi import FastAPI, Request
-from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from starlette.middleware.cors import CORSMiddleware
-from starlette.responses import HTMLResponse
-from fastapi.responses import FileResponse
+from starlette.responses import HTMLResponse, PlainTextResponse
 from dotenv import load_dotenv
 
 # Load environment variables
@@ -13,13 +22,17 @@ load_dotenv()
 # Import routers
 from multimodal_mate.mate import mate_router, set_templates as set_mate_templates
 from visionary.visionary import visionary_router, set_templates as set_visionary_templates
+from common.response_cache import caches as response_caches
+from common.telemetry import TelemetryMiddleware, render_metrics
+from common.static_assets import StaticAssets, page_response, static_url
 
 app = FastAPI()
 
-# Mount static files
-app.mount("/static", StaticFiles(directory="static"), name="static")
-app.mount("/mate/static", StaticFiles(directory="multimodal_mate/static"), name="mate_static")
-app.mount("/visionary/static", StaticFiles(directory="visionary/static"), name="visionary_static")
+# Static files are hashed and compressed once at startup and served from memory;
+# templates link to them with static_url(), under names that change with their content
+app.mount("/static", StaticAssets("static", "static", "/static"), name="static")
+app.mount("/mate/static", StaticAssets("multimodal_mate/static", "mate_static", "/mate/static"), name="mate_static")
+app.mount("/visionary/static", StaticAssets("visionary/static", "visionary_static", "/visionary/static"), name="visionary_static")
 
 # Templates directory for the main app
 main_templates = Jinja2Templates(directory="templates")
@@ -31,6 +44,9 @@ mate_templates.env.loader.searchpath.append("templates")  # Add root templates d
 visionary_templates = Jinja2Templates(directory="visionary/templates")
 visionary_templates.env.loader.searchpath.append("templates")  # Add root templates directory
 
+for templates in (main_templates, mate_templates, visionary_templates):
+    templates.env.globals["static_url"] = static_url
+
 # Set the templates for both routers
 set_mate_templates(mate_templates)
 set_visionary_templates(visionary_templates)
@@ -42,30 +58,26 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing"],
 )
+# Request and pipeline stage timings for /metrics and the Server-Timing header
+app.add_middleware(TelemetryMiddleware)
 
 # Homepage route
 @app.get("/", response_class=HTMLResponse)
 async def read_home(request: Request):
-    return main_templates.TemplateResponse("index.html", {"request": request})
+    return page_response(request, main_templates, "index.html")
+
+# Hit/miss counters for the response caches
+@app.get("/cache/stats")
+async def cache_stats():
+    return {name: cache.snapshot() for name, cache in response_caches.items()}
+
+# Prometheus metrics, summed over all worker processes
+@app.get("/metrics")
+async def metrics():
+    return PlainTextResponse(await asyncio.to_thread(render_metrics), media_type="text/plain; version=0.0.4")
 
 # Include routers
 app.include_router(mate_router, prefix="/mate")
 app.include_router(visionary_router, prefix="/visionary")
-
-# Add these functions to generate URLs for static files
-@app.get("/static/{path:path}")
-async def static_files(path: str):
-    return FileResponse(f"static/{path}")
-
-@app.get("/mate/static/{path:path}")
-async def mate_static_files(path: str):
-    return FileResponse(f"multimodal_mate/static/{path}")
-
-@app.get("/visionary/static/{path:path}")
-async def visionary_static_files(path: str):
-    return FileResponse(f"visionary/static/{path}")
-
-if __name__ == "__main__":
-    import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
@@ -0,0 +1,240 @@
+import asyncio
+import hashlib
+import os
+import queue
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, List
+
+import numpy as np
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from pydantic import PrivateAttr
+
+
+class MicroBatcher:
+    """
+    Collects embedding requests from concurrent threads into one model call.
+
+    The first request opens a window of `window` seconds; everything submitted before it
+    closes (up to max_batch texts) is embedded together on a single worker thread.
+    """
+
+    def __init__(self, embed_fn, max_batch, window):
+        self.embed_fn = embed_fn
+        self.max_batch = max_batch
+        self.window = window
+        self._queue = queue.Queue()
+        self._thread = None
+        self._thread_lock = threading.Lock()
+
+    def submit(self, texts):
+        with self._thread_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="embed-batcher", daemon=True)
+                self._thread.start()
+        future = Future()
+        self._queue.put((texts, future))
+        return future.result()
+
+    def _run(self):
+        while True:
+            pending = [self._queue.get()]
+            size = len(pending[0][0])
+            deadline = time.monotonic() + self.window
+            while size < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                pending.append(item)
+                size += len(item[0])
+
+            texts = [text for item_texts, _ in pending for text in item_texts]
+            try:
+                embeddings = []
+                for start in range(0, len(texts), self.max_batch):
+                    embeddings.extend(self.embed_fn(texts[start:start + self.max_batch]))
+            except Exception as e:
+                for _, future in pending:
+                    future.set_exception(e)
+                continue
+
+            offset = 0
+            for item_texts, future in pending:
+                future.set_result(embeddings[offset:offset + len(item_texts)])
+                offset += len(item_texts)
+
+
+class EmbeddingCache:
+    """In-memory LRU in front of an optional SQLite store, keyed by a hash of model and text."""
+
+    def __init__(self, model_name, max_entries, db_path=None):
+        self.model_name = model_name
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._db_path = db_path
+        self._local = threading.local()
+
+    def _connection(self):
+        # One connection per thread, so SQLite reads and writes don't serialise on the LRU lock.
+        # A connection inherited from a pre-forking parent (gunicorn --preload) must not be used
+        if not self._db_path:
+            return None
+        if getattr(self._local, "pid", None) != os.getpid():
+            os.makedirs(os.path.dirname(self._db_path) or ".", exist_ok=True)
+            db = sqlite3.connect(self._db_path, timeout=30)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB)")
+            self._local.db = db
+            self._local.pid = os.getpid()
+        return self._local.db
+
+    def key(self, kind, text):
+        return hashlib.sha256(f"{self.model_name}\0{kind}\0{text}".encode("utf-8")).hexdigest()
+
+    def get_many(self, keys):
+        found = {}
+        missing = []
+        with self._lock:
+            for key in keys:
+                if key in self._entries:
+                    self._entries.move_to_end(key)
+                    found[key] = self._entries[key]
+                else:
+                    missing.append(key)
+        loaded = []
+        db = self._connection()
+        if missing and db is not None:
+            placeholders = ",".join("?" * len(missing))
+            rows = db.execute(f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", missing).fetchall()
+            loaded = [(key, np.frombuffer(blob, dtype=np.float32).tolist()) for key, blob in rows]
+            found.update(loaded)
+        with self._lock:
+            for key, embedding in loaded:
+                self._remember(key, embedding)
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        return found
+
+    def put_many(self, items):
+        with self._lock:
+            for key, embedding in items:
+                self._remember(key, embedding)
+        db = self._connection()
+        if db is not None:
+            with db:
+                db.executemany(
+                    "INSERT OR IGNORE INTO embeddings (key, vector) VALUES (?, ?)",
+                    [(key, np.asarray(embedding, dtype=np.float32).tobytes()) for key, embedding in items],
+                )
+
+    def _remember(self, key, embedding):
+        self._entries[key] = embedding
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+
+class BatchingEmbedding(BaseEmbedding):
+    """
+    Embedding service in front of another llama-index embedding model.
+
+    Results are cached by text hash, and cache misses from concurrent callers are
+    micro-batched into shared model calls. For symmetric models such as MiniLM, queries
+    are embedded as text, so they share the batched path and the cache with chunks.
+    """
+
+    symmetric: bool = True
+    _inner: Any = PrivateAttr()
+    _cache: Any = PrivateAttr()
+    _batcher: Any = PrivateAttr()
+
+    def __init__(self, inner, cache, max_batch=64, window=0.005, symmetric=True, **kwargs):
+        # The batcher does the batching, so let llama-index hand over whole lists
+        super().__init__(model_name=inner.model_name, embed_batch_size=1024, symmetric=symmetric, **kwargs)
+        self._inner = inner
+        self._cache = cache
+        self._batcher = MicroBatcher(inner._get_text_embeddings, max_batch, window)
+
+    @classmethod
+    def class_name(cls):
+        return "BatchingEmbedding"
+
+    @property
+    def cache(self):
+        return self._cache
+
+    def _embed(self, kind, texts):
+        keys = [self._cache.key(kind, text) for text in texts]
+        found = self._cache.get_many(keys)
+
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in found:
+                missing.setdefault(key, text)
+        if missing:
+            if kind == "text":
+                embeddings = self._batcher.submit(list(missing.values()))
+            else:
+                embeddings = [self._inner.get_query_embedding(text) for text in missing.values()]
+            computed = list(zip(missing.keys(), embeddings))
+            self._cache.put_many(computed)
+            found.update(computed)
+        return [found[key] for key in keys]
+
+    def _get_query_embedding(self, query: str) -> List[float]:
+        return self._embed("text" if self.symmetric else "query", [query])[0]
+
+    def _get_text_embedding(self, text: str) -> List[float]:
+        return self._embed("text", [text])[0]
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        return self._embed("text", texts)
+
+    async def _aget_query_embedding(self, query: str) -> List[float]:
+        return await asyncio.to_thread(self._get_query_embedding, query)
+
+    async def _aget_text_embedding(self, text: str) -> List[float]:
+        return await asyncio.to_thread(self._get_text_embedding, text)
+
+
+def build_hf_model(model_name):
+    from llama_index.embeddings.huggingface import HuggingFaceEmbedding
+
+    kwargs = {}
+    # "onnx" or "openvino" run on CPU without torch kernels; MATE_EMBED_ONNX_FILE selects a
+    # quantized export such as onnx/model_qint8_avx512_vnni.onnx
+    backend = os.getenv("MATE_EMBED_BACKEND", "torch")
+    if backend != "torch":
+        kwargs["backend"] = backend
+        onnx_file = os.getenv("MATE_EMBED_ONNX_FILE")
+        if onnx_file:
+            kwargs["model_kwargs"] = {"file_name": onnx_file}
+    return HuggingFaceEmbedding(model_name=model_name, **kwargs)
+
+
+def build_embedding_service(model_name):
+    """Build the HuggingFace model behind a BatchingEmbedding, configured from the environment."""
+    inner = build_hf_model(model_name)
+    backend = os.getenv("MATE_EMBED_BACKEND", "torch")
+
+    cache = EmbeddingCache(
+        model_name=f"{model_name}:{backend}:{os.getenv('MATE_EMBED_ONNX_FILE', '')}",
+        max_entries=int(os.getenv("MATE_EMBED_CACHE_SIZE", "20000")),
+        db_path=os.getenv("MATE_EMBED_CACHE_DB", "storage/embeddings.sqlite3") or None,
+    )
+    return BatchingEmbedding(
+        inner,
+        cache,
+        max_batch=int(os.getenv("MATE_EMBED_MAX_BATCH", "64")),
+        window=float(os.getenv("MATE_EMBED_BATCH_WINDOW_MS", "5")) / 1000,
+    )
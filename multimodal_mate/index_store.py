@@ -0,0 +1,295 @@
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+CHUNKS_FILE = "chunks.jsonl"
+EMBEDDINGS_FILE = "embeddings.f32"
+LOCK_FILE = ".lock"
+
+# Query engine settings shared by every index
+SIMILARITY_TOP_K = int(os.getenv("MATE_SIMILARITY_TOP_K", "2"))
+RESPONSE_MODE = os.getenv("MATE_RESPONSE_MODE", "compact")
+RERANK_MODEL = os.getenv("MATE_RERANK_MODEL")
+RERANK_TOP_N = int(os.getenv("MATE_RERANK_TOP_N", str(SIMILARITY_TOP_K)))
+# Chunking, in tokens; changing it only affects documents uploaded afterwards
+CHUNK_SIZE = int(os.getenv("MATE_CHUNK_SIZE", "1024"))
+CHUNK_OVERLAP = int(os.getenv("MATE_CHUNK_OVERLAP", "200"))
+# Metadata that places a chunk in a document; the same text in another file or page is kept
+# as its own chunk so a filter on that file or page still finds it
+LOCATION_KEYS = ("file_name", "page_label")
+
+_reranker = None
+_reranker_lock = threading.Lock()
+
+
+def get_reranker():
+    # Cross-encoder weights are loaded once and shared by all query engines
+    global _reranker
+    with _reranker_lock:
+        if _reranker is None and RERANK_MODEL:
+            from llama_index.core.postprocessor import SentenceTransformerRerank
+
+            _reranker = SentenceTransformerRerank(model=RERANK_MODEL, top_n=RERANK_TOP_N)
+    return _reranker
+
+
+def build_node_parser():
+    from llama_index.core.node_parser import SentenceSplitter
+
+    return SentenceSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+
+
+# llama-index is imported inside the methods that need it, so the app can import this module
+# (and serve everything that doesn't touch an index) without loading it
+
+
+def chunk_hash(text, metadata=None):
+    location = {key: metadata[key] for key in LOCATION_KEYS if key in metadata} if metadata else {}
+    if location:
+        text += "\0" + json.dumps(location, sort_keys=True, default=str)
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class PersistentIndex:
+    """
+    Append-only on-disk vector index.
+
+    Chunks are stored one JSON line each in chunks.jsonl, with their embeddings as
+    float32 rows in embeddings.f32 (row i belongs to line i). Chunk ids are hashes of
+    the text and its file and page, so re-uploading a document only embeds chunks that
+    were never seen before, and every write appends instead of rewriting the whole store. The in-memory
+    VectorStoreIndex, and the BM25 KeywordIndex next to it, are built lazily on first
+    use and caught up from the tail of the files when another worker has appended to them.
+    """
+
+    def __init__(self, persist_dir):
+        self.persist_dir = persist_dir
+        self._index = None
+        self._keywords = None
+        self._hashes = set()
+        self._rows = 0
+        self._chunks_offset = 0
+        self._dim = None
+        self._query_engines = {}
+        self._lock = threading.RLock()
+
+    @property
+    def version(self):
+        # Size of the append-only chunks file: grows with every insert by any worker and,
+        # unlike the loaded row count, doesn't go back to 0 when the index is unloaded
+        try:
+            return os.path.getsize(self._path(CHUNKS_FILE))
+        except OSError:
+            return 0
+
+    @property
+    def has_documents(self):
+        """Cheap check that doesn't load the index: has anything been written to this store?"""
+        chunks_path = self._path(CHUNKS_FILE)
+        return self._rows > 0 or (os.path.exists(chunks_path) and os.path.getsize(chunks_path) > 0)
+
+    @property
+    def memory_bytes(self):
+        # Rough resident size: chunk JSON plus embeddings held as Python float lists (~32 bytes each)
+        return self._chunks_offset + self._rows * (self._dim or 0) * 32
+
+    def unload(self):
+        """Drop the in-memory index; everything is already on disk and reloads on next use."""
+        with self._lock:
+            self._index = None
+            self._keywords = None
+            self._query_engines = {}
+            self._hashes = set()
+            self._rows = 0
+            self._chunks_offset = 0
+
+    def _path(self, name):
+        return os.path.join(self.persist_dir, name)
+
+    @contextmanager
+    def _file_lock(self):
+        # Serialises writers across worker processes sharing the same directory
+        os.makedirs(self.persist_dir, exist_ok=True)
+        with open(self._path(LOCK_FILE), "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _read_new_chunks(self):
+        from llama_index.core.schema import TextNode
+
+        chunks_path = self._path(CHUNKS_FILE)
+        if not os.path.exists(chunks_path) or os.path.getsize(chunks_path) <= self._chunks_offset:
+            return []
+
+        with open(chunks_path, "rb") as chunks_file:
+            chunks_file.seek(self._chunks_offset)
+            lines = []
+            for line in chunks_file:
+                if not line.endswith(b"\n"):
+                    # Partially written line from a concurrent writer; pick it up next time
+                    break
+                lines.append(line)
+                self._chunks_offset += len(line)
+
+        if not lines:
+            return []
+
+        records = [json.loads(line) for line in lines]
+        if self._dim is None:
+            self._dim = records[0]["dim"]
+        embeddings = np.memmap(
+            self._path(EMBEDDINGS_FILE),
+            dtype=np.float32,
+            mode="r",
+            offset=self._rows * self._dim * 4,
+            shape=(len(records), self._dim),
+        )
+
+        nodes = []
+        for record, embedding in zip(records, embeddings):
+            node = TextNode.from_dict(record["node"])
+            node.embedding = embedding.tolist()
+            nodes.append(node)
+            self._hashes.add(node.node_id)
+        self._rows += len(records)
+        return nodes
+
+    def _add_to_indexes(self, nodes):
+        from llama_index.core import VectorStoreIndex
+        from multimodal_mate.retrieval import KeywordIndex
+
+        if self._index is None:
+            self._index = VectorStoreIndex(nodes)
+            self._keywords = KeywordIndex()
+        else:
+            self._index.insert_nodes(nodes)
+        self._keywords.add(nodes)
+
+    def _refresh(self):
+        new_nodes = self._read_new_chunks()
+        if not new_nodes:
+            return
+        self._add_to_indexes(new_nodes)
+        logger.info(f"Loaded {len(new_nodes)} chunks from {self.persist_dir} ({self._rows} total)")
+
+    def get(self):
+        """Return the VectorStoreIndex, or None if nothing has been indexed yet."""
+        with self._lock:
+            self._refresh()
+            return self._index
+
+    def retriever(self, filters=None, top_k=SIMILARITY_TOP_K, mode=None):
+        """
+        Hybrid (vector + BM25) retriever over this index, or None if nothing has been indexed
+        yet. filters restricts results to chunks whose metadata matches, e.g.
+        {"file_name": "parts.xlsx"} or {"file_name": "manual.pdf", "page_label": ["3", "4"]}.
+        """
+        from multimodal_mate.retrieval import RETRIEVAL_MODE, HybridRetriever
+
+        with self._lock:
+            self._refresh()
+            if self._index is None:
+                return None
+            return HybridRetriever(self._index, self._keywords, top_k, filters=filters, mode=mode or RETRIEVAL_MODE)
+
+    def query_engine(self, streaming=False, filters=None):
+        """
+        Return a query engine for this index, or None if nothing has been indexed yet.
+
+        Unfiltered engines are reused until the index changes. The retriever snapshots the
+        node ids it may return when it is built, so a new engine is needed after every insert.
+        """
+        from llama_index.core.query_engine import RetrieverQueryEngine
+
+        with self._lock:
+            self._refresh()
+            if self._index is None:
+                return None
+            key = (self._rows, streaming)
+            engine = None if filters else self._query_engines.get(key)
+            if engine is None:
+                reranker = get_reranker()
+                engine = RetrieverQueryEngine.from_args(
+                    # Retrieve a wider candidate set when a cross-encoder narrows it down afterwards
+                    self.retriever(filters, max(SIMILARITY_TOP_K, RERANK_TOP_N * 3) if reranker else SIMILARITY_TOP_K),
+                    response_mode=RESPONSE_MODE,
+                    node_postprocessors=[reranker] if reranker else [],
+                    streaming=streaming,
+                )
+                if not filters:
+                    self._query_engines = {k: v for k, v in self._query_engines.items() if k[0] == self._rows}
+                    self._query_engines[key] = engine
+            return engine
+
+    def insert_documents(self, documents):
+        """Chunk, deduplicate, embed and append documents. Returns the number of new chunks."""
+        return self.insert_nodes(build_node_parser().get_nodes_from_documents(documents))
+
+    def insert_nodes(self, nodes):
+        """Deduplicate, embed and append already-chunked nodes. Returns the number of new chunks."""
+        from llama_index.core import Settings
+        from llama_index.core.schema import MetadataMode
+
+        with self._lock, self._file_lock():
+            self._refresh()
+
+            new_nodes = []
+            for node in nodes:
+                node.id_ = chunk_hash(node.get_content(metadata_mode=MetadataMode.NONE), node.metadata)
+                if node.id_ not in self._hashes:
+                    self._hashes.add(node.id_)
+                    new_nodes.append(node)
+
+            logger.info(f"{len(new_nodes)} new chunks out of {len(nodes)} ({len(nodes) - len(new_nodes)} already indexed)")
+            if not new_nodes:
+                return 0
+
+            texts = [node.get_content(metadata_mode=MetadataMode.EMBED) for node in new_nodes]
+            try:
+                embeddings = Settings.embed_model.get_text_embedding_batch(texts)
+            except Exception:
+                for node in new_nodes:
+                    self._hashes.discard(node.id_)
+                raise
+
+            for node, embedding in zip(new_nodes, embeddings):
+                node.embedding = embedding
+            self._append(new_nodes)
+            self._add_to_indexes(new_nodes)
+            return len(new_nodes)
+
+    def _append(self, nodes):
+        self._dim = self._dim or len(nodes[0].embedding)
+        matrix = np.asarray([node.embedding for node in nodes], dtype=np.float32)
+
+        # Embeddings first: a reader only trusts rows for which a complete chunk line exists.
+        # Truncating drops rows left behind by a writer that died before its chunk lines landed.
+        with open(self._path(EMBEDDINGS_FILE), "ab") as embeddings_file:
+            embeddings_file.truncate(self._rows * self._dim * 4)
+            embeddings_file.write(matrix.tobytes())
+            embeddings_file.flush()
+            os.fsync(embeddings_file.fileno())
+
+        lines = []
+        for node in nodes:
+            record = node.to_dict()
+            record["embedding"] = None
+            lines.append(json.dumps({"dim": self._dim, "node": record}) + "\n")
+        payload = "".join(lines).encode("utf-8")
+        with open(self._path(CHUNKS_FILE), "ab") as chunks_file:
+            chunks_file.write(payload)
+            chunks_file.flush()
+            os.fsync(chunks_file.fileno())
+        self._chunks_offset += len(payload)
+        self._rows += len(nodes)
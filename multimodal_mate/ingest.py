@@ -0,0 +1,255 @@
+import asyncio
+import contextvars
+import json
+import logging
+import multiprocessing
+import os
+import tempfile
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from common.backends import run_blocking
+from common.shared_state import connect
+from common.telemetry import span
+
+logger = logging.getLogger(__name__)
+
+
+def parse_and_chunk(blob_path, filename):
+    """Parse (and OCR) a stored upload and split it into chunks. Runs in a worker process."""
+    from llama_index.core import SimpleDirectoryReader
+    from multimodal_mate.index_store import build_node_parser
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        # SimpleDirectoryReader picks a parser by extension, so expose the blob under its original name
+        os.symlink(os.path.abspath(blob_path), os.path.join(temp_dir, os.path.basename(filename)))
+        documents = SimpleDirectoryReader(temp_dir).load_data()
+    if not documents:
+        return [], ""
+    nodes = build_node_parser().get_nodes_from_documents(documents)
+    preview = documents[0].text[:500] + "..." if len(documents[0].text) > 500 else documents[0].text
+    return nodes, preview
+
+
+def _load_job(job_id):
+    db = connect()
+    if db is None:
+        return None
+    return db.execute("SELECT session_id, record FROM jobs WHERE id = ?", (job_id,)).fetchone()
+
+
+def _store_job(job_id, session_id, record, updated_at, finished):
+    db = connect()
+    if db is None:
+        return
+    # Saves of one job can finish out of order on the state backend; an older record never replaces a newer one
+    db.execute(
+        "INSERT INTO jobs (id, session_id, record, updated_at) VALUES (?, ?, ?, ?) "
+        "ON CONFLICT (id) DO UPDATE SET record = excluded.record, updated_at = excluded.updated_at "
+        "WHERE excluded.updated_at >= jobs.updated_at",
+        (job_id, session_id, record, updated_at),
+    )
+    if finished:
+        # Finished jobs are kept for a day so late polls still get an answer
+        db.execute("DELETE FROM jobs WHERE updated_at < ?", (updated_at - 86400,))
+
+
+class IngestionJob:
+    def __init__(self, session_id, filename, blob_path):
+        self.id = uuid.uuid4().hex
+        self.session_id = session_id
+        self.filename = filename
+        self.blob_path = blob_path
+        self.status = "queued"
+        self.total_chunks = 0
+        self.processed_chunks = 0
+        self.new_chunks = 0
+        self.content_preview = None
+        self.error = None
+        self.created_at = time.time()
+        self.finished_at = None
+
+    @classmethod
+    def from_record(cls, session_id, record):
+        """Read-only copy of a job owned by another worker process."""
+        job = cls(session_id, record["filename"], None)
+        job.id = record["job_id"]
+        job.status = record["status"]
+        job.total_chunks = record["total_chunks"]
+        job.processed_chunks = record["processed_chunks"]
+        job.new_chunks = record["new_chunks"]
+        job.content_preview = record["content_preview"]
+        job.error = record["error"]
+        return job
+
+    def to_dict(self):
+        return {
+            "job_id": self.id,
+            "filename": self.filename,
+            "status": self.status,
+            "total_chunks": self.total_chunks,
+            "processed_chunks": self.processed_chunks,
+            "new_chunks": self.new_chunks,
+            "progress": self.processed_chunks / self.total_chunks if self.total_chunks else 0.0,
+            "content_preview": self.content_preview,
+            "error": self.error,
+        }
+
+
+class IngestionQueueFull(Exception):
+    pass
+
+
+class IngestionManager:
+    """
+    Two-stage background ingestion: parsing/OCR/chunking in a process pool, then
+    embedding in batches on the rag backend. Each batch is inserted into the index as
+    soon as it is embedded, so a document becomes queryable while it is still being
+    ingested. Both stages are fed by bounded queues; when the parse queue is full new
+    uploads are rejected instead of piling up.
+
+    Job status is mirrored to the shared state database on every change, so any worker
+    process can answer a status poll for a job another worker is running.
+    """
+
+    def __init__(self, indexes, processes, max_pending, embed_batch_size, max_finished_jobs=1000):
+        self.indexes = indexes
+        self.processes = processes
+        self.embed_batch_size = embed_batch_size
+        self.max_pending = max_pending
+        self.max_finished_jobs = max_finished_jobs
+        self.jobs = OrderedDict()
+        self._executor = None
+        self._parse_queue = None
+        self._embed_queue = None
+        self._workers = []
+
+    def _new_pool(self):
+        # spawn rather than fork: the parent has torch and client threads that don't survive a fork
+        return ProcessPoolExecutor(max_workers=self.processes, mp_context=multiprocessing.get_context("spawn"))
+
+    def _replace_pool(self, broken):
+        # Every parse worker with a job in the broken pool ends up here; only the first replaces it
+        if self._executor is broken:
+            broken.shutdown(wait=False, cancel_futures=True)
+            self._executor = self._new_pool()
+
+    def _start(self):
+        self._executor = self._new_pool()
+        self._parse_queue = asyncio.Queue(maxsize=self.max_pending)
+        self._embed_queue = asyncio.Queue(maxsize=self.processes)
+        # Started from inside the first upload request; a fresh context keeps the workers out of its trace
+        context = contextvars.Context()
+        self._workers = [context.run(asyncio.create_task, self._parse_worker()) for _ in range(self.processes)]
+        self._workers.append(context.run(asyncio.create_task, self._embed_worker()))
+
+    async def submit(self, session_id, filename, blob_path):
+        if self._parse_queue is None:
+            self._start()
+        job = IngestionJob(session_id, filename, blob_path)
+        try:
+            self._parse_queue.put_nowait(job)
+        except asyncio.QueueFull:
+            raise IngestionQueueFull(f"Ingestion queue is full ({self.max_pending} pending uploads)")
+        self.jobs[job.id] = job
+        self._prune()
+        await self._save(job)
+        return job
+
+    async def get(self, job_id):
+        job = self.jobs.get(job_id)
+        if job is not None:
+            return job
+        row = await run_blocking("state", _load_job, job_id)
+        return IngestionJob.from_record(row[0], json.loads(row[1])) if row else None
+
+    async def _save(self, job):
+        # The record is taken here, on the loop, so the write stores the job as it is now
+        await run_blocking("state", _store_job, job.id, job.session_id, json.dumps(job.to_dict()),
+                           time.time(), bool(job.finished_at))
+
+    def shutdown(self):
+        for worker in self._workers:
+            worker.cancel()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+        self._executor = self._parse_queue = self._embed_queue = None
+        self._workers = []
+
+    def _prune(self):
+        finished = [job_id for job_id, job in self.jobs.items() if job.finished_at]
+        for job_id in finished[:max(0, len(finished) - self.max_finished_jobs)]:
+            del self.jobs[job_id]
+
+    async def _fail(self, job, error):
+        logger.error(f"Ingestion of {job.filename} failed: {error}")
+        job.status = "failed"
+        job.error = str(error)
+        job.finished_at = time.time()
+        await self._save(job)
+
+    async def _parse(self, job):
+        loop = asyncio.get_running_loop()
+        for attempt in range(2):
+            executor = self._executor
+            try:
+                return await loop.run_in_executor(executor, parse_and_chunk, job.blob_path, job.filename)
+            except BrokenProcessPool:
+                # A parser process died (e.g. killed for memory on a large OCR job) and took the pool,
+                # and every job running in it, down. Each of those jobs is retried once on a new pool,
+                # so only a job that crashes the parser again fails.
+                self._replace_pool(executor)
+                if attempt:
+                    raise
+                logger.warning(f"Parser process crashed while parsing {job.filename}; retrying")
+
+    async def _parse_worker(self):
+        while True:
+            job = await self._parse_queue.get()
+            job.status = "parsing"
+            await self._save(job)
+            try:
+                with span("ingest_parse"):
+                    nodes, job.content_preview = await self._parse(job)
+            except BrokenProcessPool:
+                await self._fail(job, "The file crashed the document parser.")
+                continue
+            except Exception as e:
+                await self._fail(job, e)
+                continue
+            if not nodes:
+                await self._fail(job, "No content could be extracted from the file.")
+                continue
+            job.total_chunks = len(nodes)
+            job.status = "embedding"
+            await self._save(job)
+            # Blocks while the embed stage is behind, which holds back further parsing
+            await self._embed_queue.put((job, nodes))
+
+    async def _embed_worker(self):
+        while True:
+            job, nodes = await self._embed_queue.get()
+            try:
+                for start in range(0, len(nodes), self.embed_batch_size):
+                    batch = nodes[start:start + self.embed_batch_size]
+                    # Pinned per batch, so the index stays loaded while it is written to and can be
+                    # unloaded between batches when the memory budget needs it
+                    index_store = self.indexes.acquire(job.session_id)
+                    try:
+                        await run_blocking("state", self.indexes.touch, job.session_id)
+                        job.new_chunks += await run_blocking("rag", index_store.insert_nodes, batch)
+                    finally:
+                        self.indexes.release(job.session_id)
+                    self.indexes.enforce_budget()
+                    job.processed_chunks += len(batch)
+                    await self._save(job)
+            except Exception as e:
+                await self._fail(job, e)
+                continue
+            job.status = "done"
+            job.finished_at = time.time()
+            await self._save(job)
+            logger.info(f"Indexed {job.filename}: {job.new_chunks} new of {job.total_chunks} chunks")
@@ -1,7 +1,7 @@
 import os
 import mimetypes
 import base64
-import tempfile
+import json
 import traceback
 import logging
 from fastapi import APIRouter, File, UploadFile, Request, HTTPException
@@ -9,10 +9,20 @@ from fastapi.templating import Jinja2Templates
 from fastapi.responses import HTMLResponse, JSONResponse
 from pydantic import BaseModel, Field
 from dotenv import load_dotenv
+import asyncio
+from contextlib import aclosing, asynccontextmanager
+from functools import partial
 import google.generativeai as genai
-from llama_index.core import SimpleDirectoryReader, VectorStoreIndex, Settings
-from llama_index.llms.gemini import Gemini
-from llama_index.embeddings.huggingface import HuggingFaceEmbedding
+from common.backends import run_blocking, stream_blocking, BackendTimeoutError
+from common.blobstore import BlobStore
+from common.images import prepare_image
+from common.response_cache import ResponseCache, attachment_hash
+from common.static_assets import page_response
+from common.telemetry import span
+from multimodal_mate.ingest import IngestionManager, IngestionQueueFull
+from multimodal_mate.media import media_part
+from multimodal_mate.models import get_embed_model, load_rag_stack, rag_stack
+from multimodal_mate.sessions import IndexRegistry, get_session_id, session_json_response, session_sse_response, SESSION_COOKIE
 
 # Initialize logging
 logging.basicConfig(level=logging.INFO)
@@ -26,123 +36,274 @@ if not GOOGLE_API_KEY:
 
 genai.configure(api_key=GOOGLE_API_KEY)
 
-# Initialize models
+# Initialize models; the embedding model and RAG LLM are loaded on first use (see models.py)
 gemini_flash = genai.GenerativeModel('models/gemini-1.5-flash')
-embed_model = HuggingFaceEmbedding(model_name="sentence-transformers/all-MiniLM-L6-v2")
-llm = Gemini(model_name="models/gemini-1.5-flash", api_key=GOOGLE_API_KEY)
-Settings.embed_model = embed_model
-Settings.llm = llm
+
+@asynccontextmanager
+async def mate_lifespan(app):
+    # Optionally load the RAG stack in the background so the first document query doesn't wait for it
+    warmup = None
+    if os.getenv("MATE_WARMUP", "false").lower() == "true":
+        warmup = asyncio.create_task(run_blocking("rag", load_rag_stack))
+    sweeper = asyncio.create_task(_sweep_sessions())
+    yield
+    if warmup is not None and not warmup.done():
+        warmup.cancel()
+    sweeper.cancel()
+    ingestion.shutdown()
+
+async def _sweep_sessions():
+    # Deleting expired sessions walks the index directory; keep it off the event loop
+    while True:
+        await asyncio.sleep(index_registry.sweep_interval)
+        try:
+            await run_blocking("state", index_registry.expire_idle)
+        except Exception as e:
+            logger.warning(f"Could not expire idle sessions: {str(e)}")
 
 # Initialize the APIRouter
-mate_router = APIRouter()
+mate_router = APIRouter(lifespan=mate_lifespan)
 mate_templates = None
 
-# Global index variable
-index = None
+# Persistent vector indexes, one per session, loaded lazily from disk on first use
+INDEX_DIR = os.getenv("MATE_INDEX_DIR", "storage/mate_index")
+index_registry = IndexRegistry(
+    INDEX_DIR,
+    memory_budget_bytes=int(os.getenv("MATE_INDEX_MEMORY_MB", "512")) * 1024 * 1024,
+    idle_ttl=float(os.getenv("MATE_SESSION_TTL", str(7 * 24 * 3600))),
+)
+
+# Uploaded files are streamed into a content-addressed store; clients refer to them by handle
+blob_store = BlobStore(os.getenv("MATE_BLOB_DIR", "storage/blobs"))
+
+ingestion = IngestionManager(
+    index_registry,
+    processes=int(os.getenv("MATE_INGEST_PROCESSES", str(min(4, os.cpu_count() or 1)))),
+    max_pending=int(os.getenv("MATE_INGEST_MAX_PENDING", "32")),
+    embed_batch_size=int(os.getenv("MATE_INGEST_BATCH", "32")),
+)
+
+# Answers keyed on (index version, normalized prompt, attachment); set MATE_CACHE_SIMILARITY
+# (e.g. 0.95) to also serve near-identical prompts from the cache
+response_cache = ResponseCache(
+    "mate",
+    max_entries=int(os.getenv("MATE_CACHE_SIZE", "1000")),
+    ttl=float(os.getenv("MATE_CACHE_TTL", "3600")),
+    embed_fn=lambda text: get_embed_model().get_query_embedding(text),
+    similarity_threshold=float(os.getenv("MATE_CACHE_SIMILARITY", "0")) or None,
+)
 
 class ChatRequest(BaseModel):
     message: str = Field(default="")
     file: str | None = Field(default=None)
+    fileHandle: str | None = Field(default=None)
     fileType: str | None = Field(default=None)
+    # Restrict document answers to chunks with matching metadata, e.g. {"file_name": "parts.xlsx"};
+    # numbers match as strings, so {"page_label": 3} finds page "3"
+    filters: dict[str, str | int | list[str | int]] | None = Field(default=None)
 
 @mate_router.get("/", response_class=HTMLResponse)
 async def mate_home(request: Request):
-    return mate_templates.TemplateResponse("mate.html", {"request": request})
+    response = page_response(request, mate_templates, "mate.html")
+    if not request.cookies.get(SESSION_COOKIE):
+        response.set_cookie(SESSION_COOKIE, get_session_id(request), httponly=True, samesite="lax")
+    return response
 
 def detect_file_type(filename):
     return mimetypes.guess_type(filename)[0] or "application/octet-stream"
 
 @mate_router.post("/upload")
-async def upload_file(file: UploadFile = File(...)):
-    global index
+async def upload_file(request: Request, file: UploadFile = File(...)):
+    session_id = get_session_id(request)
     try:
-        content = await file.read()
         file_type = detect_file_type(file.filename)
         logger.info(f"Uploading file: {file.filename} (Type: {file_type})")
+        with span("upload_read") as read:
+            handle, size = await blob_store.save_upload(file, file_type)
+            read.set(bytes_in=size)
 
         if file_type.startswith(("image/", "audio/", "video/")):
-            encoded_file = base64.b64encode(content).decode()
-            logger.info(f"Media file processed successfully: {file.filename}")
-            return JSONResponse(content={
+            logger.info(f"Media file stored successfully: {file.filename} ({size} bytes)")
+            return session_json_response(request, content={
                 "message": f"{file_type} uploaded successfully",
                 "filename": file.filename,
-                "file_data": encoded_file,
+                "handle": handle,
                 "mime_type": file_type
             })
 
-        # Use SimpleDirectoryReader to process document files
-        with tempfile.TemporaryDirectory() as temp_dir:
-            temp_file_path = os.path.join(temp_dir, file.filename)
-            with open(temp_file_path, "wb") as temp_file:
-                temp_file.write(content)
-            
-            logger.info(f"Attempting to process file: {file.filename}")
-            reader = SimpleDirectoryReader(temp_dir)
-            documents = reader.load_data()
-            logger.info(f"Successfully processed file: {file.filename}")
-
-        if not documents:
-            logger.warning(f"No content extracted from file: {file.filename}")
-            raise ValueError("No content could be extracted from the file.")
-
-        index = VectorStoreIndex.from_documents(documents)
-        logger.info(f"File processed and indexed successfully: {file.filename}")
-        logger.info(f"Index now contains {len(index.docstore.docs)} documents")
-
-        return JSONResponse(content={
-            "message": f"{file_type} file processed and indexed successfully",
+        # Documents are parsed, chunked and embedded in the background; the client polls /jobs/{job_id}
+        await rag_stack()
+        job = await ingestion.submit(session_id, file.filename, blob_store.path(handle))
+        logger.info(f"Queued ingestion job {job.id} for {file.filename}")
+
+        return session_json_response(request, content={
+            "message": f"{file_type} file queued for indexing",
             "filename": file.filename,
-            "content_preview": documents[0].text[:500] + "..." if len(documents[0].text) > 500 else documents[0].text
-        })
+            "job_id": job.id
+        }, status_code=202)
+    except IngestionQueueFull as e:
+        logger.warning(f"Rejected upload of {file.filename}: {str(e)}")
+        return session_json_response(request, content={"error": str(e)}, status_code=503)
     except Exception as e:
         logger.error(f"Error in upload_file: {str(e)}")
         logger.error(traceback.format_exc())
-        return JSONResponse(content={"error": f"An unexpected error occurred: {str(e)}"}, status_code=500)
+        return session_json_response(request, content={"error": f"An unexpected error occurred: {str(e)}"}, status_code=500)
+
+@mate_router.get("/jobs/{job_id}")
+async def get_job(request: Request, job_id: str):
+    job = await ingestion.get(job_id)
+    if job is None or job.session_id != get_session_id(request):
+        return JSONResponse(content={"error": "Job not found"}, status_code=404)
+    return JSONResponse(content=job.to_dict())
+
+def _response_text(response):
+    # Extract the text content from the response
+    if isinstance(response, str):
+        return response
+    return response.text if hasattr(response, 'text') else str(response)
+
+def _rag_query(index_store, message, filters=None):
+    return index_store.query_engine(filters=filters).query(message)
+
+def _rag_tokens(index_store, message, filters=None):
+    yield from index_store.query_engine(streaming=True, filters=filters).query(message).response_gen
+
+def _gemini_tokens(prompt):
+    for chunk in gemini_flash.generate_content(prompt, stream=True):
+        yield chunk.text
+
+def _sse(data, event=None):
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data)}\n\n"
+
+async def _sse_events(tokens, mode, on_complete, on_close=None):
+    parts = []
+    try:
+        try:
+            # Closed when the client goes away mid-answer, which stops the producer and frees its slot
+            async with aclosing(tokens):
+                async for token in tokens:
+                    parts.append(token)
+                    yield _sse({"token": token})
+        except Exception as e:
+            logger.error(f"Error while streaming chat response: {str(e)}")
+            logger.error(traceback.format_exc())
+            yield _sse({"error": f"An unexpected error occurred: {str(e)}"}, event="error")
+            return
+        await on_complete({"response": "".join(parts), "mode": mode})
+        yield _sse({"done": True, "mode": mode})
+    finally:
+        if on_close is not None:
+            on_close()
+
+async def _replay_events(result):
+    yield _sse({"token": result["response"]})
+    yield _sse({"done": True, "mode": result["mode"]})
 
 @mate_router.post("/chat")
-async def chat(chat_request: ChatRequest):
-    global index
+async def chat(request: Request, chat_request: ChatRequest):
+    session_id = get_session_id(request)
+    # Pinned so enforce_budget() can't unload it mid-query; released when the answer (or its stream) is done
+    index_store = index_registry.acquire(session_id)
+    pinned = True
+    # Clients that accept text/event-stream get tokens as they are generated
+    wants_stream = "text/event-stream" in request.headers.get("accept", "")
     try:
-        if not chat_request.message and not chat_request.file:
+        await run_blocking("state", index_registry.touch, session_id)
+        if not chat_request.message and not chat_request.file and not chat_request.fileHandle:
             raise HTTPException(status_code=400, detail="Message and file cannot both be empty")
 
-        if chat_request.file:
-            if chat_request.fileType.startswith(('image/', 'audio/', 'video/')):
-                # Handle media files directly with Gemini
-                prompt = [chat_request.message or f"Analyze this {chat_request.fileType.split('/')[0]}", 
-                          {"mime_type": chat_request.fileType, "data": base64.b64decode(chat_request.file)}]
-                response = gemini_flash.generate_content(prompt)
-                mode = chat_request.fileType.split('/')[0].capitalize()
-            else:
-                # For document types, use the RAG pipeline
-                if index:
-                    query_engine = index.as_query_engine()
-                    response = query_engine.query(chat_request.message)
-                    mode = "RAG"
-                else:
-                    raise HTTPException(status_code=400, detail="No indexed documents available for query")
-        elif chat_request.message:
-            if index:
-                # If there are indexed documents, use RAG pipeline
-                query_engine = index.as_query_engine()
-                response = query_engine.query(chat_request.message)
-                mode = "RAG"
+        if chat_request.fileHandle:
+            try:
+                metadata = blob_store.metadata(chat_request.fileHandle)
+            except ValueError:
+                raise HTTPException(status_code=400, detail="Invalid file handle")
+            except FileNotFoundError:
+                raise HTTPException(status_code=404, detail="Unknown file handle")
+            chat_request.fileType = chat_request.fileType or metadata["mime_type"]
+        elif chat_request.file and not chat_request.fileType:
+            raise HTTPException(status_code=400, detail="fileType is required when sending file")
+
+        has_file = bool(chat_request.file or chat_request.fileHandle)
+        is_media = has_file and chat_request.fileType.startswith(('image/', 'audio/', 'video/'))
+
+        # Media chat and sessions without documents never need the embedding model or the RAG LLM
+        index = None
+        if not is_media and index_store.has_documents:
+            await rag_stack()
+            index = await run_blocking("rag", index_store.get)
+            index_registry.enforce_budget()
+
+        if is_media or (not index and not has_file):
+            # Media and direct answers don't depend on the session's documents
+            cache_scope, cache_version = "shared", 0
+        else:
+            cache_scope, cache_version = session_id, index_store.version
+        attachment = chat_request.fileHandle or (attachment_hash(chat_request.file) if chat_request.file else "")
+        if index and chat_request.filters:
+            attachment = attachment_hash(attachment, json.dumps(chat_request.filters, sort_keys=True))
+        cached = await response_cache.aget(cache_scope, cache_version, chat_request.message, attachment)
+        if cached:
+            if wants_stream:
+                return session_sse_response(request, _replay_events(cached))
+            return session_json_response(request, content=cached)
+
+        if is_media:
+            # Handle media files directly with Gemini
+            if chat_request.fileHandle:
+                part = await run_blocking("gemini", media_part, blob_store.path(chat_request.fileHandle),
+                                          chat_request.fileHandle, chat_request.fileType)
             else:
-                # If no documents are indexed, use direct Gemini processing
-                response = gemini_flash.generate_content(chat_request.message)
-                mode = "Direct"
+                with span("base64", bytes_in=len(chat_request.file)) as decode:
+                    data, mime_type = base64.b64decode(chat_request.file), chat_request.fileType
+                    decode.set(bytes_out=len(data))
+                if mime_type.startswith('image/'):
+                    data, mime_type, _ = await run_blocking("images", prepare_image, data, mime_type)
+                part = {"mime_type": mime_type, "data": data}
+            prompt = [chat_request.message or f"Analyze this {chat_request.fileType.split('/')[0]}", part]
+            mode = chat_request.fileType.split('/')[0].capitalize()
+        elif index:
+            # If there are indexed documents, use RAG pipeline
+            mode = "RAG"
+        elif has_file:
+            raise HTTPException(status_code=400, detail="No indexed documents available for query")
+        else:
+            # If no documents are indexed, use direct Gemini processing
+            prompt = chat_request.message
+            mode = "Direct"
+
+        async def remember(result):
+            await response_cache.aput(cache_scope, cache_version, chat_request.message, result, attachment)
+
+        if wants_stream:
+            if mode == "RAG":
+                tokens = stream_blocking("rag", _rag_tokens, index_store, chat_request.message, chat_request.filters)
+                events = _sse_events(tokens, mode, remember, on_close=partial(index_registry.release, session_id))
+                pinned = False
+                return session_sse_response(request, events)
+            tokens = stream_blocking("gemini", _gemini_tokens, prompt)
+            return session_sse_response(request, _sse_events(tokens, mode, remember))
 
-        # Extract the text content from the response
-        if isinstance(response, str):
-            response_text = response
+        if mode == "RAG":
+            response = await run_blocking("rag", _rag_query, index_store, chat_request.message, chat_request.filters)
         else:
-            response_text = response.text if hasattr(response, 'text') else str(response)
+            response = await run_blocking("gemini", gemini_flash.generate_content, prompt)
 
-        return JSONResponse(content={"response": response_text, "mode": mode})
+        result = {"response": _response_text(response), "mode": mode}
+        await remember(result)
+        return session_json_response(request, content=result)
+    except HTTPException as e:
+        return session_json_response(request, content={"error": e.detail}, status_code=e.status_code)
+    except BackendTimeoutError as e:
+        logger.error(f"Backend timeout in chat endpoint: {str(e)}")
+        return session_json_response(request, content={"error": str(e)}, status_code=504)
     except Exception as e:
         logger.error(f"Error in chat endpoint: {str(e)}")
         logger.error(traceback.format_exc())
-        return JSONResponse(content={"error": f"An unexpected error occurred: {str(e)}"}, status_code=500)
+        return session_json_response(request, content={"error": f"An unexpected error occurred: {str(e)}"}, status_code=500)
+    finally:
+        if pinned:
+            index_registry.release(session_id)
 
 def set_templates(templates):
     global mate_templates
@@ -0,0 +1,84 @@
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import google.generativeai as genai
+
+from common.images import prepare_image
+
+logger = logging.getLogger(__name__)
+
+# Media up to this size is sent inline; anything larger goes through the Gemini File API,
+# which streams the file from disk instead of holding it in memory.
+INLINE_MEDIA_LIMIT = int(os.getenv("MATE_INLINE_MEDIA_MB", "8")) * 1024 * 1024
+USE_FILE_API = os.getenv("MATE_USE_FILE_API", "true").lower() != "false"
+
+# Files uploaded to the File API expire after 48 hours; reuse them a little less than that
+FILE_API_REUSE_SECONDS = 47 * 3600
+# Downscaled images kept in memory for follow-up questions about the same upload
+PREPARED_IMAGE_CACHE_BYTES = int(float(os.getenv("MATE_PREPARED_IMAGE_CACHE_MB", "32")) * 1024 * 1024)
+
+_uploaded_files = {}
+_uploaded_files_lock = threading.Lock()
+_prepared_images = OrderedDict()
+_prepared_bytes = 0
+_prepared_lock = threading.Lock()
+
+
+def media_part(path, handle, mime_type):
+    """Build the Gemini content part for a stored blob. Blocking; run it on the gemini backend."""
+    size = os.path.getsize(path)
+    # Images too big to send inline go to the File API as they are, without being read into memory
+    if mime_type.startswith("image/") and (size <= INLINE_MEDIA_LIMIT or not USE_FILE_API):
+        data, prepared_type = _prepared_image(path, mime_type)
+        if data is not None:
+            return {"mime_type": prepared_type, "data": data}
+
+    if size <= INLINE_MEDIA_LIMIT or not USE_FILE_API:
+        with open(path, "rb") as media_file:
+            return {"mime_type": mime_type, "data": media_file.read()}
+
+    with _uploaded_files_lock:
+        cached = _uploaded_files.get(handle)
+    if cached and time.time() - cached[1] < FILE_API_REUSE_SECONDS:
+        return cached[0]
+
+    logger.info(f"Uploading {size} byte {mime_type} blob {handle[:12]} to the Gemini File API")
+    uploaded = genai.upload_file(path, mime_type=mime_type)
+    # Video has to finish server-side processing before it can be referenced in a prompt
+    while uploaded.state.name == "PROCESSING":
+        time.sleep(1)
+        uploaded = genai.get_file(uploaded.name)
+    if uploaded.state.name == "FAILED":
+        raise ValueError(f"Gemini could not process the uploaded {mime_type} file")
+
+    with _uploaded_files_lock:
+        _uploaded_files[handle] = (uploaded, time.time())
+    return uploaded
+
+
+def _prepared_image(path, mime_type):
+    global _prepared_bytes
+    # Blobs are content-addressed, so the path alone identifies the result
+    key = (path, mime_type)
+    with _prepared_lock:
+        if key in _prepared_images:
+            _prepared_images.move_to_end(key)
+            return _prepared_images[key]
+
+    with open(path, "rb") as image_file:
+        data, prepared_type, frame_hash = prepare_image(image_file.read(), mime_type)
+    result = (None, mime_type) if frame_hash is None or len(data) > INLINE_MEDIA_LIMIT else (data, prepared_type)
+
+    size = len(result[0] or b"")
+    if size <= PREPARED_IMAGE_CACHE_BYTES:
+        with _prepared_lock:
+            if key not in _prepared_images:
+                _prepared_images[key] = result
+                _prepared_bytes += size
+            while _prepared_bytes > PREPARED_IMAGE_CACHE_BYTES:
+                _, (evicted, _) = _prepared_images.popitem(last=False)
+                _prepared_bytes -= len(evicted or b"")
+    return result
@@ -0,0 +1,53 @@
+import os
+import threading
+
+from common.backends import run_blocking
+
+EMBED_MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+LLM_MODEL_NAME = "models/gemini-1.5-flash"
+
+# The embedding model (sentence-transformers, torch) and the llama-index LLM are only built
+# when something first needs them, so serving pages and media chat never pays for them.
+_embed_model = None
+_llm = None
+_lock = threading.Lock()
+
+
+def get_embed_model():
+    global _embed_model
+    with _lock:
+        if _embed_model is None:
+            from llama_index.core import Settings
+            from multimodal_mate.embeddings import build_embedding_service
+
+            _embed_model = build_embedding_service(EMBED_MODEL_NAME)
+            Settings.embed_model = _embed_model
+    return _embed_model
+
+
+def get_llm():
+    global _llm
+    with _lock:
+        if _llm is None:
+            from llama_index.core import Settings
+            from llama_index.llms.gemini import Gemini
+
+            _llm = Gemini(model_name=LLM_MODEL_NAME, api_key=os.getenv("GOOGLE_API_KEY"))
+            Settings.llm = _llm
+    return _llm
+
+
+def load_rag_stack():
+    """Build the embedding model and LLM and register them in llama-index Settings. Blocking."""
+    get_embed_model()
+    get_llm()
+
+
+def rag_stack_loaded():
+    return _embed_model is not None and _llm is not None
+
+
+async def rag_stack():
+    """Async provider: loads the RAG stack on the rag backend the first time it is awaited."""
+    if not rag_stack_loaded():
+        await run_blocking("rag", load_rag_stack)
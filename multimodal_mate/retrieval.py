@@ -0,0 +1,185 @@
+import heapq
+import math
+import os
+import re
+import threading
+from collections import defaultdict
+from operator import itemgetter
+
+from llama_index.core.retrievers import BaseRetriever
+from llama_index.core.schema import MetadataMode, NodeWithScore
+from llama_index.core.vector_stores import FilterOperator, MetadataFilter, MetadataFilters
+
+# "vector", "keyword" or "hybrid" (both, fused by reciprocal rank)
+RETRIEVAL_MODE = os.getenv("MATE_RETRIEVAL_MODE", "hybrid")
+# Candidates each retriever contributes before fusion, and the RRF damping constant
+HYBRID_CANDIDATES = int(os.getenv("MATE_HYBRID_CANDIDATES", "20"))
+RRF_K = int(os.getenv("MATE_RRF_K", "60"))
+# An identifier in the query (a keyword with a digit or a -./_ in it) found in at most this share of
+# chunks, or in at most log2 of the chunk count, names something specific such as a part number.
+# Chunks containing one are fused as a third ranked list with EXACT_HIT_WEIGHT.
+RARE_TOKEN_SHARE = float(os.getenv("MATE_RARE_TOKEN_SHARE", "0.005"))
+EXACT_HIT_WEIGHT = float(os.getenv("MATE_EXACT_HIT_WEIGHT", "1.0"))
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Words joined by -, ., / or _ stay one token (part numbers, versions, file names) and are
+# also indexed by their parts, so "XJ-42" matches "XJ-42", "xj 42" and "42"
+_TOKEN = re.compile(r"\w+(?:[-./]\w+)*")
+_PART = re.compile(r"[-./_]")
+_IDENTIFIER = re.compile(r"[\d\-./_]")
+STOPWORDS = frozenset(
+    "a an and are as at be by can do does for from has have how i in is it its me my of on or "
+    "that the their there this to was what when where which who why will with you your".split()
+)
+
+
+def tokenize(text):
+    tokens = []
+    for token in _TOKEN.findall(text.lower()):
+        if token in STOPWORDS:
+            continue
+        tokens.append(token)
+        parts = _PART.split(token)
+        if len(parts) > 1:
+            tokens.extend(part for part in parts if part and part not in STOPWORDS)
+    return tokens
+
+
+def matches(metadata, filters):
+    return all(metadata.get(key) in values for key, values in filters.items())
+
+
+def normalize_filters(filters):
+    """
+    {"file_name": "a.pdf", "page_label": [2, "3"]} -> every value as a list of strings, the type
+    readers store metadata such as page labels as; None when empty.
+    """
+    if not filters:
+        return None
+    return {
+        key: [str(v) for v in value] if isinstance(value, (list, tuple, set)) else [str(value)]
+        for key, value in filters.items()
+    }
+
+
+class KeywordIndex:
+    """
+    In-memory BM25 inverted index over chunk text, kept next to a PersistentIndex's
+    vector index and fed the same nodes. Postings map token -> {doc: term frequency}.
+    """
+
+    def __init__(self):
+        self.nodes = []
+        self.lengths = []
+        self.postings = defaultdict(dict)
+        self.total_length = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def add(self, nodes):
+        with self._lock:
+            for node in nodes:
+                doc = len(self.nodes)
+                tokens = tokenize(node.get_content(metadata_mode=MetadataMode.NONE))
+                counts = defaultdict(int)
+                for token in tokens:
+                    counts[token] += 1
+                for token, count in counts.items():
+                    self.postings[token][doc] = count
+                self.nodes.append(node)
+                self.lengths.append(len(tokens))
+                self.total_length += len(tokens)
+
+    def search(self, query, top_k, filters=None):
+        """Return up to top_k (node, score) pairs by BM25 score, optionally restricted by metadata."""
+        with self._lock:
+            if not self.nodes:
+                return []
+            n = len(self.nodes)
+            average_length = self.total_length / n or 1.0
+            scores = defaultdict(float)
+            for token in set(tokenize(query)):
+                postings = self.postings.get(token)
+                if not postings:
+                    continue
+                idf = math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+                for doc, tf in postings.items():
+                    norm = BM25_K1 * (1 - BM25_B + BM25_B * self.lengths[doc] / average_length)
+                    scores[doc] += idf * tf * (BM25_K1 + 1) / (tf + norm)
+            candidates = scores.items()
+            if filters:
+                candidates = [(doc, score) for doc, score in candidates if matches(self.nodes[doc].metadata, filters)]
+            return [(self.nodes[doc], score) for doc, score in heapq.nlargest(top_k, candidates, key=itemgetter(1))]
+
+    def exact_hits(self, query, filters=None, share=RARE_TOKEN_SHARE):
+        """Return (node, count) for chunks containing rare query identifiers, most matched identifiers first."""
+        with self._lock:
+            n = len(self.nodes)
+            limit = max(math.ceil(n * share), math.ceil(math.log2(n + 1)))
+            counts = defaultdict(int)
+            for token in set(tokenize(query)):
+                if not _IDENTIFIER.search(token):
+                    continue
+                postings = self.postings.get(token)
+                if postings and len(postings) <= limit:
+                    for doc in postings:
+                        counts[doc] += 1
+            hits = [(self.nodes[doc], count) for doc, count in counts.items()
+                    if not filters or matches(self.nodes[doc].metadata, filters)]
+            return sorted(hits, key=itemgetter(1), reverse=True)
+
+
+def reciprocal_rank_fusion(rankings, k=RRF_K, weights=None):
+    """Fuse ranked node lists: each node scores sum(weight / (k + rank)) over the lists it appears in."""
+    scores, nodes = defaultdict(float), {}
+    for ranking, weight in zip(rankings, weights or [1.0] * len(rankings)):
+        for rank, node in enumerate(ranking, start=1):
+            scores[node.node_id] += weight / (k + rank)
+            nodes[node.node_id] = node
+    return [(nodes[node_id], score) for node_id, score in sorted(scores.items(), key=lambda item: item[1], reverse=True)]
+
+
+class HybridRetriever(BaseRetriever):
+    """
+    Dense retrieval from a VectorStoreIndex and BM25 from a KeywordIndex, fused by reciprocal rank.
+    Chunks containing a rare identifier from the query are fused as a third list: with two lists alone
+    a chunk ranked middling by both outscores the only chunk that has the part number asked for.
+    """
+
+    def __init__(self, index, keywords, top_k, filters=None, mode=RETRIEVAL_MODE, candidates=HYBRID_CANDIDATES):
+        self.keywords = keywords
+        self.top_k = top_k
+        self.filters = normalize_filters(filters)
+        self.mode = mode
+        self.candidates = max(candidates, top_k)
+        vector_filters = None
+        if self.filters:
+            vector_filters = MetadataFilters(filters=[
+                MetadataFilter(key=key, value=values, operator=FilterOperator.IN)
+                for key, values in self.filters.items()
+            ])
+        self.vector_retriever = index.as_retriever(
+            similarity_top_k=top_k if mode == "vector" else self.candidates,
+            filters=vector_filters,
+        )
+        super().__init__()
+
+    def _retrieve(self, query_bundle):
+        if self.mode == "vector":
+            return self.vector_retriever.retrieve(query_bundle)
+        keyword_hits = self.keywords.search(query_bundle.query_str, self.candidates, self.filters)
+        if self.mode == "keyword":
+            return [NodeWithScore(node=node, score=score) for node, score in keyword_hits[:self.top_k]]
+        dense_hits = self.vector_retriever.retrieve(query_bundle)
+        keyword_ranks = {node.node_id: rank for rank, (node, _) in enumerate(keyword_hits)}
+        exact_hits = self.keywords.exact_hits(query_bundle.query_str, self.filters)
+        # Most identifiers matched first, then by BM25 rank
+        exact_hits.sort(key=lambda hit: (-hit[1], keyword_ranks.get(hit[0].node_id, len(keyword_ranks))))
+        fused = reciprocal_rank_fusion(
+            [[hit.node for hit in dense_hits], [node for node, _ in keyword_hits], [node for node, _ in exact_hits]],
+            weights=[1.0, 1.0, EXACT_HIT_WEIGHT],
+        )
+        return [NodeWithScore(node=node, score=score) for node, score in fused[:self.top_k]]
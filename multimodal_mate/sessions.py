@@ -0,0 +1,155 @@
+import logging
+import os
+import re
+import shutil
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from multimodal_mate.index_store import PersistentIndex
+
+logger = logging.getLogger(__name__)
+
+SESSION_COOKIE = "mate_session"
+SESSION_HEADER = "X-Mate-Session"
+_SESSION_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+
+class IndexRegistry:
+    """
+    Per-session PersistentIndex instances under one root directory.
+
+    Loaded indexes are kept in LRU order; when their estimated memory exceeds the
+    budget the least recently used ones are unloaded (they stay on disk and reload on
+    next use). Indexes acquired for a query stay loaded until released. expire_idle(),
+    run every sweep_interval seconds, deletes sessions idle for longer than idle_ttl.
+    The lock only guards the in-memory state; disk work happens outside it.
+    """
+
+    def __init__(self, root_dir, memory_budget_bytes, idle_ttl, sweep_interval=60):
+        self.root_dir = root_dir
+        self.memory_budget_bytes = memory_budget_bytes
+        self.idle_ttl = idle_ttl
+        self.sweep_interval = sweep_interval
+        self._entries = OrderedDict()
+        self._last_used = {}
+        self._pins = {}
+        self._lock = threading.Lock()
+
+    def get(self, session_id, pin=False):
+        """The session's index; only in-memory work, so it is safe to call on the event loop."""
+        with self._lock:
+            store = self._entries.get(session_id)
+            if store is None:
+                store = PersistentIndex(os.path.join(self.root_dir, session_id))
+                self._entries[session_id] = store
+            self._entries.move_to_end(session_id)
+            self._last_used[session_id] = time.time()
+            if pin:
+                self._pins[session_id] = self._pins.get(session_id, 0) + 1
+        return store
+
+    def touch(self, session_id):
+        """Record use of the session on disk, for sweeps after a restart or in other workers. Blocking."""
+        try:
+            os.utime(os.path.join(self.root_dir, session_id))
+        except OSError:
+            pass
+
+    def acquire(self, session_id):
+        """get() and keep the index loaded, and the session on disk, until release()."""
+        return self.get(session_id, pin=True)
+
+    def release(self, session_id):
+        with self._lock:
+            if self._pins.get(session_id, 0) > 1:
+                self._pins[session_id] -= 1
+            else:
+                self._pins.pop(session_id, None)
+
+    def enforce_budget(self):
+        """Unload least recently used indexes until the loaded ones fit the memory budget."""
+        with self._lock:
+            total = sum(store.memory_bytes for store in self._entries.values())
+            for session_id in list(self._entries)[:-1]:
+                if total <= self.memory_budget_bytes:
+                    break
+                if session_id in self._pins:
+                    continue
+                store = self._entries.pop(session_id)
+                total -= store.memory_bytes
+                store.unload()
+                logger.info(f"Evicted index for session {session_id} from memory")
+
+    def expire_idle(self):
+        """Unload and delete sessions idle for longer than idle_ttl. Blocking; run it off the event loop."""
+        now = time.time()
+        with self._lock:
+            for session_id, last_used in list(self._last_used.items()):
+                if now - last_used > self.idle_ttl and session_id not in self._pins:
+                    store = self._entries.pop(session_id, None)
+                    if store is not None:
+                        store.unload()
+                    del self._last_used[session_id]
+
+        try:
+            names = os.listdir(self.root_dir)
+        except OSError:
+            return
+        for name in names:
+            path = os.path.join(self.root_dir, name)
+            if name.startswith(".expired-"):
+                # Left behind by a sweep that didn't finish
+                shutil.rmtree(path, ignore_errors=True)
+                continue
+            try:
+                if not os.path.isdir(path) or now - os.path.getmtime(path) <= self.idle_ttl:
+                    continue
+                with self._lock:
+                    # Renamed under the lock so get() never hands out a directory being deleted
+                    if name in self._entries:
+                        continue
+                    trash = os.path.join(self.root_dir, f".expired-{name}-{uuid.uuid4().hex[:8]}")
+                    os.rename(path, trash)
+            except OSError:
+                continue
+            shutil.rmtree(trash, ignore_errors=True)
+            logger.info(f"Expired idle session {name}")
+
+    @property
+    def stats(self):
+        with self._lock:
+            return {
+                "loaded_sessions": len(self._entries),
+                "memory_bytes": sum(store.memory_bytes for store in self._entries.values()),
+                "memory_budget_bytes": self.memory_budget_bytes,
+            }
+
+
+def get_session_id(request):
+    """Session id from the X-Mate-Session header or mate_session cookie, or a fresh one."""
+    session_id = request.headers.get(SESSION_HEADER) or request.cookies.get(SESSION_COOKIE)
+    if session_id and _SESSION_ID_PATTERN.match(session_id):
+        return session_id
+    session_id = uuid.uuid4().hex
+    request.state.new_session_id = session_id
+    return session_id
+
+
+def _with_session_cookie(request, response):
+    new_session_id = getattr(request.state, "new_session_id", None)
+    if new_session_id:
+        response.set_cookie(SESSION_COOKIE, new_session_id, httponly=True, samesite="lax")
+    return response
+
+
+def session_json_response(request, content, status_code=200):
+    return _with_session_cookie(request, JSONResponse(content=content, status_code=status_code))
+
+
+def session_sse_response(request, events):
+    response = StreamingResponse(events, media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+    return _with_session_cookie(request, response)
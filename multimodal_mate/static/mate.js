@@ -14,6 +14,9 @@ document.addEventListener('DOMContentLoaded', () => {
         }
     });
 
+    // Server-side handles for uploaded media, so the bytes are never sent twice
+    const uploadedMedia = new Map();
+
     async function handleFileUpload(file) {
         const formData = new FormData();
         formData.append('file', file);
@@ -25,8 +28,15 @@ document.addEventListener('DOMContentLoaded', () => {
             });
             const result = await response.json();
             if (response.ok) {
+                if (result.handle) {
+                    uploadedMedia.set(file, { handle: result.handle, mimeType: result.mime_type });
+                }
                 showUploadStatus(result.message);
-                appendMessage('system', `File uploaded and processed: ${file.name}`);
+                if (result.job_id) {
+                    await waitForIngestion(result.job_id, file.name);
+                } else {
+                    appendMessage('system', `File uploaded and processed: ${file.name}`);
+                }
             } else {
                 console.error('Upload failed:', result.error);
                 showUploadStatus(`Upload failed: ${result.error}`);
@@ -39,6 +49,38 @@ document.addEventListener('DOMContentLoaded', () => {
         }
     }
 
+    // Documents are indexed in the background; poll the job until it finishes
+    async function waitForIngestion(jobId, fileName) {
+        while (true) {
+            await new Promise(resolve => setTimeout(resolve, 1000));
+            let job;
+            try {
+                const response = await fetch(`/mate/jobs/${jobId}`);
+                job = await response.json();
+                if (!response.ok) {
+                    throw new Error(job.error || `HTTP error! status: ${response.status}`);
+                }
+            } catch (error) {
+                console.error('Error polling ingestion job:', error);
+                appendMessage('system', `Indexing status unavailable: ${fileName}`);
+                return;
+            }
+
+            if (job.status === 'done') {
+                showUploadStatus(`Indexed ${fileName}`);
+                appendMessage('system', `File uploaded and processed: ${fileName}`);
+                return;
+            }
+            if (job.status === 'failed') {
+                showUploadStatus(`Indexing failed: ${job.error}`);
+                appendMessage('system', `Upload failed: ${fileName} - ${job.error}`);
+                return;
+            }
+            const percent = Math.round(job.progress * 100);
+            showUploadStatus(`Indexing ${fileName}: ${job.status} ${job.total_chunks ? percent + '%' : ''}`);
+        }
+    }
+
     function showUploadStatus(message) {
         uploadStatus.textContent = message;
         uploadStatus.classList.remove('hidden');
@@ -58,39 +100,55 @@ document.addEventListener('DOMContentLoaded', () => {
     async function sendMessage() {
         const message = userInput.value.trim();
         const fileInput = document.getElementById('fileUpload');
-        let fileData = null;
+        let fileHandle = null;
         let fileType = null;
+        let previewUrl = null;
 
         if (fileInput.files.length > 0) {
             const file = fileInput.files[0];
             fileType = file.type;
             
             if (fileType.startsWith('image/') || fileType.startsWith('audio/') || fileType.startsWith('video/')) {
-                fileData = await fileToBase64(file);
+                if (!uploadedMedia.has(file)) {
+                    await handleFileUpload(file);
+                }
+                const uploaded = uploadedMedia.get(file);
+                if (uploaded) {
+                    fileHandle = uploaded.handle;
+                    fileType = uploaded.mimeType || fileType;
+                }
+                if (fileType.startsWith('image/')) {
+                    previewUrl = URL.createObjectURL(file);
+                }
             } else {
                 await handleFileUpload(file);
                 fileInput.value = '';
             }
         }
 
-        if (message || fileData) {
-            appendMessage('user', message, fileData);
+        if (message || fileHandle) {
+            appendMessage('user', message, previewUrl);
             userInput.value = '';
 
             try {
                 const response = await fetch('/mate/chat', {
                     method: 'POST',
                     headers: {
-                        'Content-Type': 'application/json'
+                        'Content-Type': 'application/json',
+                        'Accept': 'text/event-stream'
                     },
-                    body: JSON.stringify({ message, file: fileData, fileType })
+                    body: JSON.stringify({ message, fileHandle, fileType })
                 });
-                const result = await response.json();
-                if (response.ok) {
-                    appendMessage('assistant', result.response, null, result.mode);
+                if (response.ok && (response.headers.get('Content-Type') || '').startsWith('text/event-stream')) {
+                    await renderStream(response);
                 } else {
-                    console.error('Server error:', result);
-                    appendMessage('assistant', `Error: ${result.error || 'Unknown error occurred'}`);
+                    const result = await response.json();
+                    if (response.ok) {
+                        appendMessage('assistant', result.response, null, result.mode);
+                    } else {
+                        console.error('Server error:', result);
+                        appendMessage('assistant', `Error: ${result.error || 'Unknown error occurred'}`);
+                    }
                 }
             } catch (error) {
                 console.error('Network error:', error);
@@ -101,7 +159,49 @@ document.addEventListener('DOMContentLoaded', () => {
         }
     }
 
-    function appendMessage(sender, content, imageData = null, mode = null) {
+    // Render server-sent tokens into one assistant message as they arrive
+    async function renderStream(response) {
+        const messageElement = appendMessage('assistant', '');
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        let text = '';
+
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
+
+            let boundary;
+            while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+                const rawEvent = buffer.slice(0, boundary);
+                buffer = buffer.slice(boundary + 2);
+                const dataLine = rawEvent.split('\n').find(line => line.startsWith('data: '));
+                if (!dataLine) continue;
+
+                const data = JSON.parse(dataLine.slice(6));
+                if (data.error) {
+                    text += `\n\nError: ${data.error}`;
+                } else if (data.token) {
+                    text += data.token;
+                }
+                updateMessage(messageElement, text, data.done ? data.mode : null);
+            }
+        }
+    }
+
+    function updateMessage(messageElement, content, mode = null) {
+        messageElement.querySelector('.message-content').innerHTML = marked.parse(content);
+        if (mode) {
+            messageElement.querySelector('p').insertAdjacentHTML('beforeend', `<span class="text-xs text-gray-400 ml-2">[${mode}]</span>`);
+        }
+        messageElement.querySelectorAll('pre code').forEach((block) => {
+            hljs.highlightBlock(block);
+        });
+        chatHistory.scrollTop = chatHistory.scrollHeight;
+    }
+
+    function appendMessage(sender, content, imageUrl = null, mode = null) {
         const messageElement = document.createElement('div');
         messageElement.className = `mb-4 ${sender === 'user' ? 'text-right' : 'text-left'}`;
         let bgColor = sender === 'user' ? 'bg-blue-600' : 'bg-gray-700';
@@ -129,20 +229,12 @@ document.addEventListener('DOMContentLoaded', () => {
             hljs.highlightBlock(block);
         });
 
-        if (imageData) {
+        if (imageUrl) {
             const imageElement = document.createElement('img');
-            imageElement.src = `data:image/jpeg;base64,${imageData}`;
+            imageElement.src = imageUrl;
             imageElement.className = 'mt-2 rounded-lg max-w-full';
             messageElement.querySelector('.inline-block').appendChild(imageElement);
         }
-    }
-
-    function fileToBase64(file) {
-        return new Promise((resolve, reject) => {
-            const reader = new FileReader();
-            reader.readAsDataURL(file);
-            reader.onload = () => resolve(reader.result.split(',')[1]);
-            reader.onerror = error => reject(error);
-        });
+        return messageElement;
     }
 });
\ No newline at end of file
@@ -0,0 +1,99 @@
+import json
+
+import pytest
+
+from visionary.replies import parse_reply
+
+# Same shape as LANGUAGE_VOICES in visionary.py: name -> (language code, voices)
+LANGUAGES = {"english": ("en-US", []), "spanish": ("es-ES", []), "hindi": ("hi-IN", []), "portuguese": ("pt-BR", [])}
+
+
+def reply(**fields):
+    return json.dumps(fields, ensure_ascii=False)
+
+
+def test_json_reply():
+    text = reply(intent="describe", location=None, language="spanish", answer="Hay un paso de peatones delante.")
+    assert parse_reply(text, LANGUAGES) == {
+        "intent": "describe", "location": None, "language": "spanish", "answer": "Hay un paso de peatones delante.",
+    }
+
+
+def test_fenced_json():
+    text = "```json\n" + reply(intent="navigate", location="Walmart", language="english",
+                               answer="Opening directions for Walmart.") + "\n```"
+    assert parse_reply(text, LANGUAGES) == {
+        "intent": "navigate", "location": "Walmart", "language": "english", "answer": "Opening directions for Walmart.",
+    }
+
+
+def test_truncated_json_keeps_the_fields_before_the_cut():
+    text = '{"intent": "describe", "location": null, "language": "hindi", "answer": "आगे एक ज़ेबरा क्रॉसिंग है। बत्ती'
+    assert parse_reply(text, LANGUAGES) == {
+        "intent": "describe", "location": None, "language": "hindi", "answer": "आगे एक ज़ेबरा क्रॉसिंग है। बत्ती",
+    }
+
+
+def test_truncated_json_before_the_answer():
+    result = parse_reply('{"intent": "answer", "language": "portu', LANGUAGES)
+    assert result == {"intent": "answer", "location": None, "language": "english", "answer": ""}
+
+
+@pytest.mark.parametrize("language, expected", [("es", "spanish"), ("pt_BR", "portuguese"), ("Spanish", "spanish"),
+                                                ("klingon", "english"), (None, "english")])
+def test_language_names_and_codes(language, expected):
+    text = reply(intent="answer", location=None, language=language, answer="Hola.")
+    assert parse_reply(text, LANGUAGES)["language"] == expected
+
+
+@pytest.mark.parametrize("fields, intent, location", [
+    # Missing intent: a destination means directions, otherwise a plain answer
+    ({"location": "Central Station"}, "navigate", "Central Station"),
+    ({"location": None}, "answer", None),
+    ({}, "answer", None),
+    # Unknown intent, handled the same way
+    ({"intent": "directions", "location": "Central Station"}, "navigate", "Central Station"),
+    ({"intent": "chitchat", "location": None}, "answer", None),
+    ({"intent": "  Describe "}, "describe", None),
+])
+def test_missing_and_unknown_intent(fields, intent, location):
+    result = parse_reply(reply(language="english", answer="There is a bench to your left.", **fields), LANGUAGES)
+    assert (result["intent"], result["location"], result["answer"]) == (intent, location, "There is a bench to your left.")
+
+
+def test_navigate_with_null_location_uses_the_spoken_destination():
+    text = reply(intent="navigate", location=None, language="english", answer="Opening directions for the pharmacy.")
+    result = parse_reply(text, LANGUAGES)
+    assert (result["intent"], result["location"]) == ("navigate", "the pharmacy")
+
+
+@pytest.mark.parametrize("location", [None, "", "   "])
+def test_navigate_without_any_destination_is_an_answer(location):
+    text = reply(intent="navigate", location=location, language="english", answer="Where would you like to go?")
+    result = parse_reply(text, LANGUAGES)
+    assert (result["intent"], result["location"], result["answer"]) == ("answer", None, "Where would you like to go?")
+
+
+@pytest.mark.parametrize("text", ["", "   \n", "{}", "```json\n{}\n```"])
+def test_empty_body(text):
+    assert parse_reply(text, LANGUAGES) == {"intent": "answer", "location": None, "language": "english", "answer": ""}
+
+
+def test_free_text_without_a_language_line_keeps_the_whole_answer():
+    text = "There is a crosswalk ahead. The light is red, so wait before crossing."
+    assert parse_reply(text, LANGUAGES) == {"intent": "answer", "location": None, "language": "english", "answer": text}
+
+
+def test_free_text_with_a_language_line():
+    text = "Hay un paso de peatones delante. Espere antes de cruzar.\nSpanish"
+    assert parse_reply(text, LANGUAGES) == {
+        "intent": "answer", "location": None, "language": "spanish",
+        "answer": "Hay un paso de peatones delante. Espere antes de cruzar.",
+    }
+
+
+def test_free_text_navigation_and_search():
+    result = parse_reply("Opening directions for Central Station. English", LANGUAGES)
+    assert result == {"intent": "navigate", "location": "Central Station", "language": "english",
+                      "answer": "Opening directions for Central Station."}
+    assert parse_reply("Searching for today's weather.", LANGUAGES)["intent"] == "search"
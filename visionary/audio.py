@@ -0,0 +1,82 @@
+import io
+import logging
+import math
+import os
+
+from pydub import AudioSegment
+from pydub.silence import detect_nonsilent
+from pydub.utils import which
+
+logger = logging.getLogger(__name__)
+
+SAMPLE_RATE = int(os.getenv("VISIONARY_AUDIO_SAMPLE_RATE", "16000"))
+# Audio more than this many dB below the clip's average level, or below the floor, counts as silence
+SILENCE_BELOW_AVERAGE_DB = float(os.getenv("VISIONARY_SILENCE_BELOW_AVERAGE_DB", "16"))
+SILENCE_FLOOR_DBFS = float(os.getenv("VISIONARY_SILENCE_FLOOR_DBFS", "-50"))
+MIN_SPEECH_MS = int(os.getenv("VISIONARY_MIN_SPEECH_MS", "250"))
+# Kept around the detected speech so word onsets and endings aren't clipped
+SPEECH_PADDING_MS = 200
+PREPROCESS_AUDIO = os.getenv("VISIONARY_AUDIO_PREPROCESS", "true").lower() != "false"
+
+# Compressed output needs ffmpeg; without it the clip is still trimmed and downsampled as WAV
+HAS_FFMPEG = bool(which("ffmpeg") or which("avconv"))
+OUTPUT_FORMAT = os.getenv("VISIONARY_AUDIO_FORMAT", "mp3" if HAS_FFMPEG else "wav")
+OUTPUT_BITRATE = os.getenv("VISIONARY_AUDIO_BITRATE", "32k")
+
+if PREPROCESS_AUDIO and not HAS_FFMPEG:
+    logger.warning("ffmpeg not found: only WAV recordings are trimmed, WebM and other formats go to Gemini as recorded")
+
+_OUTPUT_MIME_TYPES = {"mp3": "audio/mpeg", "ogg": "audio/ogg", "flac": "audio/flac", "wav": "audio/wav"}
+_INPUT_FORMATS = {
+    "audio/webm": "webm",
+    "audio/ogg": "ogg",
+    "audio/wav": "wav",
+    "audio/x-wav": "wav",
+    "audio/wave": "wav",
+    "audio/mpeg": "mp3",
+    "audio/mp3": "mp3",
+    "audio/mp4": "mp4",
+    "audio/aac": "aac",
+    "audio/flac": "flac",
+}
+
+
+def prepare_audio(data, mime_type):
+    """
+    Downmix a recording to mono at SAMPLE_RATE, trim leading and trailing silence and
+    re-encode it. Returns (data, mime_type, speech_ms); speech_ms is 0 when the clip
+    is empty, undecodable or holds no speech, and None when preprocessing is off or
+    the format can't be decoded here, in which case the clip is returned as is.
+    Blocking; run it on the audio backend.
+    """
+    if not data:
+        return b"", mime_type, 0
+    input_format = _INPUT_FORMATS.get((mime_type or "").split(";")[0].strip().lower())
+    if not PREPROCESS_AUDIO or not input_format or (input_format != "wav" and not HAS_FFMPEG):
+        return data, mime_type, None
+    try:
+        segment = AudioSegment.from_file(io.BytesIO(data), format=input_format)
+    except Exception as e:
+        logger.warning(f"Could not decode {input_format} recording ({len(data)} bytes): {e}")
+        return b"", mime_type, 0
+
+    segment = segment.set_channels(1).set_frame_rate(SAMPLE_RATE)
+    if len(segment) == 0 or math.isinf(segment.dBFS):
+        return b"", mime_type, 0
+
+    silence_thresh = max(segment.dBFS - SILENCE_BELOW_AVERAGE_DB, SILENCE_FLOOR_DBFS)
+    ranges = detect_nonsilent(segment, min_silence_len=300, silence_thresh=silence_thresh, seek_step=10)
+    speech_ms = sum(end - start for start, end in ranges)
+    if speech_ms < MIN_SPEECH_MS:
+        return b"", mime_type, 0
+
+    start = max(ranges[0][0] - SPEECH_PADDING_MS, 0)
+    end = min(ranges[-1][1] + SPEECH_PADDING_MS, len(segment))
+    segment = segment[start:end]
+
+    buffer = io.BytesIO()
+    if OUTPUT_FORMAT == "wav":
+        segment.set_sample_width(2).export(buffer, format="wav")
+    else:
+        segment.export(buffer, format=OUTPUT_FORMAT, bitrate=OUTPUT_BITRATE)
+    return buffer.getvalue(), _OUTPUT_MIME_TYPES.get(OUTPUT_FORMAT, f"audio/{OUTPUT_FORMAT}"), speech_ms
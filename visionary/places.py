@@ -0,0 +1,66 @@
+import asyncio
+import os
+
+from common.http_client import get_json
+from common.response_cache import ResponseCache, normalize_prompt
+
+# Point this at a local stub server to exercise the lookups without a Google key
+MAPS_API_BASE = os.getenv("GOOGLE_MAPS_API_BASE", "https://maps.googleapis.com").rstrip("/")
+
+# Lookups are cached per keyword and grid cell; 3 decimals is a cell of roughly 100 m
+CELL_DECIMALS = int(os.getenv("VISIONARY_PLACES_CELL_DECIMALS", "3"))
+
+places_cache = ResponseCache(
+    "places",
+    max_entries=int(os.getenv("VISIONARY_PLACES_CACHE_SIZE", "2048")),
+    ttl=float(os.getenv("VISIONARY_PLACES_CACHE_TTL", "86400")),
+)
+
+# Identical lookups that arrive while one is already upstream wait for its result
+_in_flight = {}
+
+
+def geo_cell(latitude, longitude, decimals=CELL_DECIMALS):
+    return f"{round(latitude, decimals)}:{round(longitude, decimals)}"
+
+
+async def find_nearest_place(keyword, latitude, longitude, api_key):
+    """
+    Coordinates of the place nearest to (latitude, longitude) matching keyword, trying
+    Places Nearby Search first and Geocoding second. Returns None if neither finds it.
+    """
+    cell = geo_cell(latitude, longitude)
+    cached = await places_cache.aget(cell, "", keyword)
+    if cached is not None:
+        return cached
+
+    key = (cell, normalize_prompt(keyword))
+    pending = _in_flight.get(key)
+    if pending is not None:
+        return await asyncio.shield(pending)
+    pending = asyncio.ensure_future(_lookup(cell, keyword, latitude, longitude, api_key))
+    _in_flight[key] = pending
+    pending.add_done_callback(lambda _: _in_flight.pop(key, None))
+    return await asyncio.shield(pending)
+
+
+async def _lookup(cell, keyword, latitude, longitude, api_key):
+    data = await get_json(
+        f"{MAPS_API_BASE}/maps/api/place/nearbysearch/json",
+        params={"location": f"{latitude},{longitude}", "rankby": "distance", "keyword": keyword, "key": api_key},
+    )
+    if data.get('results'):
+        location = data['results'][0]['geometry']['location']
+    else:
+        # If no nearby places found, use Geocoding API
+        geocode_data = await get_json(
+            f"{MAPS_API_BASE}/maps/api/geocode/json",
+            params={"address": keyword, "key": api_key},
+        )
+        if not geocode_data.get('results'):
+            return None
+        location = geocode_data['results'][0]['geometry']['location']
+
+    result = {"latitude": location['lat'], "longitude": location['lng']}
+    await places_cache.aput(cell, "", keyword, result)
+    return result
@@ -0,0 +1,143 @@
+import json
+import logging
+import os
+import re
+
+logger = logging.getLogger(__name__)
+
+# Ask Gemini for a JSON reply matching RESPONSE_SCHEMA instead of free text with the language at the end
+STRUCTURED_OUTPUT = os.getenv("VISIONARY_STRUCTURED_OUTPUT", "true").lower() != "false"
+
+INTENTS = ("describe", "navigate", "search", "answer")
+
+STRUCTURED_PROMPT_SUFFIX = """
+For this conversation, ignore rule 5 and reply with a JSON object with these fields:
+- "intent": "describe" for questions about the image, "navigate" for directions or location requests (rule 2), "search" for recent information (rule 3), otherwise "answer".
+- "location": for "navigate", the place the user wants to go to, as they named it; otherwise null.
+- "language": the language of the question, in lowercase English (for example "spanish").
+- "answer": exactly what should be spoken back to the user, following the rules above, without naming the language.
+"""
+
+_SENTENCE_ENDS = ".!?\n。！？।"
+_FENCE = re.compile(r"^\s*```(?:json)?\s*|\s*```\s*$", re.IGNORECASE)
+
+
+def response_schema(languages):
+    """Gemini response schema for a structured reply; language is limited to the voices we have."""
+    return {
+        "type": "OBJECT",
+        "properties": {
+            "intent": {"type": "STRING", "format": "enum", "enum": list(INTENTS)},
+            "location": {"type": "STRING", "nullable": True},
+            "language": {"type": "STRING", "format": "enum", "enum": list(languages)},
+            "answer": {"type": "STRING"},
+        },
+        "required": ["intent", "language", "answer"],
+    }
+
+
+def parse_navigation(text_response):
+    is_navigation = text_response.lower().startswith("opening directions for")
+    location = None
+    if is_navigation:
+        # Use regular expressions for case-insensitive matching
+        match = re.match(r"opening directions for\s*(.+?)[\.\n]", text_response, re.IGNORECASE)
+        if match:
+            location = match.group(1).strip()
+        else:
+            # Fallback: Extract text after the phrase
+            index = text_response.lower().index("opening directions for") + len("opening directions for")
+            location_text = text_response[index:].strip()
+            # Split at the first period or newline
+            location = re.split(r'[\.\n]', location_text, 1)[0].strip()
+        logger.debug(f"Extracted location: {location}")
+    return is_navigation, location
+
+
+def language_name(value, languages, codes=True):
+    """
+    The key of languages (names mapped to (language code, voices)) for a language name
+    ("Spanish") or, with codes, a language code ("es", "es-ES", "pt_BR"). None if unknown.
+    """
+    candidate = str(value or "").strip().strip(".:*#()").lower()
+    if candidate in languages or not codes:
+        return candidate if candidate in languages else None
+    candidate = candidate.replace("_", "-")
+    for name, (code, _) in languages.items():
+        if candidate == code.lower():
+            return name
+    for name, (code, _) in languages.items():
+        if candidate == code.split("-")[0].lower():
+            return name
+    return None
+
+
+def _reply(intent, location, language, answer):
+    intent = str(intent or "").strip().lower()
+    location = location.strip() if isinstance(location, str) and location.strip() else None
+    if intent not in INTENTS:
+        intent = "navigate" if location else "answer"
+    if intent == "navigate" and location is None:
+        # Fall back to the spoken confirmation ("Opening directions for ...") for the place
+        is_navigation, location = parse_navigation(answer)
+        if not (is_navigation and location):
+            intent, location = "answer", None
+    return {"intent": intent, "location": location, "language": language, "answer": answer}
+
+
+def _json_field(text, name):
+    # Pulls one string field out of JSON that doesn't parse (cut off, unescaped quotes further on)
+    match = re.search(rf'"{name}"\s*:\s*"((?:[^"\\]|\\.)*)"?', text)
+    if not match:
+        return None
+    try:
+        return json.loads(f'"{match.group(1)}"')
+    except ValueError:
+        return match.group(1)
+
+
+def parse_structured(text, languages):
+    """Parse a JSON reply; returns None if the reply isn't JSON. A reply without an answer gets an empty one."""
+    body = _FENCE.sub("", text.strip())
+    if not body.startswith("{"):
+        return None
+    try:
+        data = json.loads(body[:body.rfind("}") + 1])
+    except ValueError:
+        data = None
+    if not isinstance(data, dict):
+        data = {name: _json_field(body, name) for name in ("intent", "location", "language", "answer")}
+    answer = data.get("answer")
+    answer = answer.strip() if isinstance(answer, str) else ""
+    language = language_name(data.get("language"), languages) or "english"
+    return _reply(data.get("intent"), data.get("location"), language, answer)
+
+
+def parse_free_text(text, languages):
+    """Parse the free-text reply format: the answer followed by the name of its language."""
+    is_navigation, location = parse_navigation(text)
+    content = text.strip()
+    language = "english"
+    # The language is named after the last sentence or on the last line; anything else is part of the answer
+    stripped = content.rstrip(". \n")
+    cut = max(stripped.rfind(mark) for mark in _SENTENCE_ENDS)
+    if cut > 0:
+        named = language_name(stripped[cut + 1:], languages, codes=False)
+        if named:
+            content, language = stripped[:cut + 1].strip(), named
+    if is_navigation:
+        intent = "navigate"
+    elif content.lower().startswith("searching"):
+        intent = "search"
+    else:
+        intent = "answer"
+    return {"intent": intent, "location": location, "language": language, "answer": content}
+
+
+def parse_reply(text, languages):
+    """
+    Turn Gemini's reply into {"intent", "location", "language", "answer"}. JSON replies are read
+    field by field, salvaging what they can when the JSON is cut off or wrapped in a code fence;
+    anything else goes through the free-text parser.
+    """
+    return parse_structured(text, languages) or parse_free_text(text, languages)
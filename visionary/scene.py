@@ -0,0 +1,106 @@
+import os
+import time
+from collections import deque
+
+from common.images import hamming
+
+# A frame is described again once its hash is this many bits (of 64) away from the last described one
+SCENE_CHANGE_BITS = int(os.getenv("VISIONARY_SCENE_CHANGE_BITS", "12"))
+# At most one description call per this many seconds, however fast the scene changes
+SCENE_MIN_INTERVAL = float(os.getenv("VISIONARY_SCENE_MIN_INTERVAL", "3"))
+# Descriptions older than this are refreshed even if the frames look the same; 0 never refreshes
+SCENE_MAX_AGE = float(os.getenv("VISIONARY_SCENE_MAX_AGE", "60"))
+# How often the page sends a frame while scene mode is on
+SCENE_FRAME_INTERVAL_MS = int(os.getenv("VISIONARY_SCENE_FRAME_INTERVAL_MS", "1000"))
+SCENE_HISTORY = 4
+
+NO_CHANGE = "NO CHANGE"
+# First line of a scene answer that needs the camera frame after all
+LOOK = "LOOK"
+
+SCENE_PROMPT = """
+You are the eyes of a blind user who is walking with their phone camera pointed ahead.
+Describe the scene in the image in two or three short sentences, in {language}: first anything that matters for their safety (obstacles, steps, traffic, people in the way), then the main objects and signs, with rough directions (ahead, on the left, on the right).
+{previous}
+"""
+
+PREVIOUS_SCENE = f"""Your previous descriptions, oldest first:
+{{history}}
+If nothing that matters to the user has changed since the last one, answer exactly "{NO_CHANGE}". Otherwise describe the current scene, starting with what is new."""
+
+# Appended to the streaming voice prompt when a question is answered from the scene description
+SCENE_QUESTION_SUFFIX = f"""
+Instead of an image you get a description of what the user's camera currently sees, written {{age}} seconds ago:
+"{{description}}"
+Answer questions about the surroundings from that description. If answering needs visual detail the description does not contain (reading text, colours, counting, identifying a specific object), answer with only the word {LOOK} on the first line and nothing else.
+"""
+
+
+class SceneState:
+    """
+    Rolling scene context for one scene-mode socket: the latest camera frame, the
+    description of the last frame that was sent to Gemini and a few before it.
+    Frames are compared with the described frame, not the previous one, so a slow
+    pan still adds up to a change.
+    """
+
+    def __init__(self, change_bits=SCENE_CHANGE_BITS, min_interval=SCENE_MIN_INTERVAL, max_age=SCENE_MAX_AGE,
+                 clock=time.monotonic):
+        self.change_bits = change_bits
+        self.min_interval = min_interval
+        self.max_age = max_age
+        self.clock = clock
+        self.frame = None  # (data, mime_type, dhash) of the latest frame
+        self.described_hash = None
+        self.description = None
+        self.described_at = 0.0
+        self.requested_at = None
+        self.version = 0
+        self.history = deque(maxlen=SCENE_HISTORY)
+
+    def observe(self, data, mime_type, frame_hash):
+        """Keep a new frame. Returns "changed", "unchanged" or "throttled" (changed, but too soon)."""
+        self.frame = (data, mime_type, frame_hash)
+        now = self.clock()
+        if self.description is None:
+            # Nothing described yet, or the first call failed
+            changed = True
+        elif frame_hash is not None and self.described_hash is not None:
+            changed = hamming(frame_hash, self.described_hash) >= self.change_bits
+        else:
+            # Frames we couldn't hash only trigger the periodic refresh
+            changed = False
+        if not changed and self.max_age and now - self.described_at >= self.max_age:
+            changed = True
+        if not changed:
+            return "unchanged"
+        if self.requested_at is not None and now - self.requested_at < self.min_interval:
+            return "throttled"
+        return "changed"
+
+    def begin(self):
+        """Mark a description as requested and return the frame to describe."""
+        self.requested_at = self.clock()
+        return self.frame
+
+    def update(self, text, frame_hash):
+        """Record Gemini's answer for the frame with frame_hash. Returns True if the description changed."""
+        self.described_hash = frame_hash
+        self.described_at = self.clock()
+        text = text.strip()
+        if not text or (text.upper().strip(' ."') == NO_CHANGE and self.description is not None):
+            return False
+        self.description = text
+        self.history.append(text)
+        self.version += 1
+        return True
+
+    def age(self):
+        return int(self.clock() - self.described_at) if self.description else None
+
+    def prompt(self, language):
+        previous = PREVIOUS_SCENE.format(history="\n".join(f"- {text}" for text in self.history)) if self.history else ""
+        return SCENE_PROMPT.format(language=language, previous=previous)
+
+    def question_suffix(self):
+        return SCENE_QUESTION_SUFFIX.format(age=self.age(), description=self.description)
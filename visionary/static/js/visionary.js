@@ -15,7 +15,15 @@ let navigationInProgress = false;
 let navigationData = null;
 let currentStepIndex = 0;
 let positionUpdateTimer = null; // For setInterval-based position updates
+let lastKnownPosition = null; // Sent with each question so directions can be resolved in the same request
 const positionUpdateInterval = 10000; // 10 seconds
+let voiceSocket = null;
+let audioQueue = []; // Sentences streamed over the voice socket, played one after another
+let sceneMode = false; // Streams camera frames so questions are answered from a running scene description
+let sceneSocket = null;
+let sceneFrameTimer = null;
+let sceneQuery = null; // { resolve, reject, started } for the question in flight on the scene socket
+let scenePendingAudio = null;
 
 // Start the app when the page loads
 window.addEventListener('load', startApp);
@@ -39,6 +47,8 @@ async function startApp() {
         setupInteractionDetection();
         console.log('Interaction detection set up successfully');
 
+        setupSceneMode();
+
         console.log('App started successfully');
     } catch (error) {
         console.error('Error starting app:', error);
@@ -83,10 +93,21 @@ async function setupVideoStream() {
 
 async function setupGeolocation() {
     return new Promise((resolve, reject) => {
-        navigator.geolocation.getCurrentPosition(resolve, reject);
+        navigator.geolocation.getCurrentPosition((position) => {
+            lastKnownPosition = position.coords;
+            resolve(position);
+        }, reject);
     });
 }
 
+function refreshLastKnownPosition() {
+    navigator.geolocation.getCurrentPosition(
+        (position) => { lastKnownPosition = position.coords; },
+        () => {},
+        { maximumAge: 60000, timeout: 10000 }
+    );
+}
+
 function setupMotionDetection() {
     if (window.DeviceMotionEvent) {
         window.addEventListener('devicemotion', handleMotionEvent, true);
@@ -182,10 +203,7 @@ function playAuditoryFeedback() {
 }
 
 function stopAudioAndResetApp() {
-    if (audioPlayer) {
-        audioPlayer.pause();
-        audioPlayer.currentTime = 0;
-    }
+    stopAudioQueue();
     stopRecording();
     stopPositionUpdates(); // Stop position updates
     navigationInProgress = false;
@@ -217,6 +235,7 @@ async function startRecording() {
         };
 
         mediaRecorder.onstop = sendAudioAndImageToBackend;
+        refreshLastKnownPosition();
 
         mediaRecorder.start();
         isRecording = true;
@@ -230,6 +249,16 @@ async function startRecording() {
 
 async function sendAudioAndImageToBackend() {
     const audioBlob = new Blob(audioChunks, { type: 'audio/webm' });
+
+    if (sceneMode && sceneSocket) {
+        try {
+            await askScene(audioBlob);
+            return;
+        } catch (error) {
+            console.warn('Scene question failed, sending the frame instead:', error);
+        }
+    }
+
     const imageBlob = await captureImage();
 
     if (!imageBlob) {
@@ -238,29 +267,229 @@ async function sendAudioAndImageToBackend() {
         return;
     }
 
+    try {
+        await streamAudioAndImage(audioBlob, imageBlob);
+    } catch (error) {
+        console.warn('Streaming unavailable, falling back to a single request:', error);
+        await postAudioAndImage(audioBlob, imageBlob);
+    }
+}
+
+function openVoiceSocket() {
+    if (voiceSocket && voiceSocket.readyState === WebSocket.OPEN) {
+        return Promise.resolve(voiceSocket);
+    }
+    return new Promise((resolve, reject) => {
+        const protocol = location.protocol === 'https:' ? 'wss:' : 'ws:';
+        const socket = new WebSocket(`${protocol}//${location.host}/visionary/ws/voice`);
+        socket.binaryType = 'blob';
+        socket.onopen = () => {
+            voiceSocket = socket;
+            resolve(socket);
+        };
+        socket.onerror = () => reject(new Error('Voice socket failed to open'));
+        socket.onclose = () => {
+            if (voiceSocket === socket) voiceSocket = null;
+        };
+    });
+}
+
+async function streamAudioAndImage(audioBlob, imageBlob) {
+    const socket = await openVoiceSocket();
+    stopAudioQueue();
+
+    return new Promise((resolve, reject) => {
+        let pendingAudio = null;
+        let started = false;
+
+        socket.onmessage = (event) => {
+            if (typeof event.data !== 'string') {
+                // Binary frame: MP3 for the sentence announced by the preceding "audio" message
+                enqueueAudio(new Blob([event.data], { type: pendingAudio ? pendingAudio.mime_type : 'audio/mpeg' }));
+                pendingAudio = null;
+                started = true;
+                return;
+            }
+            const message = JSON.parse(event.data);
+            if (message.type === 'audio') {
+                pendingAudio = message;
+            } else if (message.type === 'navigation') {
+                handleNavigation(message.location);
+            } else if (message.type === 'done') {
+                console.log('Streamed response:', message.response);
+                resolve(message);
+            } else if (message.type === 'error') {
+                if (started) {
+                    resolve(message);
+                } else {
+                    reject(new Error(message.error));
+                }
+            }
+        };
+        socket.onclose = () => {
+            voiceSocket = null;
+            if (started) {
+                resolve(null);
+            } else {
+                reject(new Error('Voice socket closed'));
+            }
+        };
+
+        socket.send(JSON.stringify({ audio_type: audioBlob.type, image_type: imageBlob.type || 'image/jpeg' }));
+        socket.send(audioBlob);
+        socket.send(imageBlob);
+    });
+}
+
+function setupSceneMode() {
+    const sceneBtn = document.getElementById('sceneBtn');
+    // Keep taps on the button from also toggling the recording
+    ['touchstart', 'mousedown'].forEach(type => sceneBtn.addEventListener(type, event => event.stopPropagation()));
+    sceneBtn.addEventListener('click', toggleSceneMode);
+    if (new URLSearchParams(location.search).get('scene') === '1' || localStorage.getItem('visionarySceneMode') === 'on') {
+        startSceneMode();
+    }
+}
+
+async function toggleSceneMode() {
+    if (sceneMode) {
+        stopSceneMode();
+    } else {
+        await startSceneMode();
+    }
+    localStorage.setItem('visionarySceneMode', sceneMode ? 'on' : 'off');
+    playAudioResponse(await synthesize_speech(sceneMode ? 'Scene mode on.' : 'Scene mode off.', 'english'));
+}
+
+function openSceneSocket() {
+    return new Promise((resolve, reject) => {
+        const protocol = location.protocol === 'https:' ? 'wss:' : 'ws:';
+        const socket = new WebSocket(`${protocol}//${location.host}/visionary/ws/scene`);
+        socket.binaryType = 'blob';
+        // The first message says how often the server wants a frame
+        socket.onmessage = (event) => {
+            socket.onmessage = handleSceneMessage;
+            resolve({ socket, frameInterval: JSON.parse(event.data).frame_interval_ms });
+        };
+        socket.onerror = () => reject(new Error('Scene socket failed to open'));
+        socket.onclose = () => {
+            if (sceneQuery) {
+                sceneQuery.reject(new Error('Scene socket closed'));
+                sceneQuery = null;
+            }
+            if (sceneSocket === socket) stopSceneMode();
+        };
+    });
+}
+
+async function startSceneMode() {
+    try {
+        const { socket, frameInterval } = await openSceneSocket();
+        sceneSocket = socket;
+        sceneMode = true;
+        socket.send(JSON.stringify({ type: 'start', announce: true, language: 'english' }));
+        sceneFrameTimer = setInterval(sendSceneFrame, frameInterval);
+        updateSceneButton();
+    } catch (error) {
+        console.warn('Scene mode unavailable:', error);
+    }
+}
+
+function stopSceneMode() {
+    sceneMode = false;
+    clearInterval(sceneFrameTimer);
+    sceneFrameTimer = null;
+    if (sceneSocket) {
+        const socket = sceneSocket;
+        sceneSocket = null;
+        socket.close();
+    }
+    updateSceneButton();
+}
+
+function updateSceneButton() {
+    const sceneBtn = document.getElementById('sceneBtn');
+    sceneBtn.setAttribute('aria-pressed', String(sceneMode));
+    sceneBtn.classList.toggle('bg-blue-500', sceneMode);
+    sceneBtn.classList.toggle('text-white', sceneMode);
+    sceneBtn.classList.toggle('bg-gray-200', !sceneMode);
+}
+
+async function sendSceneFrame() {
+    // Skip a tick instead of queueing frames behind a slow uplink
+    if (!sceneSocket || sceneSocket.bufferedAmount > 0) return;
+    const frame = await captureImage(640, 0.7);
+    if (frame && sceneSocket) {
+        sceneSocket.send(frame);
+    }
+}
+
+function handleSceneMessage(event) {
+    if (typeof event.data !== 'string') {
+        // MP3 for the scene update or answer sentence announced by the preceding message
+        enqueueAudio(new Blob([event.data], { type: scenePendingAudio ? scenePendingAudio.mime_type : 'audio/mpeg' }));
+        scenePendingAudio = null;
+        return;
+    }
+    const message = JSON.parse(event.data);
+    if (message.type === 'scene') {
+        console.log('Scene:', message.description);
+        if (message.mime_type) scenePendingAudio = message;
+    } else if (message.type === 'audio') {
+        scenePendingAudio = message;
+        if (sceneQuery) sceneQuery.started = true;
+    } else if (message.type === 'navigation') {
+        handleNavigation(message.location);
+    } else if (message.type === 'done' || message.type === 'error') {
+        const query = sceneQuery;
+        sceneQuery = null;
+        if (!query) return;
+        if (message.type === 'done' || query.started) {
+            console.log('Scene answer:', message.response);
+            query.resolve(message);
+        } else {
+            query.reject(new Error(message.error));
+        }
+    }
+}
+
+function askScene(audioBlob) {
+    stopAudioQueue();
+    return new Promise((resolve, reject) => {
+        sceneQuery = { resolve, reject, started: false };
+        sceneSocket.send(JSON.stringify({ type: 'question', audio_type: audioBlob.type }));
+        sceneSocket.send(audioBlob);
+    });
+}
+
+async function postAudioAndImage(audioBlob, imageBlob) {
     const formData = new FormData();
     formData.append('audio', audioBlob, 'recording.webm');
     formData.append('image', imageBlob, 'capture.jpg');
+    if (lastKnownPosition) {
+        formData.append('latitude', lastKnownPosition.latitude);
+        formData.append('longitude', lastKnownPosition.longitude);
+    }
 
     try {
-        const response = await fetch('/process_audio_and_image', {
+        const response = await fetch('/visionary/process_audio_and_image', {
             method: 'POST',
             body: formData
         });
 
-        if (!response.ok) {
+        const result = await response.json();
+
+        if (!response.ok && !result.audio) {
             throw new Error(`HTTP error! status: ${response.status}`);
         }
 
-        const result = await response.json();
-
         if (!result.audio) {
             throw new Error("Response does not contain audio data");
         }
 
         if (result.is_navigation) {
             playAudioResponse(result.audio);
-            handleNavigation(result.location);
+            handleNavigation(result.location, result.destination);
         } else if (result.is_searching) {
             playAudioResponse(result.audio);
         } else {
@@ -272,17 +501,49 @@ async function sendAudioAndImageToBackend() {
     }
 }
 
-async function captureImage() {
+function enqueueAudio(audioBlob) {
+    audioQueue.push(URL.createObjectURL(audioBlob));
+    if (!audioPlayer || audioPlayer.paused || audioPlayer.ended) {
+        playNextInQueue();
+    }
+}
+
+function playNextInQueue() {
+    const audioUrl = audioQueue.shift();
+    if (!audioUrl) return;
+    audioPlayer = new Audio(audioUrl);
+    audioPlayer.onended = () => {
+        URL.revokeObjectURL(audioUrl);
+        playNextInQueue();
+    };
+    audioPlayer.play().catch(error => {
+        console.error('Audio playback failed:', error);
+        playNextInQueue();
+    });
+}
+
+function stopAudioQueue() {
+    audioQueue.forEach(url => URL.revokeObjectURL(url));
+    audioQueue = [];
+    if (audioPlayer) {
+        audioPlayer.onended = null;
+        audioPlayer.pause();
+        audioPlayer.currentTime = 0;
+    }
+}
+
+async function captureImage(maxDimension = 0, quality = undefined) {
     if (!video.srcObject) {
         console.error('Video stream is not available');
         return null;
     }
 
+    const scale = maxDimension ? Math.min(1, maxDimension / Math.max(video.videoWidth, video.videoHeight)) : 1;
     const canvas = document.createElement('canvas');
-    canvas.width = video.videoWidth;
-    canvas.height = video.videoHeight;
-    canvas.getContext('2d').drawImage(video, 0, 0);
-    return new Promise(resolve => canvas.toBlob(resolve, 'image/jpeg'));
+    canvas.width = Math.round(video.videoWidth * scale);
+    canvas.height = Math.round(video.videoHeight * scale);
+    canvas.getContext('2d').drawImage(video, 0, 0, canvas.width, canvas.height);
+    return new Promise(resolve => canvas.toBlob(resolve, 'image/jpeg', quality));
 }
 
 function stopRecording() {
@@ -302,7 +563,7 @@ function stopRecording() {
 // Implement the function to get destination coordinates from the backend
 async function getDestinationCoordinates(destination, latitude, longitude) {
     try {
-        const response = await fetch('/get_nearest_place', {
+        const response = await fetch('/visionary/get_nearest_place', {
             method: 'POST',
             headers: { 'Content-Type': 'application/json' },
             body: JSON.stringify({ keyword: destination, latitude, longitude })
@@ -331,7 +592,7 @@ async function getDestinationCoordinates(destination, latitude, longitude) {
     }
 }
 
-async function handleNavigation(destination) {
+async function handleNavigation(destination, destinationPlace = null) {
     console.log("Handling navigation for", destination);
 
     function handleGeolocationError(errorMessage) {
@@ -355,8 +616,10 @@ async function handleNavigation(destination) {
             console.log("Current Latitude:", latitude, "Longitude:", longitude);
 
             try {
-                // Get destination coordinates from the backend
-                const destinationCoords = await getDestinationCoordinates(destination, latitude, longitude);
+                // Get destination coordinates from the backend, unless they came with the answer
+                const destinationCoords = destinationPlace
+                    ? [destinationPlace.longitude, destinationPlace.latitude]
+                    : await getDestinationCoordinates(destination, latitude, longitude);
                 const [destinationLng, destinationLat] = destinationCoords;
 
                 console.log("Destination coordinates:", destinationLat, destinationLng);
@@ -512,10 +775,7 @@ function playAudioResponse(audioBase64) {
 
         const audioBlob = base64ToBlob(base64Data, 'audio/mp3');
         const audioUrl = URL.createObjectURL(audioBlob);
-        if (audioPlayer) {
-            audioPlayer.pause();
-            audioPlayer.currentTime = 0;
-        }
+        stopAudioQueue();
         audioPlayer = new Audio(audioUrl);
         audioPlayer.play().catch(error => {
             console.error('Audio playback failed:', error);
@@ -537,7 +797,7 @@ function base64ToBlob(base64, mimeType) {
 
 async function synthesize_speech(text, language) {
     try {
-        const response = await fetch('/synthesize_speech', {
+        const response = await fetch('/visionary/synthesize_speech', {
             method: 'POST',
             headers: { 'Content-Type': 'application/json' },
             body: JSON.stringify({ text, language })
@@ -0,0 +1,48 @@
+import re
+
+# The non-streaming prompt names the language at the end of the answer, which is too late
+# to pick a TTS voice for the first sentence. The streaming prompt asks for it up front.
+STREAMING_PROMPT_SUFFIX = """
+For this conversation, ignore rule 5. Instead, start your response with the name of the language you are answering in, in English and on its own line (for example "Spanish"), followed by the answer itself.
+"""
+
+_SENTENCE_END = re.compile(r"(?<=[.!?。！？])\s+|\n+")
+
+
+class SentenceBuffer:
+    """Accumulates streamed text and hands out complete sentences as soon as they end."""
+
+    def __init__(self, min_length=20):
+        # Very short fragments ("Yes.") are merged with what follows to avoid choppy audio
+        self.min_length = min_length
+        self._buffer = ""
+
+    def feed(self, text):
+        self._buffer += text
+        sentences = []
+        while True:
+            match = _SENTENCE_END.search(self._buffer)
+            if not match:
+                break
+            candidate = self._buffer[:match.start()].strip()
+            if len(candidate) < self.min_length and "\n" not in match.group(0):
+                # Look for the next boundary instead of emitting a tiny fragment
+                next_match = _SENTENCE_END.search(self._buffer, match.end())
+                if not next_match:
+                    break
+                candidate = self._buffer[:next_match.start()].strip()
+                match = next_match
+            self._buffer = self._buffer[match.end():]
+            if candidate:
+                sentences.append(candidate)
+        return sentences
+
+    def flush(self):
+        rest, self._buffer = self._buffer.strip(), ""
+        return [rest] if rest else []
+
+
+def split_language_header(first_line, known_languages):
+    """Return the language named on the first streamed line, or None if it isn't one."""
+    candidate = first_line.strip().strip(".:*#").strip().lower()
+    return candidate if candidate in known_languages else None
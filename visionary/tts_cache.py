@@ -0,0 +1,171 @@
+import hashlib
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+from common.response_cache import caches
+
+NO_SPEECH_MESSAGE = "I didn't hear anything. Please try again."
+NO_SCENE_MESSAGE = "I haven't seen anything yet. Hold the camera steady for a moment."
+
+# Fixed phrases the Visionary page asks /synthesize_speech for; warmed at startup
+COMMON_PHRASES = [
+    NO_SPEECH_MESSAGE,
+    NO_SCENE_MESSAGE,
+    "Scene mode on.",
+    "Scene mode off.",
+    "I'm sorry, but I couldn't capture an image. Please try again.",
+    "I'm sorry, but there was an error processing your request. Please try again.",
+    "Sorry, there was an error processing your request.",
+    "There was an error fetching navigation data.",
+    "No route found. Please try again.",
+    "You have arrived at your destination.",
+    "Location not found",
+    "Location access denied. Please enable location services and try again.",
+    "Unable to access location. Please check your connection and try again.",
+    "Location request timed out. Please try again.",
+    "Unable to access location. Please try again.",
+]
+
+
+class AudioCache:
+    """
+    Content-addressed cache of synthesized speech, keyed by (text, language, voice, encoding).
+
+    Recently used clips are kept in memory up to max_bytes; every clip is also written
+    to cache_dir (when set) so it survives restarts and is shared between workers. Once
+    the directory grows past max_disk_bytes, the least recently used clips are deleted.
+    """
+
+    def __init__(self, name, max_bytes, cache_dir=None, max_disk_bytes=None):
+        self.name = name
+        self.max_bytes = max_bytes
+        self.cache_dir = cache_dir
+        self.max_disk_bytes = max_disk_bytes
+        self.stats = {"hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0, "disk_evictions": 0}
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._disk_bytes = None  # Counted on the first write
+        self._lock = threading.Lock()
+        self._disk_lock = threading.Lock()
+        caches[name] = self
+
+    @staticmethod
+    def key(text, language, voice, encoding):
+        return hashlib.sha256(f"{text}\0{language}\0{voice}\0{encoding}".encode("utf-8")).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key[:2], key)
+
+    def get(self, key):
+        with self._lock:
+            audio = self._entries.get(key)
+            if audio is not None:
+                self._entries.move_to_end(key)
+                self.stats["hits"] += 1
+                return audio
+        if self.cache_dir:
+            try:
+                with open(self._path(key), "rb") as f:
+                    audio = f.read()
+                # The modification time doubles as the last use, for disk eviction
+                os.utime(self._path(key))
+            except FileNotFoundError:
+                audio = None
+        with self._lock:
+            if audio:
+                self.stats["disk_hits"] += 1
+                self._remember(key, audio)
+                return audio
+            self.stats["misses"] += 1
+        return None
+
+    def put(self, key, audio):
+        if self.cache_dir:
+            path = self._path(key)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp")
+            with os.fdopen(fd, "wb") as f:
+                f.write(audio)
+            os.replace(tmp_path, path)
+            if self.max_disk_bytes:
+                self._account_disk(len(audio))
+        with self._lock:
+            self._remember(key, audio)
+
+    def _disk_files(self):
+        # (mtime, size, path) of every clip; other workers may delete files while we look
+        files = []
+        for root, _, names in os.walk(self.cache_dir):
+            for name in names:
+                if name.startswith("."):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, path))
+        return files
+
+    def _account_disk(self, size):
+        with self._disk_lock:
+            if self._disk_bytes is None:
+                self._disk_bytes = sum(size for _, size, _ in self._disk_files())
+            else:
+                self._disk_bytes += size
+            if self._disk_bytes <= self.max_disk_bytes:
+                return
+            # Trim to 90% of the cap, so the directory isn't walked again on the next write
+            files = sorted(self._disk_files())
+            total = sum(size for _, size, _ in files)
+            for _, size, path in files:
+                if total <= self.max_disk_bytes * 0.9:
+                    break
+                try:
+                    os.remove(path)
+                    self.stats["disk_evictions"] += 1
+                except FileNotFoundError:
+                    pass
+                total -= size
+            self._disk_bytes = total
+
+    def _remember(self, key, audio):
+        if key in self._entries:
+            self._bytes -= len(self._entries.pop(key))
+        self._entries[key] = audio
+        self._bytes += len(audio)
+        while self._bytes > self.max_bytes and len(self._entries) > 1:
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= len(evicted)
+            self.stats["evictions"] += 1
+
+    def snapshot(self):
+        with self._lock:
+            lookups = self.stats["hits"] + self.stats["disk_hits"] + self.stats["misses"]
+            return {
+                **self.stats,
+                "size": len(self._entries),
+                "memory_bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "max_disk_bytes": self.max_disk_bytes,
+                "hit_rate": (self.stats["hits"] + self.stats["disk_hits"]) / lookups if lookups else 0.0,
+            }
+
+
+def load_warmup_phrases(path=None):
+    """COMMON_PHRASES plus one phrase per line from path, as (text, language) pairs.
+
+    Lines may start with a language name and a tab, e.g. "hindi\tकृपया पुनः प्रयास करें।".
+    """
+    phrases = [(text, "english") for text in COMMON_PHRASES]
+    if path:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                line = line.rstrip("\n")
+                if not line.strip():
+                    continue
+                language, _, text = line.rpartition("\t")
+                phrases.append((text.strip(), language.strip().lower() or "english"))
+    return phrases
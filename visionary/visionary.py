@@ -1,36 +1,34 @@
-from fastapi import FastAPI, Request, File, UploadFile, HTTPException, APIRouter
-from fastapi.middleware.cors import CORSMiddleware  # Added for CORS
+from fastapi import FastAPI, Request, File, Form, UploadFile, HTTPException, APIRouter, WebSocket, WebSocketDisconnect
 from fastapi.templating import Jinja2Templates
 from fastapi.responses import HTMLResponse, JSONResponse
-from fastapi.staticfiles import StaticFiles
-import uvicorn
 import google.generativeai as genai
-from google.cloud import texttospeech_v1 as texttospeech
-from google.oauth2 import service_account
 from dotenv import load_dotenv
 import os
+import asyncio
+import threading
 import base64
+import json
+import logging
 from collections import deque
-import re
-import requests
+from common.backends import run_blocking, stream_blocking, BackendTimeoutError
+from common.response_cache import ResponseCache, attachment_hash
+from visionary.streaming import STREAMING_PROMPT_SUFFIX, SentenceBuffer, split_language_header
+from visionary.tts_cache import AudioCache, load_warmup_phrases, NO_SCENE_MESSAGE, NO_SPEECH_MESSAGE
+from visionary.scene import LOOK, SCENE_FRAME_INTERVAL_MS, SceneState
+from visionary.audio import prepare_audio
+from visionary.places import find_nearest_place
+from visionary.replies import STRUCTURED_OUTPUT, STRUCTURED_PROMPT_SUFFIX, parse_navigation, parse_reply, response_schema
+from common.http_client import close_http_client
+from common.images import FrameCache, prepare_image
+from common.telemetry import current_timings, metrics, request_trace, span
+from common.static_assets import StaticAssets, page_response, static_url
+from contextlib import aclosing, asynccontextmanager
+
+logger = logging.getLogger(__name__)
 
 # Load environment variables
 load_dotenv()
 
-app = FastAPI()
-
-# Configure CORS
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],  # Adjust according to your security needs
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
-
-# Mount static files for Visionary system
-app.mount("/static", StaticFiles(directory="static"), name="static")
-
 # Setup templates for Visionary
 visionary_templates = Jinja2Templates(directory="visionary/templates")
 
@@ -39,14 +37,25 @@ def set_templates(templates):
     global visionary_templates
     visionary_templates = templates
 
+@asynccontextmanager
+async def visionary_lifespan(app):
+    # Warm the TTS cache in the background so startup isn't held up by the API calls
+    warmup = None
+    if os.getenv("VISIONARY_TTS_WARMUP", "1") != "0" and credentials_path:
+        warmup = asyncio.create_task(warm_tts_cache(os.getenv("VISIONARY_TTS_WARMUP_FILE")))
+    yield
+    if warmup is not None and not warmup.done():
+        warmup.cancel()
+    await close_http_client()
+
 # Setup API router for Visionary system
-visionary_router = APIRouter()
+visionary_router = APIRouter(lifespan=visionary_lifespan)
 
 
 # Configure Gemini API
 genai_api_key = os.getenv("GEMINI_API_KEY")
 if not genai_api_key:
-    print("Warning: GEMINI_API_KEY is not set in the environment variables")
+    logger.warning("GEMINI_API_KEY is not set in the environment variables")
 else:
     genai.configure(api_key=genai_api_key)
     model = genai.GenerativeModel('gemini-1.5-flash')
@@ -54,20 +63,32 @@ else:
 # Configure Text-to-Speech client
 credentials_path = os.getenv("GOOGLE_APPLICATION_CREDENTIALS")
 if not credentials_path:
-    print("Warning: GOOGLE_APPLICATION_CREDENTIALS environment variable is not set")
-else:
-    credentials = service_account.Credentials.from_service_account_file(str(credentials_path))
-    tts_client = texttospeech.TextToSpeechClient(credentials=credentials)
+    logger.warning("GOOGLE_APPLICATION_CREDENTIALS environment variable is not set")
+
+# The client (and the google-cloud import behind it) is created on first synthesis
+tts_client = None
+_tts_client_lock = threading.Lock()
+
+def get_tts_client():
+    global tts_client
+    with _tts_client_lock:
+        if tts_client is None:
+            from google.cloud import texttospeech_v1 as texttospeech
+            from google.oauth2 import service_account
+
+            credentials = service_account.Credentials.from_service_account_file(str(credentials_path))
+            tts_client = texttospeech.TextToSpeechClient(credentials=credentials)
+    return tts_client
 
 # Mapbox API key
 mapbox_api_key = os.getenv("MAPBOX_API_KEY")
 if not mapbox_api_key:
-    print("Warning: MAPBOX_API_KEY is not set in the environment variables")
+    logger.warning("MAPBOX_API_KEY is not set in the environment variables")
 
 # Google Places API key
 google_places_api_key = os.getenv("GOOGLE_PLACES_API_KEY")
 if not google_places_api_key:
-    print("Warning: GOOGLE_PLACES_API_KEY is not set in the environment variables")
+    logger.warning("GOOGLE_PLACES_API_KEY is not set in the environment variables")
 
 DEFAULT_PROMPT = """
 Please respond to my audio questions by only following these specific rules:
@@ -83,102 +104,425 @@ Please respond to my audio questions by only following these specific rules:
 5. End each response by specifying the language used.
 """
 
+# Identical audio+image uploads (retries, double taps) are answered from memory
+response_cache = ResponseCache(
+    "visionary",
+    max_entries=int(os.getenv("VISIONARY_CACHE_SIZE", "256")),
+    ttl=float(os.getenv("VISIONARY_CACHE_TTL", "300")),
+)
+PROMPT_VERSION = attachment_hash(DEFAULT_PROMPT, STRUCTURED_PROMPT_SUFFIX if STRUCTURED_OUTPUT else "")[:12]
+
+# A re-sent recording with a near-identical camera frame reuses the previous answer.
+# The frame alone isn't enough: the same scene with a different question needs a new one.
+frame_dedupe_bits = int(os.getenv("VISIONARY_FRAME_DEDUPE_BITS", "4"))
+frame_cache = FrameCache(
+    max_scopes=int(os.getenv("VISIONARY_CACHE_SIZE", "256")),
+    max_distance=frame_dedupe_bits,
+    ttl=float(os.getenv("VISIONARY_CACHE_TTL", "300")),
+) if frame_dedupe_bits > 0 else None
+
 @visionary_router.get("/", response_class=HTMLResponse)
 async def root(request: Request):
     # Pass the API key to the template for frontend use
-    return visionary_templates.TemplateResponse("visionary.html", {
-        "request": request,
-        "mapbox_api_key": mapbox_api_key
-    })
+    return page_response(request, visionary_templates, "visionary.html", mapbox_api_key=mapbox_api_key)
+
+async def _lookup_destination(location, latitude, longitude):
+    # Resolved in the same request as the answer, so the page can start routing without asking again
+    if latitude is None or longitude is None or not google_places_api_key:
+        return None
+    try:
+        return await find_nearest_place(location, latitude, longitude, google_places_api_key)
+    except Exception as e:
+        logger.warning(f"Error fetching location: {e}")
+        return None
+
+async def _with_destination(result, latitude, longitude):
+    if not result.get("is_navigation") or not result.get("location"):
+        return result
+    destination = await _lookup_destination(result["location"], latitude, longitude)
+    return {**result, "destination": destination} if destination else result
 
 @visionary_router.post("/process_audio_and_image")
-async def process_audio_and_image(audio: UploadFile = File(...), image: UploadFile = File(...)):
+async def process_audio_and_image(
+    audio: UploadFile = File(...),
+    image: UploadFile = File(...),
+    latitude: float | None = Form(None),
+    longitude: float | None = Form(None),
+):
     try:
         # Process audio and image
-        audio_content = await audio.read()
-        image_content = await image.read()
-        audio_base64 = base64.b64encode(audio_content).decode('utf-8')
-        image_base64 = base64.b64encode(image_content).decode('utf-8')
-
-        # Send both audio and image to Gemini
-        response = model.generate_content([
-            DEFAULT_PROMPT,
+        with span("upload_read") as read:
+            audio_content = await audio.read()
+            image_content = await image.read()
+            read.set(bytes_in=len(audio_content) + len(image_content))
+
+        upload_hash = attachment_hash(audio.content_type, audio_content, image.content_type, image_content)
+        cached = await response_cache.aget("visionary", PROMPT_VERSION, "", upload_hash)
+        if cached:
+            return JSONResponse(content=await _with_destination(cached, latitude, longitude))
+
+        audio_hash = attachment_hash(PROMPT_VERSION, audio.content_type, audio_content)
+        # Trim and downsample the recording and downscale the camera frame before they are uploaded
+        (audio_content, audio_type, speech_ms), (image_content, image_type, frame_hash) = await asyncio.gather(
+            run_blocking("audio", prepare_audio, audio_content, audio.content_type),
+            run_blocking("images", prepare_image, image_content, image.content_type),
+        )
+        if speech_ms == 0:
+            # Nothing was said; answer without calling the model
+            return JSONResponse(content={
+                "error": "no_speech",
+                "response": NO_SPEECH_MESSAGE,
+                "audio": await run_blocking("tts", synthesize_speech, NO_SPEECH_MESSAGE, "english"),
+            }, status_code=422)
+        if frame_cache is not None:
+            cached = frame_cache.get(audio_hash, frame_hash)
+            if cached:
+                return JSONResponse(content=await _with_destination(cached, latitude, longitude))
+
+        with span("base64", bytes_in=len(audio_content) + len(image_content)) as encode:
+            audio_base64 = base64.b64encode(audio_content).decode('utf-8')
+            image_base64 = base64.b64encode(image_content).decode('utf-8')
+            encode.set(bytes_out=len(audio_base64) + len(image_base64))
+
+        # Send both audio and image to Gemini; in structured mode the reply is JSON with typed fields
+        prompt = [
+            DEFAULT_PROMPT + (STRUCTURED_PROMPT_SUFFIX if STRUCTURED_OUTPUT else ""),
             "Process this audio input and image:",
-            {"mime_type": audio.content_type, "data": audio_base64},
-            {"mime_type": image.content_type, "data": image_base64}
-        ])
-
-        text_response = response.text if response.text else "I'm sorry, I couldn't process the input."
-        print(f"Gemini response: {text_response}")
-
-        if not text_response or not isinstance(text_response, str):
-            raise ValueError("Invalid text response received from the Gemini API")
-
-        # Check if the response indicates navigation
-        is_navigation = text_response.lower().startswith("opening directions for")
-        location = None
-        if is_navigation:
-            # Use regular expressions for case-insensitive matching
-            match = re.match(r"opening directions for\s*(.+?)[\.\n]", text_response, re.IGNORECASE)
-            if match:
-                location = match.group(1).strip()
-            else:
-                # Fallback: Extract text after the phrase
-                index = text_response.lower().index("opening directions for") + len("opening directions for")
-                location_text = text_response[index:].strip()
-                # Split at the first period or newline
-                location = re.split(r'[\.\n]', location_text, 1)[0].strip()
-            print(f"Extracted location: {location}")
-
-        # Extract language from the response
-        text_response_clean = text_response.strip()
-
-        # Remove trailing periods or newlines
-        while text_response_clean and text_response_clean[-1] in '.\n':
-            text_response_clean = text_response_clean[:-1].strip()
-
-        # Assume the language is the last word after the last period
-        if '.' in text_response_clean:
-            content, lang = text_response_clean.rsplit('.', 1)
+            {"mime_type": audio_type, "data": audio_base64},
+            {"mime_type": image_type, "data": image_base64}
+        ]
+        if STRUCTURED_OUTPUT:
+            generation_config = {"response_mime_type": "application/json", "response_schema": response_schema(LANGUAGE_VOICES)}
+            response = await run_blocking("gemini", model.generate_content, prompt, generation_config=generation_config)
         else:
-            content = text_response_clean
-            lang = 'english'
-
-        lang = lang.strip().lower()
-
-        language_mappings = {
-            'english': 'english',
-            'spanish': 'spanish',
-            # Add other languages as needed
-        }
-
-        language = language_mappings.get(lang, 'english')
-
-        print(f"Extracted language: {language}")
-
-        # Synthesizing audio response based on content and language
-        audio_content = synthesize_speech(content.strip(), language)
+            response = await run_blocking("gemini", model.generate_content, prompt)
+
+        with span("parse_response"):
+            # JSON replies are read field by field; free text (or JSON that didn't come out right) is parsed as before
+            reply = parse_reply(response.text or "", LANGUAGE_VOICES)
+        answer = reply["answer"] or "I'm sorry, I couldn't process the input."
+        is_navigation = reply["intent"] == "navigate"
+        logger.debug(f"Reply: intent={reply['intent']} language={reply['language']} location={reply['location']}")
+
+        # Speech and, for directions, the destination lookup run side by side
+        audio_content, destination = await asyncio.gather(
+            run_blocking("tts", synthesize_speech, answer, reply["language"]),
+            _lookup_destination(reply["location"], latitude, longitude) if is_navigation else asyncio.sleep(0),
+        )
 
         if not audio_content:
             raise ValueError("Invalid audio content generated")
 
-        return JSONResponse(content={
-            "response": text_response,
+        result = {
+            "response": answer,
             "audio": audio_content,
+            "intent": reply["intent"],
+            "language": reply["language"],
             "is_navigation": is_navigation,
-            "location": location
-        })
+            "is_searching": reply["intent"] == "search",
+            "location": reply["location"],
+        }
+        await response_cache.aput("visionary", PROMPT_VERSION, "", result, upload_hash)
+        if frame_cache is not None:
+            frame_cache.put(audio_hash, frame_hash, result)
+        if destination:
+            result = {**result, "destination": destination}
+        return JSONResponse(content=result)
     except Exception as e:
-        print(f"Error generating audio: {str(e)}")
+        logger.exception(f"Error generating audio: {str(e)}")
         error_message = "Sorry, there was an error processing your request."
         return JSONResponse(content={"error": error_message}, status_code=500)
 
+def _gemini_text_chunks(prompt):
+    for chunk in model.generate_content(prompt, stream=True):
+        yield chunk.text
+
+class _Sender:
+    """Serializes sends on a socket, so an audio message is always directly followed by its MP3."""
+
+    def __init__(self, websocket):
+        self.websocket = websocket
+        self._lock = asyncio.Lock()
+
+    async def json(self, message):
+        async with self._lock:
+            await self.websocket.send_json(message)
+
+    async def audio(self, message, audio_bytes):
+        async with self._lock:
+            await self.websocket.send_json(message)
+            await self.websocket.send_bytes(audio_bytes)
+
+async def _send_audio_in_order(sender, pending):
+    # TTS for later sentences runs concurrently, but audio is sent in sentence order
+    while (item := await pending.get()) is not None:
+        index, sentence, task = item
+        audio_bytes = await task
+        if not audio_bytes:
+            continue
+        await sender.audio({"type": "audio", "index": index, "text": sentence, "mime_type": "audio/mpeg"}, audio_bytes)
+
+async def _answer_no_speech(sender):
+    audio_bytes = await run_blocking("tts", synthesize_speech_bytes, NO_SPEECH_MESSAGE, "english")
+    if audio_bytes:
+        await sender.audio({"type": "audio", "index": 0, "text": NO_SPEECH_MESSAGE, "mime_type": "audio/mpeg"}, audio_bytes)
+    await sender.json({"type": "done", "response": NO_SPEECH_MESSAGE, "no_speech": True})
+
+def _media_prompt(text, *media):
+    with span("base64", bytes_in=sum(len(data) for data, _ in media)) as encode:
+        parts = [text, "Process this audio input and image:" if len(media) > 1 else "Process this audio input:"]
+        parts += [{"mime_type": mime_type, "data": base64.b64encode(data).decode('utf-8')} for data, mime_type in media]
+        encode.set(bytes_out=sum(len(part["data"]) for part in parts[2:]))
+    return parts
+
+class _Escape(Exception):
+    pass
+
+async def _speak_stream(sender, prompt, escape=None):
+    """
+    Stream Gemini's answer to prompt and speak it sentence by sentence. Returns the final
+    "done" message, or None without having spoken anything if the answer starts with escape.
+    """
+    language = None
+    spoken = []
+    is_navigation, location = False, None
+    pending = asyncio.Queue()
+    audio_sender = asyncio.create_task(_send_audio_in_order(sender, pending))
+
+    async def handle(sentence):
+        nonlocal language, is_navigation, location
+        if language is None:
+            language = split_language_header(sentence, LANGUAGE_VOICES)
+            if language:
+                return
+            language = "english"
+        if not spoken:
+            if escape and sentence.strip(" .*").upper() == escape:
+                raise _Escape()
+            is_navigation, location = parse_navigation(sentence + "\n")
+            if is_navigation:
+                # Let the client start routing while the confirmation is still being spoken
+                await sender.json({"type": "navigation", "location": location})
+        spoken.append(sentence)
+        task = asyncio.create_task(run_blocking("tts", synthesize_speech_bytes, sentence, language))
+        await pending.put((len(spoken) - 1, sentence, task))
+
+    try:
+        sentences = SentenceBuffer()
+        # Closed on every exit, so escaping early stops the Gemini stream and frees its backend slot
+        async with aclosing(stream_blocking("gemini", _gemini_text_chunks, prompt)) as chunks:
+            async for chunk in chunks:
+                for sentence in sentences.feed(chunk):
+                    await handle(sentence)
+        for sentence in sentences.flush():
+            await handle(sentence)
+    except _Escape:
+        return None
+    finally:
+        await pending.put(None)
+        await audio_sender
+
+    logger.debug(f"Streamed Gemini response: {' '.join(spoken)}")
+    return {
+        "type": "done",
+        "response": " ".join(spoken),
+        "language": language,
+        "is_navigation": is_navigation,
+        "location": location,
+        "timings": current_timings(),
+    }
+
+async def _stream_reply(sender, header, audio_content, image_content):
+    (audio_content, audio_type, speech_ms), (image_content, image_type, _) = await asyncio.gather(
+        run_blocking("audio", prepare_audio, audio_content, header.get("audio_type", "audio/webm")),
+        run_blocking("images", prepare_image, image_content, header.get("image_type", "image/jpeg")),
+    )
+    if speech_ms == 0:
+        await _answer_no_speech(sender)
+        return
+
+    prompt = _media_prompt(DEFAULT_PROMPT + STREAMING_PROMPT_SUFFIX, (audio_content, audio_type), (image_content, image_type))
+    await sender.json(await _speak_stream(sender, prompt))
+
+MALFORMED_MESSAGE = {"type": "error", "error": "Messages must be JSON objects or binary frames."}
+MISSING_MEDIA = {"type": "error", "error": "Expected a binary message with the recording or image."}
+
+def _text_header(message):
+    # The JSON object in a text message, or None for anything else
+    try:
+        header = json.loads(message.get("text") or "")
+    except json.JSONDecodeError:
+        return None
+    return header if isinstance(header, dict) else None
+
+async def _receive_message(websocket):
+    message = await websocket.receive()
+    if message["type"] == "websocket.disconnect":
+        raise WebSocketDisconnect(message.get("code", 1000))
+    return message
+
+async def _receive_media(websocket):
+    """The next message's bytes, or None when the client sent text instead."""
+    return (await _receive_message(websocket)).get("bytes")
+
+# Streaming variant of /process_audio_and_image: per request the client sends a JSON header
+# ({"audio_type", "image_type"}) followed by the audio and the image as two binary messages.
+# Replies are JSON control messages plus one binary MP3 message per spoken sentence.
+@visionary_router.websocket("/ws/voice")
+async def voice_stream(websocket: WebSocket):
+    await websocket.accept()
+    sender = _Sender(websocket)
+    try:
+        while True:
+            header = _text_header(await _receive_message(websocket))
+            if header is None:
+                await sender.json(MALFORMED_MESSAGE)
+                continue
+            with span("voice_query"), request_trace():
+                with span("upload_read") as read:
+                    audio_content = await _receive_media(websocket)
+                    image_content = await _receive_media(websocket) if audio_content is not None else None
+                    if image_content is None:
+                        await sender.json(MISSING_MEDIA)
+                        continue
+                    read.set(bytes_in=len(audio_content) + len(image_content))
+                try:
+                    await _stream_reply(sender, header, audio_content, image_content)
+                except WebSocketDisconnect:
+                    raise
+                except Exception as e:
+                    logger.exception(f"Error streaming response: {str(e)}")
+                    await sender.json({"type": "error", "error": "Sorry, there was an error processing your request."})
+    except WebSocketDisconnect:
+        pass
+
+async def _send_scene(sender, scene, language, speak):
+    message = {"type": "scene", "version": scene.version, "description": scene.description, "age": scene.age()}
+    text = scene.description or NO_SCENE_MESSAGE
+    audio_bytes = await run_blocking("tts", synthesize_speech_bytes, text, language) if speak else None
+    if audio_bytes:
+        await sender.audio({**message, "text": text, "mime_type": "audio/mpeg"}, audio_bytes)
+    else:
+        await sender.json(message)
+
+async def _describe_scene(sender, scene, options):
+    data, mime_type, frame_hash = scene.begin()
+    try:
+        with span("scene_describe"):
+            prompt = [scene.prompt(options["language"]), {"mime_type": mime_type, "data": base64.b64encode(data).decode('utf-8')}]
+            response = await run_blocking("gemini", model.generate_content, prompt)
+            changed = scene.update(response.text or "", frame_hash)
+    except Exception as e:
+        logger.exception(f"Error describing scene: {str(e)}")
+        return
+    if changed:
+        logger.debug(f"Scene {scene.version}: {scene.description}")
+        await _send_scene(sender, scene, options["language"], options["announce"])
+
+async def _answer_scene_question(sender, scene, header, audio_content):
+    with span("scene_query"), request_trace():
+        try:
+            audio_content, audio_type, speech_ms = await run_blocking(
+                "audio", prepare_audio, audio_content, header.get("audio_type", "audio/webm")
+            )
+            if speech_ms == 0:
+                await _answer_no_speech(sender)
+                return
+            done = None
+            if scene.description is not None:
+                # Answer from the text description; only fall back to the frame when the model asks for it
+                prompt = _media_prompt(
+                    DEFAULT_PROMPT + STREAMING_PROMPT_SUFFIX + scene.question_suffix(), (audio_content, audio_type)
+                )
+                done = await _speak_stream(sender, prompt, escape=LOOK)
+                metrics.inc("scene_questions_total", {"answered_from": "description" if done else "look"})
+            if done is None:
+                media = [(audio_content, audio_type)] + ([scene.frame[:2]] if scene.frame else [])
+                done = await _speak_stream(sender, _media_prompt(DEFAULT_PROMPT + STREAMING_PROMPT_SUFFIX, *media))
+                metrics.inc("scene_questions_total", {"answered_from": "frame"})
+            await sender.json({**done, "scene_version": scene.version})
+        except WebSocketDisconnect:
+            raise
+        except Exception as e:
+            logger.exception(f"Error answering scene question: {str(e)}")
+            await sender.json({"type": "error", "error": "Sorry, there was an error processing your request."})
+
+# Scene mode: while it is on, the page keeps this socket open and sends a camera frame
+# (binary) every frame_interval_ms. Frames are compared locally by perceptual hash and only
+# described by Gemini when the scene has changed; each new description is pushed as a
+# {"type": "scene"} message, followed by its MP3 when the client's {"type": "start",
+# "announce": true, "language": ...} message asked for spoken updates. A question is a JSON
+# {"type": "question", "audio_type"} header followed by the recording, and is answered
+# from the current description like /ws/voice answers. {"type": "describe"} speaks the
+# current description again without calling Gemini.
+@visionary_router.websocket("/ws/scene")
+async def scene_stream(websocket: WebSocket):
+    await websocket.accept()
+    sender = _Sender(websocket)
+    scene = SceneState()
+    options = {"announce": False, "language": "english"}
+    describing = None
+    tasks = set()
+    question_lock = asyncio.Lock()
+
+    def spawn(coroutine):
+        task = asyncio.create_task(coroutine)
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+        return task
+
+    async def answer(header, audio_content):
+        # Questions are answered one at a time, in order, while frames keep arriving
+        async with question_lock:
+            await _answer_scene_question(sender, scene, header, audio_content)
+
+    await sender.json({"type": "ready", "frame_interval_ms": SCENE_FRAME_INTERVAL_MS})
+    try:
+        while True:
+            message = await _receive_message(websocket)
+            if message.get("bytes") is not None:
+                with span("scene_frame", bytes_in=len(message["bytes"])):
+                    data, mime_type, frame_hash = await run_blocking("images", prepare_image, message["bytes"], "image/jpeg")
+                    outcome = scene.observe(data, mime_type, frame_hash)
+                if outcome == "changed" and describing is not None and not describing.done():
+                    outcome = "throttled"
+                metrics.inc("scene_frames_total", {"outcome": outcome})
+                if outcome == "changed":
+                    describing = spawn(_describe_scene(sender, scene, options))
+                continue
+
+            header = _text_header(message)
+            if header is None:
+                await sender.json(MALFORMED_MESSAGE)
+                continue
+            if header.get("type") == "start":
+                options["announce"] = bool(header.get("announce", False))
+                language = str(header.get("language", "english")).lower()
+                options["language"] = language if language in LANGUAGE_VOICES else "english"
+            elif header.get("type") == "question":
+                audio_content = await _receive_media(websocket)
+                if audio_content is None:
+                    await sender.json(MISSING_MEDIA)
+                    continue
+                spawn(answer(header, audio_content))
+            elif header.get("type") == "describe":
+                spawn(_send_scene(sender, scene, options["language"], True))
+    except WebSocketDisconnect:
+        pass
+    finally:
+        for task in tasks:
+            task.cancel()
+
 @visionary_router.post("/synthesize_speech")
 async def synthesize_speech_endpoint(request: Request):
     data = await request.json()
     text = data.get('text', '')
     language = data.get('language', 'english')
-    audio_content = synthesize_speech(text, language)
+    try:
+        audio_content = await run_blocking("tts", synthesize_speech, text, language)
+    except BackendTimeoutError as e:
+        logger.warning(f"Error during speech synthesis: {str(e)}")
+        return JSONResponse(content={"error": "Speech synthesis timed out"}, status_code=504)
     if audio_content:
         return JSONResponse(content={"audio": audio_content})
     else:
@@ -201,84 +545,70 @@ async def get_nearest_place(request_data: NearestPlaceRequest):
         return JSONResponse(content={"error": "Server configuration error: Google Places API key not set"}, status_code=500)
 
     try:
-        # Use Google Places API Nearby Search
-        places_url = (
-            f"https://maps.googleapis.com/maps/api/place/nearbysearch/json"
-            f"?location={latitude},{longitude}"
-            f"&rankby=distance"
-            f"&keyword={requests.utils.quote(keyword)}"
-            f"&key={google_places_api_key}"
-        )
-
-        response = requests.get(places_url)
-        data = response.json()
-
-        if data.get('results'):
-            place = data['results'][0]
-            dest_latitude = place['geometry']['location']['lat']
-            dest_longitude = place['geometry']['location']['lng']
-            return {"latitude": dest_latitude, "longitude": dest_longitude}
-        else:
-            # If no nearby places found, use Geocoding API
-            geocode_url = (
-                f"https://maps.googleapis.com/maps/api/geocode/json"
-                f"?address={requests.utils.quote(keyword)}"
-                f"&key={google_places_api_key}"
-            )
-            geocode_response = requests.get(geocode_url)
-            geocode_data = geocode_response.json()
-
-            if geocode_data.get('results'):
-                location = geocode_data['results'][0]['geometry']['location']
-                dest_latitude = location['lat']
-                dest_longitude = location['lng']
-                return {"latitude": dest_latitude, "longitude": dest_longitude}
-            else:
-                return JSONResponse(content={"error": "Location not found"}, status_code=404)
+        place = await find_nearest_place(keyword, latitude, longitude, google_places_api_key)
     except Exception as e:
-        print(f"Error fetching location: {e}")
+        logger.warning(f"Error fetching location: {e}")
         return JSONResponse(content={"error": "Error fetching location"}, status_code=500)
+    if place is None:
+        return JSONResponse(content={"error": "Location not found"}, status_code=404)
+    return place
+
+# Map of language codes to appropriate Wavenet voices
+LANGUAGE_VOICES = {
+    'english': ('en-US', ['en-US-Wavenet-D', 'en-US-Wavenet-A', 'en-US-Wavenet-B', 'en-US-Wavenet-C']),
+    'hindi': ('hi-IN', ['hi-IN-Wavenet-D', 'hi-IN-Wavenet-A', 'hi-IN-Wavenet-B', 'hi-IN-Wavenet-C']),
+    'spanish': ('es-ES', ['es-ES-Wavenet-B', 'es-ES-Wavenet-A', 'es-ES-Wavenet-C', 'es-ES-Wavenet-D']),
+    'french': ('fr-FR', ['fr-FR-Wavenet-C', 'fr-FR-Wavenet-A', 'fr-FR-Wavenet-B', 'fr-FR-Wavenet-D']),
+    'german': ('de-DE', ['de-DE-Wavenet-F', 'de-DE-Wavenet-A', 'de-DE-Wavenet-B', 'de-DE-Wavenet-C']),
+    'kannada': ('kn-IN', ['kn-IN-Wavenet-A']),
+    'telugu': ('te-IN', ['te-IN-Wavenet-B', 'te-IN-Wavenet-A']),
+    'tamil': ('ta-IN', ['ta-IN-Wavenet-D', 'ta-IN-Wavenet-A', 'ta-IN-Wavenet-B', 'ta-IN-Wavenet-C']),
+    'malayalam': ('ml-IN', ['ml-IN-Wavenet-D', 'ml-IN-Wavenet-A', 'ml-IN-Wavenet-B', 'ml-IN-Wavenet-C']),
+    'bengali': ('bn-IN', ['bn-IN-Wavenet-A']),
+    'gujarati': ('gu-IN', ['gu-IN-Wavenet-A']),
+    'marathi': ('mr-IN', ['mr-IN-Wavenet-A']),
+    'japanese': ('ja-JP', ['ja-JP-Wavenet-D', 'ja-JP-Wavenet-A', 'ja-JP-Wavenet-B', 'ja-JP-Wavenet-C']),
+    'korean': ('ko-KR', ['ko-KR-Wavenet-D', 'ko-KR-Wavenet-A', 'ko-KR-Wavenet-B', 'ko-KR-Wavenet-C']),
+    'chinese': ('cmn-CN', ['cmn-CN-Wavenet-D', 'cmn-CN-Wavenet-A', 'cmn-CN-Wavenet-B', 'cmn-CN-Wavenet-C']),
+    'arabic': ('ar-XA', ['ar-XA-Wavenet-B', 'ar-XA-Wavenet-A', 'ar-XA-Wavenet-C', 'ar-XA-Wavenet-D']),
+    'russian': ('ru-RU', ['ru-RU-Wavenet-D', 'ru-RU-Wavenet-A', 'ru-RU-Wavenet-B', 'ru-RU-Wavenet-C']),
+    'portuguese': ('pt-BR', ['pt-BR-Wavenet-B', 'pt-BR-Wavenet-A', 'pt-BR-Wavenet-C', 'pt-BR-Wavenet-D']),
+    'italian': ('it-IT', ['it-IT-Wavenet-D', 'it-IT-Wavenet-A', 'it-IT-Wavenet-B', 'it-IT-Wavenet-C']),
+    'dutch': ('nl-NL', ['nl-NL-Wavenet-E', 'nl-NL-Wavenet-A', 'nl-NL-Wavenet-B', 'nl-NL-Wavenet-C']),
+    'polish': ('pl-PL', ['pl-PL-Wavenet-E', 'pl-PL-Wavenet-A', 'pl-PL-Wavenet-B', 'pl-PL-Wavenet-C']),
+    'swedish': ('sv-SE', ['sv-SE-Wavenet-A', 'sv-SE-Wavenet-B', 'sv-SE-Wavenet-C']),
+    'turkish': ('tr-TR', ['tr-TR-Wavenet-E', 'tr-TR-Wavenet-A', 'tr-TR-Wavenet-B', 'tr-TR-Wavenet-C']),
+    'vietnamese': ('vi-VN', ['vi-VN-Wavenet-D', 'vi-VN-Wavenet-A', 'vi-VN-Wavenet-B', 'vi-VN-Wavenet-C']),
+    'indonesian': ('id-ID', ['id-ID-Wavenet-D', 'id-ID-Wavenet-A', 'id-ID-Wavenet-B', 'id-ID-Wavenet-C']),
+    'thai': ('th-TH', ['th-TH-Wavenet-C', 'th-TH-Wavenet-A', 'th-TH-Wavenet-B']),
+    'punjabi': ('pa-IN', ['pa-IN-Wavenet-A', 'pa-IN-Wavenet-B', 'pa-IN-Wavenet-C', 'pa-IN-Wavenet-D']),
+}
+
+# Synthesized clips are reused across requests; most spoken phrases repeat
+tts_cache = AudioCache(
+    "tts",
+    max_bytes=int(float(os.getenv("VISIONARY_TTS_CACHE_MB", "64")) * 1024 * 1024),
+    cache_dir=os.getenv("VISIONARY_TTS_CACHE_DIR", "storage/tts"),
+    max_disk_bytes=int(float(os.getenv("VISIONARY_TTS_CACHE_DISK_MB", "512")) * 1024 * 1024) or None,
+)
 
-def synthesize_speech(text, language="english"):
+def synthesize_speech_bytes(text, language="english"):
     if not isinstance(text, str) or not text.strip():
-        print("Error: The text input for speech synthesis is invalid or empty.")
+        logger.warning("The text input for speech synthesis is invalid or empty.")
         return None
 
-    input_text = texttospeech.SynthesisInput(text=text)
-
-    # Map of language codes to appropriate Wavenet voices
-    language_voices = {
-        'english': ('en-US', ['en-US-Wavenet-D', 'en-US-Wavenet-A', 'en-US-Wavenet-B', 'en-US-Wavenet-C']),
-        'hindi': ('hi-IN', ['hi-IN-Wavenet-D', 'hi-IN-Wavenet-A', 'hi-IN-Wavenet-B', 'hi-IN-Wavenet-C']),
-        'spanish': ('es-ES', ['es-ES-Wavenet-B', 'es-ES-Wavenet-A', 'es-ES-Wavenet-C', 'es-ES-Wavenet-D']),
-        'french': ('fr-FR', ['fr-FR-Wavenet-C', 'fr-FR-Wavenet-A', 'fr-FR-Wavenet-B', 'fr-FR-Wavenet-D']),
-        'german': ('de-DE', ['de-DE-Wavenet-F', 'de-DE-Wavenet-A', 'de-DE-Wavenet-B', 'de-DE-Wavenet-C']),
-        'kannada': ('kn-IN', ['kn-IN-Wavenet-A']),
-        'telugu': ('te-IN', ['te-IN-Wavenet-B', 'te-IN-Wavenet-A']),
-        'tamil': ('ta-IN', ['ta-IN-Wavenet-D', 'ta-IN-Wavenet-A', 'ta-IN-Wavenet-B', 'ta-IN-Wavenet-C']),
-        'malayalam': ('ml-IN', ['ml-IN-Wavenet-D', 'ml-IN-Wavenet-A', 'ml-IN-Wavenet-B', 'ml-IN-Wavenet-C']),
-        'bengali': ('bn-IN', ['bn-IN-Wavenet-A']),
-        'gujarati': ('gu-IN', ['gu-IN-Wavenet-A']),
-        'marathi': ('mr-IN', ['mr-IN-Wavenet-A']),
-        'japanese': ('ja-JP', ['ja-JP-Wavenet-D', 'ja-JP-Wavenet-A', 'ja-JP-Wavenet-B', 'ja-JP-Wavenet-C']),
-        'korean': ('ko-KR', ['ko-KR-Wavenet-D', 'ko-KR-Wavenet-A', 'ko-KR-Wavenet-B', 'ko-KR-Wavenet-C']),
-        'chinese': ('cmn-CN', ['cmn-CN-Wavenet-D', 'cmn-CN-Wavenet-A', 'cmn-CN-Wavenet-B', 'cmn-CN-Wavenet-C']),
-        'arabic': ('ar-XA', ['ar-XA-Wavenet-B', 'ar-XA-Wavenet-A', 'ar-XA-Wavenet-C', 'ar-XA-Wavenet-D']),
-        'russian': ('ru-RU', ['ru-RU-Wavenet-D', 'ru-RU-Wavenet-A', 'ru-RU-Wavenet-B', 'ru-RU-Wavenet-C']),
-        'portuguese': ('pt-BR', ['pt-BR-Wavenet-B', 'pt-BR-Wavenet-A', 'pt-BR-Wavenet-C', 'pt-BR-Wavenet-D']),
-        'italian': ('it-IT', ['it-IT-Wavenet-D', 'it-IT-Wavenet-A', 'it-IT-Wavenet-B', 'it-IT-Wavenet-C']),
-        'dutch': ('nl-NL', ['nl-NL-Wavenet-E', 'nl-NL-Wavenet-A', 'nl-NL-Wavenet-B', 'nl-NL-Wavenet-C']),
-        'polish': ('pl-PL', ['pl-PL-Wavenet-E', 'pl-PL-Wavenet-A', 'pl-PL-Wavenet-B', 'pl-PL-Wavenet-C']),
-        'swedish': ('sv-SE', ['sv-SE-Wavenet-A', 'sv-SE-Wavenet-B', 'sv-SE-Wavenet-C']),
-        'turkish': ('tr-TR', ['tr-TR-Wavenet-E', 'tr-TR-Wavenet-A', 'tr-TR-Wavenet-B', 'tr-TR-Wavenet-C']),
-        'vietnamese': ('vi-VN', ['vi-VN-Wavenet-D', 'vi-VN-Wavenet-A', 'vi-VN-Wavenet-B', 'vi-VN-Wavenet-C']),
-        'indonesian': ('id-ID', ['id-ID-Wavenet-D', 'id-ID-Wavenet-A', 'id-ID-Wavenet-B', 'id-ID-Wavenet-C']),
-        'thai': ('th-TH', ['th-TH-Wavenet-C', 'th-TH-Wavenet-A', 'th-TH-Wavenet-B']),
-        'punjabi': ('pa-IN', ['pa-IN-Wavenet-A', 'pa-IN-Wavenet-B', 'pa-IN-Wavenet-C', 'pa-IN-Wavenet-D']),
-    }
-    language_code, voice_names = language_voices.get(language.lower(), ('en-US', ['en-US-Wavenet-D']))
+    language_code, voice_names = LANGUAGE_VOICES.get(language.lower(), ('en-US', ['en-US-Wavenet-D']))
     voice_name = voice_names[0]  # Pick the first voice from the list
 
+    cache_key = AudioCache.key(text, language_code, voice_name, "MP3")
+    cached = tts_cache.get(cache_key)
+    if cached:
+        return cached
+
+    from google.cloud import texttospeech_v1 as texttospeech
+
+    input_text = texttospeech.SynthesisInput(text=text)
+
     voice = texttospeech.VoiceSelectionParams(
         language_code=language_code,
         name=voice_name
@@ -289,23 +619,59 @@ def synthesize_speech(text, language="english"):
     )
 
     try:
-        response = tts_client.synthesize_speech(
+        response = get_tts_client().synthesize_speech(
             input=input_text, voice=voice, audio_config=audio_config
         )
-        audio_base64 = base64.b64encode(response.audio_content).decode('utf-8')
-        return f"data:audio/mp3;base64,{audio_base64}"
+        if response.audio_content:
+            tts_cache.put(cache_key, response.audio_content)
+        return response.audio_content
     except Exception as e:
-        print(f"Error during speech synthesis: {str(e)}")
+        logger.exception(f"Error during speech synthesis: {str(e)}")
         return None
 
-# Print registered routes
-print("Registered Routes:")
-for route in app.router.routes:
-    print(f"{route.path} -> {route.name}")
-
-# Add the router for Visionary
-app.include_router(visionary_router, prefix="/visionary")
-
-# Start the FastAPI application
+def synthesize_speech(text, language="english"):
+    audio_bytes = synthesize_speech_bytes(text, language)
+    if not audio_bytes:
+        return None
+    with span("encode", bytes_in=len(audio_bytes)) as encode:
+        audio_base64 = base64.b64encode(audio_bytes).decode('utf-8')
+        encode.set(bytes_out=len(audio_base64))
+    return f"data:audio/mp3;base64,{audio_base64}"
+
+async def warm_tts_cache(phrases_file=None):
+    # One backend call per phrase, so the whole list never has to fit in one call's timeout,
+    # and one at a time, so live requests keep most of the TTS slots
+    phrases = load_warmup_phrases(phrases_file)
+    warmed = 0
+    for text, language in phrases:
+        try:
+            warmed += bool(await run_blocking("tts", synthesize_speech_bytes, text, language))
+        except BackendTimeoutError as e:
+            logger.warning(f"Error warming TTS cache: {str(e)}")
+    logger.info(f"TTS cache warmed with {warmed} of {len(phrases)} phrases")
+
+# Run Visionary on its own; main.py serves it together with Multimodal Mate
 if __name__ == "__main__":
-    uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
+    import uvicorn
+    from fastapi.middleware.cors import CORSMiddleware
+
+    app = FastAPI()
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=["*"],  # Adjust according to your security needs
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
+    app.mount("/static", StaticAssets("static", "static", "/static"), name="static")
+    app.mount("/visionary/static", StaticAssets("visionary/static", "visionary_static", "/visionary/static"), name="visionary_static")
+    visionary_templates.env.loader.searchpath.append("templates")
+    visionary_templates.env.globals["static_url"] = static_url
+    app.include_router(visionary_router, prefix="/visionary")
+
+    logging.basicConfig(level=logging.INFO)
+    logger.info("Registered routes:")
+    for route in app.router.routes:
+        logger.info(f"{route.path} -> {route.name}")
+
+    uvicorn.run(app, host="0.0.0.0", port=8000)